@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+#
+# Benchmarks generating the lines of a whitespace-only diff in
+# DiffChunkGenerator, at various file sizes. The time per line should stay
+# constant as the number of changed lines grows. For comparison, this also
+# times the whitespace lookups done by scanning the whitespace_lines list,
+# which grows linearly with the size of the chunk.
+#
+# Usage: benchmark-diff-lines.py [max_lines]
+
+from __future__ import print_function, unicode_literals
+
+import os
+import sys
+import time
+
+scripts_dir = os.path.abspath(os.path.dirname(__file__))
+rb_dir = os.path.abspath(os.path.join(scripts_dir, '..', '..'))
+
+sys.path.insert(0, rb_dir)
+sys.path.insert(0, os.path.join(scripts_dir, 'conf'))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'reviewboard.settings')
+
+from reviewboard.diffviewer.chunk_generator import DiffChunkGenerator
+from reviewboard.diffviewer.differ import DiffCompatVersion, get_differ
+from reviewboard.diffviewer.models import DiffSet, FileDiff
+from reviewboard.diffviewer.opcode_generator import get_diff_opcode_generator
+
+
+def generate_lines(num_lines):
+    # Every line is reindented, giving one large whitespace-only chunk.
+    a = ['value_%d = compute(%d)' % (i, i) for i in range(num_lines)]
+    b = ['    ' + line for line in a]
+
+    return a, b
+
+
+def time_lines(num_lines):
+    a, b = generate_lines(num_lines)
+    differ = get_differ(a, b, ignore_space=False,
+                        compat_version=DiffCompatVersion.DEFAULT)
+    groups = list(get_diff_opcode_generator(differ))
+
+    diffset = DiffSet(diffcompat=DiffCompatVersion.DEFAULT)
+    filediff = FileDiff(diffset=diffset, source_file='file.py')
+    generator = DiffChunkGenerator(None, filediff)
+
+    start = time.time()
+
+    for tag, i1, i2, j1, j2, meta in groups:
+        generator._set_cur_meta(meta)
+        list(map(generator._diff_line,
+                 range(i1 + 1, i2 + 1),
+                 range(i1 + 1, i2 + 1), range(j1 + 1, j2 + 1),
+                 a[i1:i2], b[j1:j2], a[i1:i2], b[j1:j2]))
+        generator._set_cur_meta(None)
+
+    lines_time = time.time() - start
+
+    start = time.time()
+
+    for tag, i1, i2, j1, j2, meta in groups:
+        whitespace_lines = meta['whitespace_lines']
+
+        for line_nums in zip(range(i1 + 1, i2 + 1), range(j1 + 1, j2 + 1)):
+            line_nums in whitespace_lines
+
+    scan_time = time.time() - start
+
+    return lines_time, scan_time
+
+
+def main():
+    if len(sys.argv) > 1:
+        max_lines = int(sys.argv[1])
+    else:
+        max_lines = 8000
+
+    print('%-8s %12s %14s %14s' % ('Lines', 'Generate', 'Per line',
+                                   'List scan'))
+
+    num_lines = 1000
+
+    while num_lines <= max_lines:
+        lines_time, scan_time = time_lines(num_lines)
+
+        print('%-8d %11.3fs %12.2fus %13.3fs' %
+              (num_lines, lines_time, lines_time * 1000000 / num_lines,
+               scan_time))
+
+        num_lines *= 2
+
+
+if __name__ == '__main__':
+    main()
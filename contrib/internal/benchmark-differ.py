@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+#
+# Benchmarks ArrayMyersDiffer against MyersDiffer on generated files of
+# various sizes and amounts of change, checking that both produce the same
+# opcodes.
+#
+# Usage: benchmark-differ.py [num_lines]
+
+from __future__ import print_function, unicode_literals
+
+import os
+import random
+import sys
+import time
+
+scripts_dir = os.path.abspath(os.path.dirname(__file__))
+rb_dir = os.path.abspath(os.path.join(scripts_dir, '..', '..'))
+
+sys.path.insert(0, rb_dir)
+sys.path.insert(0, os.path.join(scripts_dir, 'conf'))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'reviewboard.settings')
+
+from reviewboard.diffviewer.differ import DiffCompatVersion
+from reviewboard.diffviewer.myersdiff import ArrayMyersDiffer, MyersDiffer
+
+
+# Each case is a description, the fraction of lines changed, and the
+# number of lines per unique line of code.
+CASES = [
+    ('few changes, mostly unique lines', 0.05, 4),
+    ('some changes, repetitive lines', 0.3, 400),
+    ('many changes, repetitive lines', 0.5, 2000),
+    ('some changes, unique lines', 0.2, 1),
+]
+
+
+def generate_files(num_lines, change_rate, lines_per_code):
+    rand = random.Random(num_lines)
+    num_codes = max(1, num_lines // lines_per_code)
+    a = [
+        'value_%d = compute(%d)' % (rand.randint(0, num_codes), i % 97)
+        for i in range(num_lines)
+    ]
+    b = []
+
+    for line in a:
+        r = rand.random()
+
+        if r < change_rate / 3:
+            continue
+        elif r < change_rate * 2 / 3:
+            b.append(line + ' # changed')
+        elif r < change_rate:
+            b.append(line)
+            b.append('inserted = %d' % rand.randint(0, 1000))
+        else:
+            b.append(line)
+
+    return a, b
+
+
+def time_differ(cls, a, b):
+    best = None
+    opcodes = None
+
+    for i in range(3):
+        start = time.time()
+        opcodes = list(cls(a, b,
+                           compat_version=DiffCompatVersion.DEFAULT)
+                       .get_opcodes())
+        elapsed = time.time() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best, opcodes
+
+
+def main():
+    if len(sys.argv) > 1:
+        num_lines = int(sys.argv[1])
+    else:
+        num_lines = 20000
+
+    print('Diffing files of %d lines (best of 3)' % num_lines)
+    print()
+    print('%-35s %10s %10s %8s' % ('Case', 'Myers', 'Array', 'Speedup'))
+
+    for name, change_rate, lines_per_code in CASES:
+        a, b = generate_files(num_lines, change_rate, lines_per_code)
+        myers_time, myers_opcodes = time_differ(MyersDiffer, a, b)
+        array_time, array_opcodes = time_differ(ArrayMyersDiffer, a, b)
+
+        if myers_opcodes != array_opcodes:
+            sys.stderr.write('Opcodes differ for case: %s\n' % name)
+            sys.exit(1)
+
+        print('%-35s %9.3fs %9.3fs %7.2fx' %
+              (name, myers_time, array_time, myers_time / array_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+#
+# Benchmarks the in-process patcher against the patch command, using the
+# unified diffs in the diffviewer test data.
+#
+# Usage: benchmark-patch.py [iterations]
+
+from __future__ import print_function, unicode_literals
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+scripts_dir = os.path.abspath(os.path.dirname(__file__))
+rb_dir = os.path.abspath(os.path.join(scripts_dir, '..', '..'))
+
+sys.path.insert(0, rb_dir)
+sys.path.insert(0, os.path.join(scripts_dir, 'conf'))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'reviewboard.settings')
+
+from reviewboard.diffviewer.diffutils import convert_line_endings
+from reviewboard.diffviewer.patcher import apply_patch
+
+
+testdata_dir = os.path.join(rb_dir, 'reviewboard', 'diffviewer', 'testdata')
+
+
+def read_file(*relative):
+    with open(os.path.join(testdata_dir, *relative), 'rb') as f:
+        return f.read()
+
+
+def load_patches():
+    patches = []
+    unified_dir = os.path.join(testdata_dir, 'diffs', 'unified')
+
+    for diff_filename in sorted(os.listdir(unified_dir)):
+        filename = diff_filename[:-len('.diff')]
+
+        # The patcher expects Unix line endings, as provided by
+        # diffutils.patch.
+        diff = read_file('diffs', 'unified', diff_filename)
+        data = read_file('orig_src', filename)
+        patches.append((filename,
+                        convert_line_endings(diff),
+                        convert_line_endings(data)))
+
+    return patches
+
+
+def run_patch_command(diff, data):
+    tempdir = tempfile.mkdtemp(prefix='reviewboard.')
+
+    try:
+        oldfile = os.path.join(tempdir, 'orig')
+        newfile = os.path.join(tempdir, 'new')
+
+        with open(oldfile, 'wb') as f:
+            f.write(data)
+
+        p = subprocess.Popen(['patch', '-o', newfile, oldfile],
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                             stderr=subprocess.STDOUT, cwd=tempdir)
+        p.communicate(diff)
+
+        with open(newfile, 'rb') as f:
+            return f.read()
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def benchmark(name, func, patches, iterations):
+    start = time.time()
+
+    for i in range(iterations):
+        for filename, diff, data in patches:
+            func(diff, data)
+
+    elapsed = time.time() - start
+    num_patches = iterations * len(patches)
+
+    print('%-12s %8.3fs total, %8.3fms per file' %
+          (name, elapsed, elapsed * 1000 / num_patches))
+
+    return elapsed
+
+
+def main():
+    if len(sys.argv) > 1:
+        iterations = int(sys.argv[1])
+    else:
+        iterations = 20
+
+    patches = load_patches()
+
+    for filename, diff, data in patches:
+        if apply_patch(diff, data) != run_patch_command(diff, data):
+            sys.stderr.write('Results differ for %s\n' % filename)
+            sys.exit(1)
+
+    print('Applying %d diffs %d times' % (len(patches), iterations))
+
+    in_process = benchmark('in-process', apply_patch, patches, iterations)
+    command = benchmark('patch', run_patch_command, patches, iterations)
+
+    print('Speedup: %.1fx' % (command / in_process))
+
+
+if __name__ == '__main__':
+    main()
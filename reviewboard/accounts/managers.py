@@ -1,6 +1,8 @@
 from __future__ import unicode_literals
 
-from django.db.models import Manager
+from django.db import connections, router, transaction
+from django.db.models import F, Manager
+from djblets.db.managers import ConcurrencyManager
 
 
 class ProfileManager(Manager):
@@ -14,3 +16,75 @@ class ProfileManager(Manager):
         user._profile = profile
 
         return profile, is_new
+
+
+class ReviewRequestVisitManager(ConcurrencyManager):
+    """A manager for ReviewRequestVisit models.
+
+    This maintains the number of new reviews on each review request since
+    each user last visited it.
+    """
+    def add_new_review(self, review):
+        """Counts a newly published review as new for other users.
+
+        This applies to all users who last visited the review request
+        before the review was published.
+        """
+        self._get_new_review_visits(review).update(
+            new_review_count=F('new_review_count') + 1)
+
+    def remove_new_review(self, review):
+        """Removes a deleted public review from the new review counts."""
+        self._get_new_review_visits(review).filter(
+            new_review_count__gt=0).update(
+                new_review_count=F('new_review_count') - 1)
+
+    def recalculate_new_review_counts(self, batch_size=1000):
+        """Recalculates the new review counts for all visits.
+
+        Visits are updated in batches of IDs, with one UPDATE statement
+        per batch, and each batch is committed separately.
+
+        Returns the number of visits updated.
+        """
+        from reviewboard.reviews.models import Review
+
+        db = router.db_for_write(self.model)
+        cursor = connections[db].cursor()
+        num_updated = 0
+        last_id = 0
+
+        while True:
+            ids = list(self.filter(pk__gt=last_id).order_by('pk')
+                       .values_list('pk', flat=True)[:batch_size])
+
+            if not ids:
+                break
+
+            cursor.execute(
+                'UPDATE %(visit_table)s SET new_review_count = ('
+                '  SELECT COUNT(*) FROM %(review_table)s'
+                '    WHERE %(review_table)s.public'
+                '      AND %(review_table)s.review_request_id ='
+                '          %(visit_table)s.review_request_id'
+                '      AND %(review_table)s.timestamp >'
+                '          %(visit_table)s.timestamp'
+                '      AND %(review_table)s.user_id !='
+                '          %(visit_table)s.user_id'
+                ') WHERE %(visit_table)s.id >= %%s AND'
+                '        %(visit_table)s.id <= %%s' % {
+                    'visit_table': self.model._meta.db_table,
+                    'review_table': Review._meta.db_table,
+                },
+                [ids[0], ids[-1]])
+            transaction.commit_unless_managed(using=db)
+
+            num_updated += len(ids)
+            last_id = ids[-1]
+
+        return num_updated
+
+    def _get_new_review_visits(self, review):
+        return (self.filter(review_request=review.review_request_id,
+                            timestamp__lt=review.timestamp)
+                .exclude(user=review.user_id))
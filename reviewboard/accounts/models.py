@@ -6,10 +6,10 @@ from django.utils import timezone
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
 from djblets.db.fields import CounterField, JSONField
-from djblets.db.managers import ConcurrencyManager
 from djblets.forms.fields import TIMEZONE_CHOICES
 
-from reviewboard.accounts.managers import ProfileManager
+from reviewboard.accounts.managers import (ProfileManager,
+                                           ReviewRequestVisitManager)
 from reviewboard.reviews.models import Group, ReviewRequest
 from reviewboard.site.models import LocalSite
 
@@ -28,8 +28,11 @@ class ReviewRequestVisit(models.Model):
     review_request = models.ForeignKey(ReviewRequest, related_name="visits")
     timestamp = models.DateTimeField(_('last visited'), default=timezone.now)
 
-    # Set this up with a ConcurrencyManager to help prevent race conditions.
-    objects = ConcurrencyManager()
+    # The number of public reviews by other users since the last visit.
+    new_review_count = models.IntegerField(_('new review count'), default=0)
+
+    # This is a ConcurrencyManager, to help prevent race conditions.
+    objects = ReviewRequestVisitManager()
 
     def __str__(self):
         return "Review request visit"
@@ -1,9 +1,12 @@
 from __future__ import unicode_literals
 
+from datetime import timedelta
+
 from django.contrib.auth.models import User
 from djblets.testing.decorators import add_fixtures
 
-from reviewboard.accounts.models import LocalSiteProfile
+from reviewboard.accounts.models import LocalSiteProfile, ReviewRequestVisit
+from reviewboard.reviews.models import Review, ReviewRequest
 from reviewboard.testing import TestCase
 
 
@@ -55,3 +58,88 @@ class ProfileTests(TestCase):
         self.assertFalse(review_request in
                          profile1.starred_review_requests.all())
         self.assertEqual(site_profile.starred_public_request_count, 0)
+
+
+class ReviewRequestVisitTests(TestCase):
+    """Testing the new review counts on ReviewRequestVisit."""
+    fixtures = ['test_users', 'test_scmtools']
+
+    def setUp(self):
+        super(ReviewRequestVisitTests, self).setUp()
+
+        self.review_request = self.create_review_request(publish=True)
+        self.user = User.objects.get(username='doc')
+        self.visit = ReviewRequestVisit.objects.create(
+            user=self.user,
+            review_request=self.review_request)
+
+    def test_publish_review(self):
+        """Testing ReviewRequestVisit.new_review_count after publishing
+        reviews
+        """
+        self.create_review(self.review_request, user='dopey', publish=True)
+        self.assertEqual(self._get_new_review_count(), 1)
+
+        # The user's own reviews aren't new to them.
+        self.create_review(self.review_request, user=self.user,
+                           publish=True)
+        self.assertEqual(self._get_new_review_count(), 1)
+
+        review = self.create_review(self.review_request, user='grumpy',
+                                    publish=True)
+        self.create_reply(review, user='dopey', publish=True)
+        self.assertEqual(self._get_new_review_count(), 3)
+
+    def test_publish_review_before_visit(self):
+        """Testing ReviewRequestVisit.new_review_count with reviews
+        published before the visit
+        """
+        self.visit.timestamp += timedelta(days=1)
+        self.visit.save()
+
+        self.create_review(self.review_request, user='dopey', publish=True)
+        self.assertEqual(self._get_new_review_count(), 0)
+
+    def test_delete_review(self):
+        """Testing ReviewRequestVisit.new_review_count after deleting a
+        public review
+        """
+        review = self.create_review(self.review_request, user='dopey',
+                                    publish=True)
+        self.assertEqual(self._get_new_review_count(), 1)
+
+        Review.objects.get(pk=review.pk).delete()
+        self.assertEqual(self._get_new_review_count(), 0)
+
+    def test_recalculate_new_review_counts(self):
+        """Testing ReviewRequestVisit.objects.recalculate_new_review_counts"""
+        self.create_review(self.review_request, user='dopey', publish=True)
+        self.create_review(self.review_request, user=self.user,
+                           publish=True)
+        self.create_review(self.review_request, user='grumpy')
+
+        ReviewRequestVisit.objects.update(new_review_count=0)
+
+        self.assertEqual(
+            ReviewRequestVisit.objects.recalculate_new_review_counts(
+                batch_size=1),
+            ReviewRequestVisit.objects.count())
+        self.assertEqual(self._get_new_review_count(), 1)
+
+    def test_with_counts(self):
+        """Testing ReviewRequest.objects.with_counts"""
+        self.create_review(self.review_request, user='dopey', publish=True)
+
+        review_request = ReviewRequest.objects.all() \
+            .with_counts(self.user).get(pk=self.review_request.pk)
+        self.assertEqual(review_request.new_review_count, 1)
+
+        # Users who haven't visited have no new reviews.
+        user = User.objects.get(username='grumpy')
+        review_request = ReviewRequest.objects.all() \
+            .with_counts(user).get(pk=self.review_request.pk)
+        self.assertEqual(review_request.new_review_count, 0)
+
+    def _get_new_review_count(self):
+        return ReviewRequestVisit.objects.get(pk=self.visit.pk) \
+            .new_review_count
@@ -49,6 +49,7 @@ from reviewboard.admin.checks import (get_can_enable_syntax_highlighting,
                                       get_can_use_couchdb)
 from reviewboard.admin.siteconfig import load_site_config
 from reviewboard.admin.support import get_install_key
+from reviewboard.diffviewer.differ import DiffCompatVersion
 from reviewboard.ssh.client import SSHClient
 
 
@@ -148,6 +149,33 @@ class GeneralSettingsForm(SiteSettingsForm):
         required=True,
         widget=forms.TextInput(attrs={'size': '50'}))
 
+    repository_file_cache_path = forms.CharField(
+        label=_('Repository file cache path'),
+        help_text=_('A directory used to store files fetched from '
+                    'repositories, in addition to the cache above. This '
+                    'avoids fetching them again after they are removed '
+                    'from the cache. Leave this blank to disable this '
+                    'cache.'),
+        required=False,
+        widget=forms.TextInput(attrs={'size': '50'}))
+
+    repository_file_cache_size = forms.IntegerField(
+        label=_('Repository file cache size (bytes)'),
+        help_text=_('The maximum size (in bytes) of the files stored in the '
+                    'repository file cache.'),
+        min_value=1,
+        initial=1024 * 1024 * 1024,
+        widget=forms.TextInput(attrs={'size': '15'}))
+
+    repository_missing_file_cache_period = forms.IntegerField(
+        label=_('Missing file cache period (seconds)'),
+        help_text=_('How long to remember that a file does not exist in a '
+                    'repository, before checking the repository again. '
+                    'Enter 0 to always check the repository.'),
+        min_value=0,
+        initial=60,
+        widget=forms.TextInput(attrs={'size': '5'}))
+
     def load(self):
         domain_method = self.siteconfig.get("site_domain_method")
         site = Site.objects.get_current()
@@ -261,6 +289,23 @@ class GeneralSettingsForm(SiteSettingsForm):
 
         return cache_path
 
+    def clean_repository_file_cache_path(self):
+        """Validates that the repository file cache path is valid."""
+        cache_path = self.cleaned_data['repository_file_cache_path'].strip()
+
+        if cache_path:
+            if not os.path.isabs(cache_path):
+                raise ValidationError(
+                    _('The repository file cache path must be absolute.'))
+
+            if (os.path.exists(cache_path) and
+                    not os.access(cache_path, os.W_OK)):
+                raise ValidationError(
+                    _('The repository file cache path is not writable. Make '
+                      'sure the web server has write access to it.'))
+
+        return cache_path
+
     def clean_search_index_file(self):
         """Validates that the specified index file is valid."""
         index_file = self.cleaned_data['search_index_file'].strip()
@@ -295,7 +340,10 @@ class GeneralSettingsForm(SiteSettingsForm):
             {
                 'classes': ('wide',),
                 'title': _('Cache Settings'),
-                'fields': ('cache_type', 'cache_path', 'cache_host'),
+                'fields': ('cache_type', 'cache_path', 'cache_host',
+                           'repository_file_cache_path',
+                           'repository_file_cache_size',
+                           'repository_missing_file_cache_period'),
             },
             {
                 'classes': ('wide',),
@@ -513,6 +561,16 @@ class DiffSettingsForm(SiteSettingsForm):
                     "(e.g., \"*.py, *.txt\")"),
         widget=forms.TextInput(attrs={'size': '60'}))
 
+    diffviewer_diff_compat_version = forms.TypedChoiceField(
+        label=_('Diff algorithm'),
+        help_text=_('The algorithm used to compare files in newly uploaded '
+                    'diffs. Patience produces cleaner diffs when code has '
+                    'been moved around. Existing diffs keep the algorithm '
+                    'they were uploaded with. This can be overridden for '
+                    'each repository.'),
+        choices=DiffCompatVersion.CHOICES,
+        coerce=int)
+
     diffviewer_context_num_lines = forms.IntegerField(
         label=_("Lines of Context"),
         help_text=_("The number of unchanged lines shown above and below "
@@ -540,6 +598,40 @@ class DiffSettingsForm(SiteSettingsForm):
                     'to disable size restrictions.'),
         widget=forms.TextInput(attrs={'size': '15'}))
 
+    diffviewer_chunk_generator_threads = forms.IntegerField(
+        label=_('Chunk generator threads'),
+        help_text=_('The maximum number of threads used to generate the '
+                    'side-by-side diffs of several files at once. Enter 1 '
+                    'to generate them one at a time.'),
+        min_value=1,
+        initial=1,
+        widget=forms.TextInput(attrs={'size': '5'}))
+
+    diffviewer_original_file_cache_size = forms.IntegerField(
+        label=_('Original file cache size (bytes)'),
+        help_text=_('The maximum size (in bytes) of the original files kept '
+                    'in memory by each server process, after line endings '
+                    'are normalized and parent diffs are applied. Enter 0 '
+                    'to disable this cache.'),
+        min_value=0,
+        initial=0,
+        widget=forms.TextInput(attrs={'size': '15'}))
+
+    diffviewer_prewarm_chunks = forms.BooleanField(
+        label=_('Pre-generate diffs when published'),
+        help_text=_('Generate and cache the side-by-side diffs in the '
+                    'background when a new diff is published, instead of '
+                    'when it is first viewed.'),
+        required=False)
+
+    diffviewer_prewarm_max_files = forms.IntegerField(
+        label=_('Max pre-generated files per diff'),
+        help_text=_('The maximum number of files in a diff that will be '
+                    'pre-generated when published. Enter 0 for no limit.'),
+        min_value=0,
+        initial=50,
+        widget=forms.TextInput(attrs={'size': '5'}))
+
     def load(self):
         # TODO: Move this check into a dependencies module so we can catch it
         #       when the user starts up Review Board.
@@ -584,7 +676,12 @@ class DiffSettingsForm(SiteSettingsForm):
                 'fields': ('diffviewer_max_diff_size',
                            'diffviewer_context_num_lines',
                            'diffviewer_paginate_by',
-                           'diffviewer_paginate_orphans')
+                           'diffviewer_paginate_orphans',
+                           'diffviewer_chunk_generator_threads',
+                           'diffviewer_diff_compat_version',
+                           'diffviewer_original_file_cache_size',
+                           'diffviewer_prewarm_chunks',
+                           'diffviewer_prewarm_max_files')
             }
         )
 
@@ -45,6 +45,7 @@ from haystack import connections
 
 from reviewboard.accounts.backends import get_registered_auth_backends
 from reviewboard.admin.checks import get_can_enable_syntax_highlighting
+from reviewboard.diffviewer.differ import DiffCompatVersion
 from reviewboard.signals import site_settings_loaded
 
 
@@ -120,16 +121,25 @@ defaults.update({
     'auth_x509_username_field':            'SSL_CLIENT_S_DN_CN',
     'auth_x509_username_regex':            '',
     'auth_x509_autocreate_users':          False,
+    'diffviewer_chunk_generator_threads':  1,
     'diffviewer_context_num_lines':        5,
+    'diffviewer_diff_compat_version':      DiffCompatVersion.DEFAULT,
     'diffviewer_include_space_patterns':   [],
     'diffviewer_max_diff_size':            0,
+    'diffviewer_original_file_cache_size': 0,
     'diffviewer_paginate_by':              20,
     'diffviewer_paginate_orphans':         10,
+    'diffviewer_prewarm_chunks':           False,
+    'diffviewer_prewarm_max_files':        50,
     'diffviewer_syntax_highlighting':      True,
     'diffviewer_syntax_highlighting_threshold': 0,
     'diffviewer_show_trailing_whitespace': True,
     'mail_send_review_mail':               False,
     'mail_send_new_user_mail':             False,
+    'repository_file_cache_path':          '',
+    'repository_file_cache_size':          1024 * 1024 * 1024,
+    'repository_missing_file_cache_period': 60,
+    'review_request_access_table':         'disabled',
     'search_enable':                       False,
     'site_domain_method':                  'http',
 
@@ -20,6 +20,7 @@ from reviewboard.admin.support import get_support_url
 from reviewboard.admin.widgets import (dynamic_activity_data,
                                        primary_widgets,
                                        secondary_widgets)
+from reviewboard.scmtools.file_cache import get_repository_file_cache
 from reviewboard.ssh.client import SSHClient
 from reviewboard.ssh.utils import humanize_key
 
@@ -45,10 +46,17 @@ def cache_stats(request, template_name="admin/cache_stats.html"):
     information as memory used, cache misses, and uptime.
     """
     cache_stats = get_cache_stats()
+    repository_file_cache = get_repository_file_cache()
+
+    if repository_file_cache:
+        repository_file_cache_stats = repository_file_cache.get_stats()
+    else:
+        repository_file_cache_stats = None
 
     return render_to_response(template_name, RequestContext(request, {
         'cache_hosts': cache_stats,
         'cache_backend': settings.CACHES['default']['BACKEND'],
+        'repository_file_cache_stats': repository_file_cache_stats,
         'title': _("Server Cache"),
         'root_path': settings.SITE_ROOT + "admin/db/"
     }))
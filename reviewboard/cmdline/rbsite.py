@@ -1875,6 +1875,7 @@ class UpgradeCommand(Command):
                   "\n"
                   "Resetting in-database caches.")
             site.run_manage_command("fixreviewcounts")
+            site.run_manage_command("fixnewreviewcounts")
 
         print()
         print("Upgrade complete!")
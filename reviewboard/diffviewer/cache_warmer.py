@@ -0,0 +1,163 @@
+from __future__ import unicode_literals
+
+import logging
+import threading
+
+from django.db import connection
+from djblets.siteconfig.models import SiteConfiguration
+from djblets.util.compat.six.moves import queue
+
+from reviewboard.admin.checks import get_can_enable_syntax_highlighting
+from reviewboard.diffviewer.diffutils import (get_diff_files,
+                                              populate_diff_chunks,
+                                              prefetch_original_files)
+
+
+def get_default_enable_highlighting():
+    """Returns whether syntax highlighting is enabled site-wide.
+
+    This is used when generating chunks outside of a request, where there's
+    no user whose preferences can be checked.
+    """
+    siteconfig = SiteConfiguration.objects.get_current()
+
+    return (siteconfig.get('diffviewer_syntax_highlighting') and
+            get_can_enable_syntax_highlighting()[0])
+
+
+def warm_diffset_chunks(diffset, interdiffset=None, max_files=0):
+    """Generates and caches the diff chunks for a diffset.
+
+    If interdiffset is provided, the chunks for the interdiff between the
+    two diffsets will be generated instead.
+
+    If max_files is greater than 0, only that many files (in the order
+    they're shown in the diff viewer) will be processed.
+
+    This returns the number of files processed.
+    """
+    files = get_diff_files(diffset, None, interdiffset)
+
+    if max_files > 0:
+        files = files[:max_files]
+
+    enable_highlighting = get_default_enable_highlighting()
+    prefetch_original_files(files, enable_highlighting)
+    populate_diff_chunks(files, enable_highlighting)
+
+    return len(files)
+
+
+class ChunkCacheWarmer(object):
+    """Pre-computes diff chunks for diffsets in the background.
+
+    Diffsets are queued up and processed one at a time by a worker thread,
+    which generates the chunks through populate_diff_chunks. This fills the
+    chunk cache before anybody views the diff, so that the first reviewer
+    doesn't pay for the cold cache.
+
+    The queue is per-process, and has a limited size. Diffsets queued up
+    while the queue is full are skipped, and will be generated when first
+    viewed instead.
+    """
+    MAX_QUEUED_DIFFSETS = 100
+
+    def __init__(self):
+        self._queue = queue.Queue(self.MAX_QUEUED_DIFFSETS)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def queue_diffset(self, diffset, interdiffset=None):
+        """Queues a diffset (or an interdiff) for chunk generation.
+
+        The number of files processed is limited by the
+        ``diffviewer_prewarm_max_files`` setting.
+
+        Returns whether the diffset was queued.
+        """
+        siteconfig = SiteConfiguration.objects.get_current()
+        max_files = siteconfig.get('diffviewer_prewarm_max_files')
+
+        if interdiffset:
+            item = (diffset.pk, interdiffset.pk, max_files)
+        else:
+            item = (diffset.pk, None, max_files)
+
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            logging.warning('Unable to queue diffset %s for chunk '
+                            'pre-generation. The queue is full.',
+                            diffset.pk)
+            return False
+
+        self._start_thread()
+
+        return True
+
+    def queue_diffset_history(self, diffset_history):
+        """Queues the latest diffset in a history for chunk generation.
+
+        This will queue the latest diffset, along with the interdiff
+        between it and the previous diffset, if there is one.
+        """
+        diffsets = list(diffset_history.diffsets.order_by('-revision')[:2])
+
+        if not diffsets:
+            return
+
+        self.queue_diffset(diffsets[0])
+
+        if len(diffsets) > 1:
+            self.queue_diffset(diffsets[1], diffsets[0])
+
+    def _start_thread(self):
+        """Starts the worker thread, if it's not already running."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        """Processes queued diffsets until the process exits."""
+        while True:
+            item = self._queue.get()
+
+            try:
+                self._process(*item)
+            except Exception as e:
+                logging.error('Unable to pre-generate diff chunks for '
+                              'diffset %s: %s',
+                              item[0], e, exc_info=1)
+            finally:
+                # The worker thread has its own database connection, which
+                # would otherwise be left open while the queue is idle.
+                connection.close()
+                self._queue.task_done()
+
+    def _process(self, diffset_id, interdiffset_id, max_files):
+        """Generates the chunks for a queued diffset."""
+        from reviewboard.diffviewer.models import DiffSet
+
+        diffset = DiffSet.objects.get(pk=diffset_id)
+
+        if interdiffset_id is None:
+            interdiffset = None
+        else:
+            interdiffset = DiffSet.objects.get(pk=interdiffset_id)
+
+        warm_diffset_chunks(diffset, interdiffset, max_files)
+
+
+_warmer = None
+
+
+def get_chunk_cache_warmer():
+    """Returns the ChunkCacheWarmer for this process."""
+    global _warmer
+
+    if _warmer is None:
+        _warmer = ChunkCacheWarmer()
+
+    return _warmer
@@ -1,6 +1,8 @@
 from __future__ import unicode_literals
 
 import fnmatch
+import hashlib
+import logging
 import re
 from difflib import SequenceMatcher
 
@@ -16,6 +18,9 @@ from pygments import highlight
 from pygments.lexers import get_lexer_for_filename
 from pygments.formatters import HtmlFormatter
 
+from reviewboard.diffviewer.chunk_serializer import (ChunkFormatError,
+                                                     deserialize_chunks,
+                                                     serialize_chunks)
 from reviewboard.diffviewer.differ import get_differ
 from reviewboard.diffviewer.diffutils import (get_original_file,
                                               get_patched_file,
@@ -103,16 +108,41 @@ class DiffChunkGenerator(object):
         self._last_header = [None, None]
         self._last_header_index = [0, 0]
         self._cur_meta = {}
+        self._cur_whitespace_lines = set()
+        self._cur_moved_to = {}
+        self._cur_moved_from = {}
         self._chunk_index = 0
 
     def make_cache_key(self):
-        """Creates a cache key for any generated chunks."""
+        """Creates a cache key for any generated chunks.
+
+        If the diff content for the FileDiffs is stored in FileDiffData,
+        the key will be based on the content being diffed, rather than the
+        FileDiff IDs. That allows identical diffs (such as the same change
+        posted on multiple review requests, or re-posted in a new revision)
+        to share the same cached chunks.
+        """
         key = 'diff-sidebyside-'
 
         if self.enable_syntax_highlighting:
             key += 'hl-'
 
-        if not self.force_interdiff:
+        filediff_key = self._make_content_key(self.filediff)
+
+        if self.interfilediff:
+            interfilediff_key = self._make_content_key(self.interfilediff)
+        else:
+            interfilediff_key = None
+
+        if filediff_key and (interfilediff_key or not self.interfilediff):
+            if not self.force_interdiff:
+                key += 'content-%s' % filediff_key
+            elif self.interfilediff:
+                key += 'interdiff-content-%s-%s' % (filediff_key,
+                                                    interfilediff_key)
+            else:
+                key += 'interdiff-content-%s-none' % filediff_key
+        elif not self.force_interdiff:
             key += six.text_type(self.filediff.pk)
         elif self.interfilediff:
             key += 'interdiff-%s-%s' % (self.filediff.pk,
@@ -124,6 +154,37 @@ class DiffChunkGenerator(object):
 
         return key
 
+    def _make_content_key(self, filediff):
+        """Creates a key representing the content of a FileDiff.
+
+        The key is a hash of the identity of the original file (the
+        repository, path, revision and base commit ID), the destination
+        path, the hashes of the diff and parent diff, and the diff
+        compatibility version. Anything that would change the generated
+        chunks for the FileDiff will change the key.
+
+        If the FileDiff's diff content hasn't been migrated to
+        FileDiffData, None will be returned.
+        """
+        if (not filediff.diff_hash_id or
+            (filediff.parent_diff64 and not filediff.parent_diff_hash_id)):
+            return None
+
+        diffset = filediff.diffset
+        hasher = hashlib.sha1()
+
+        for value in (diffset.repository_id,
+                      filediff.source_file,
+                      filediff.source_revision,
+                      diffset.base_commit_id or '',
+                      filediff.dest_file,
+                      filediff.diff_hash_id,
+                      filediff.parent_diff_hash_id or '',
+                      diffset.diffcompat):
+            hasher.update(('%s\0' % value).encode('utf-8'))
+
+        return hasher.hexdigest()
+
     def get_chunks(self):
         """Returns the chunks for the given diff information.
 
@@ -133,15 +194,39 @@ class DiffChunkGenerator(object):
         If there are chunks already computed in the cache, they will be
         returned. Otherwise, new chunks will be generated, stored in cache,
         and returned.
+
+        Chunks are stored in the cache in the compact form provided by
+        serialize_chunks.
         """
         if (self.filediff.binary or
                 self.filediff.deleted or
                 self.filediff.source_revision == ''):
             return []
 
-        return cache_memoize(self.make_cache_key(),
-                             lambda: list(self._get_chunks_uncached()),
-                             large_data=True)
+        key = self.make_cache_key()
+        generated_chunks = []
+
+        def _get_serialized_chunks():
+            generated_chunks.extend(self._get_chunks_uncached())
+
+            return serialize_chunks(generated_chunks)
+
+        data = cache_memoize(key, _get_serialized_chunks, large_data=True)
+
+        if generated_chunks:
+            # There's no need to deserialize chunks we just generated.
+            return generated_chunks
+
+        try:
+            return deserialize_chunks(data)
+        except ChunkFormatError as e:
+            logging.warning('Regenerating diff chunks for cache key %s: %s',
+                            key, e)
+
+            cache_memoize(key, _get_serialized_chunks, large_data=True,
+                          force_overwrite=True)
+
+            return generated_chunks
 
     def _get_chunks_uncached(self):
         """Returns the list of chunks, bypassing the cache."""
@@ -244,12 +329,12 @@ class DiffChunkGenerator(object):
             new_lines = markup_b[j1:j2]
             num_lines = max(len(old_lines), len(new_lines))
 
-            self._cur_meta = meta
+            self._set_cur_meta(meta)
             lines = map(self._diff_line,
                         range(line_num, line_num + num_lines),
                         range(i1 + 1, i2 + 1), range(j1 + 1, j2 + 1),
                         a[i1:i2], b[j1:j2], old_lines, new_lines)
-            self._cur_meta = None
+            self._set_cur_meta(None)
 
             if tag == 'equal' and num_lines > collapse_threshold:
                 last_range_start = num_lines - context_num_lines
@@ -310,6 +395,26 @@ class DiffChunkGenerator(object):
 
         return True
 
+    def _set_cur_meta(self, meta):
+        """Sets the metadata for the lines currently being generated.
+
+        The whitespace and move information in the metadata is stored as
+        lists and dictionaries, which is what ends up in the chunks. For
+        generating lines, this is turned into a set and dictionaries that
+        can be checked in constant time for each line, instead of scanning
+        the whitespace_lines list for every line of the chunk.
+        """
+        self._cur_meta = meta
+
+        if meta:
+            self._cur_whitespace_lines = set(meta['whitespace_lines'])
+            self._cur_moved_to = meta.get('moved-to', {})
+            self._cur_moved_from = meta.get('moved-from', {})
+        else:
+            self._cur_whitespace_lines = set()
+            self._cur_moved_to = {}
+            self._cur_moved_from = {}
+
     def _diff_line(self, v_line_num, old_line_num, new_line_num,
                    old_line, new_line, old_markup, new_markup):
         """Creates a single line in the diff viewer.
@@ -329,22 +434,20 @@ class DiffChunkGenerator(object):
         else:
             old_region = new_region = []
 
-        meta = self._cur_meta
-
         result = [
             v_line_num,
             old_line_num or '', mark_safe(old_markup or ''), old_region,
             new_line_num or '', mark_safe(new_markup or ''), new_region,
-            (old_line_num, new_line_num) in meta['whitespace_lines']
+            (old_line_num, new_line_num) in self._cur_whitespace_lines
         ]
 
         moved_info = {}
 
-        if old_line_num and old_line_num in meta.get('moved-to', {}):
-            moved_info['to'] = meta['moved-to'][old_line_num]
+        if old_line_num and old_line_num in self._cur_moved_to:
+            moved_info['to'] = self._cur_moved_to[old_line_num]
 
-        if new_line_num and new_line_num in meta.get('moved-from', {}):
-            moved_info['from'] = meta['moved-from'][new_line_num]
+        if new_line_num and new_line_num in self._cur_moved_from:
+            moved_info['from'] = self._cur_moved_from[new_line_num]
 
         if moved_info:
             result.append(moved_info)
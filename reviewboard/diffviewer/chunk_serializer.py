@@ -0,0 +1,204 @@
+from __future__ import unicode_literals
+
+from django.utils.safestring import mark_safe
+from djblets.util.compat import six
+from djblets.util.compat.six.moves import range
+
+
+# The identifier and version stored at the start of serialized chunks.
+# The version should be bumped whenever the format changes, so that
+# incompatible data in the cache is regenerated.
+CHUNKS_FORMAT_ID = 'rb-chunks'
+CHUNKS_FORMAT_VERSION = 1
+
+
+class ChunkFormatError(ValueError):
+    """An error in the format of serialized chunks."""
+
+
+def serialize_chunks(chunks):
+    """Returns a compact form of a list of diff chunks for the cache.
+
+    Chunks generated by DiffChunkGenerator are lists of dictionaries, each
+    containing a list of lines, and each line is a list containing
+    SafeText markup. Pickling these results in a lot of overhead for every
+    line, and the same markup is often stored twice for each line (once for
+    each side of the diff).
+
+    The serialized form is a tuple of plain types instead. The markup for
+    all lines is stored once in a shared string table, and the lines of
+    each chunk are stored as columns. Line numbers are stored as ranges
+    where possible, and the columns that are mostly empty (changed regions,
+    whitespace flags and move information) only store the lines that have
+    them. The result can be stored through cache_memoize, which will pickle
+    and compress it.
+    """
+    strings = []
+    string_indexes = {}
+    serialized_chunks = []
+
+    for chunk in chunks:
+        lines = chunk['lines']
+        columns = [[] for i in range(5)]
+        regions = {}
+        whitespace = []
+        moves = {}
+
+        for i, line in enumerate(lines):
+            # See DiffChunkGenerator._diff_line for the format of each line.
+            columns[0].append(line[0])
+            columns[1].append(line[1])
+            columns[3].append(line[4])
+
+            for column, markup in ((columns[2], line[2]),
+                                   (columns[4], line[5])):
+                markup = six.text_type(markup)
+                index = string_indexes.get(markup)
+
+                if index is None:
+                    index = len(strings)
+                    strings.append(markup)
+                    string_indexes[markup] = index
+
+                column.append(index)
+
+            if line[3] != [] or line[6] != []:
+                regions[i] = (line[3], line[6])
+
+            if line[7]:
+                whitespace.append(i)
+
+            if len(line) > 8:
+                moves[i] = line[8]
+
+        serialized_chunks.append((
+            chunk['index'],
+            chunk['change'],
+            chunk['collapsable'],
+            chunk['meta'],
+            len(lines),
+            _pack_line_nums(columns[0]),
+            _pack_line_nums(columns[1]),
+            columns[2],
+            _pack_line_nums(columns[3]),
+            columns[4],
+            regions,
+            whitespace,
+            moves,
+        ))
+
+    # Markup never contains newlines, since files are split into lines
+    # before being rendered, so the string table can be stored as a single
+    # string. That's faster to load than a list of strings.
+    if any('\n' in s for s in strings):
+        packed_strings = strings
+    else:
+        packed_strings = '\n'.join(strings)
+
+    return (CHUNKS_FORMAT_ID, CHUNKS_FORMAT_VERSION, packed_strings,
+            serialized_chunks)
+
+
+def deserialize_chunks(data):
+    """Returns the list of diff chunks from their serialized form.
+
+    This reverses serialize_chunks. For compatibility with older cached
+    data, a list of chunks in the original format is returned as-is.
+
+    ChunkFormatError is raised if the data isn't in a format that can be
+    read.
+    """
+    if isinstance(data, list):
+        return data
+
+    if (not isinstance(data, tuple) or
+        len(data) != 4 or
+        data[0] != CHUNKS_FORMAT_ID):
+        raise ChunkFormatError('Unknown format for serialized chunks')
+
+    if data[1] != CHUNKS_FORMAT_VERSION:
+        raise ChunkFormatError('Unsupported version %r of serialized chunks'
+                               % data[1])
+
+    strings = data[2]
+
+    if isinstance(strings, six.text_type):
+        strings = strings.split('\n')
+
+    strings = [mark_safe(s) for s in strings]
+    chunks = []
+
+    for (index, change, collapsable, meta, num_lines, v_line_nums,
+         old_line_nums, old_markup, new_line_nums, new_markup, regions,
+         whitespace, moves) in data[3]:
+        lines = [
+            [v_line_num,
+             old_line_num, strings[old_markup_index], [],
+             new_line_num, strings[new_markup_index], [],
+             False]
+            for (v_line_num, old_line_num, old_markup_index,
+                 new_line_num, new_markup_index)
+            in zip(_unpack_line_nums(v_line_nums, num_lines),
+                   _unpack_line_nums(old_line_nums, num_lines),
+                   old_markup,
+                   _unpack_line_nums(new_line_nums, num_lines),
+                   new_markup)
+        ]
+
+        for i, (old_region, new_region) in six.iteritems(regions):
+            lines[i][3] = old_region
+            lines[i][6] = new_region
+
+        for i in whitespace:
+            lines[i][7] = True
+
+        for i, moved_info in six.iteritems(moves):
+            lines[i].append(moved_info)
+
+        chunks.append({
+            'index': index,
+            'lines': lines,
+            'numlines': num_lines,
+            'change': change,
+            'collapsable': collapsable,
+            'meta': meta,
+        })
+
+    return chunks
+
+
+def _pack_line_nums(line_nums):
+    """Returns a compact form of a column of line numbers.
+
+    Line numbers within a chunk are normally consecutive, or are all blank
+    (for the missing side of an insert or delete). These are stored as an
+    integer for the first line number, or as a blank string. Anything else
+    is stored as the full list.
+    """
+    if not line_nums:
+        return None
+
+    first = line_nums[0]
+
+    if first == '':
+        if all(line_num == '' for line_num in line_nums):
+            return first
+    elif isinstance(first, six.integer_types):
+        expected = range(first, first + len(line_nums))
+
+        if all(a == b for a, b in zip(line_nums, expected)):
+            return first
+
+    return line_nums
+
+
+def _unpack_line_nums(packed, num_lines):
+    """Returns a column of line numbers packed by _pack_line_nums."""
+    if isinstance(packed, list):
+        return packed
+    elif packed is None:
+        return []
+    elif packed == '':
+        return [''] * num_lines
+    else:
+        return range(packed, packed + num_lines)
@@ -20,10 +20,20 @@ class DiffCompatVersion(object):
     # (prevents very long diff times for certain files)
     MYERS_SMS_COST_BAIL = 2
 
+    # Patience differ, falling back on the Myers differ for ranges without
+    # unique lines.
+    PATIENCE = 3
+
     DEFAULT = MYERS_SMS_COST_BAIL
 
     MYERS_VERSIONS = (MYERS, MYERS_SMS_COST_BAIL)
 
+    # The versions that can be chosen for new diffs.
+    CHOICES = (
+        (MYERS_SMS_COST_BAIL, 'Myers'),
+        (PATIENCE, 'Patience'),
+    )
+
 
 class Differ(object):
     """Base class for differs."""
@@ -85,18 +95,31 @@ class Differ(object):
 
 
 def get_differ(a, b, ignore_space=False,
-               compat_version=DiffCompatVersion.DEFAULT):
+               compat_version=DiffCompatVersion.DEFAULT,
+               use_array_differ=True):
     """Returns a differ for with the given settings.
 
-    By default, this will return the MyersDiffer. Older differs can be used
-    by specifying a compat_version, but this is only for *really* ancient
-    diffs, currently.
+    By default, this will return the ArrayMyersDiffer. Older differs can be
+    used by specifying a compat_version, but this is only for *really*
+    ancient diffs, currently.
+
+    The ArrayMyersDiffer produces the same results as the MyersDiffer, and
+    is faster on large files. The MyersDiffer can be used instead by
+    passing use_array_differ=False.
     """
     cls = None
 
     if compat_version in DiffCompatVersion.MYERS_VERSIONS:
-        from reviewboard.diffviewer.myersdiff import MyersDiffer
-        cls = MyersDiffer
+        from reviewboard.diffviewer.myersdiff import (ArrayMyersDiffer,
+                                                      MyersDiffer)
+
+        if use_array_differ:
+            cls = ArrayMyersDiffer
+        else:
+            cls = MyersDiffer
+    elif compat_version == DiffCompatVersion.PATIENCE:
+        from reviewboard.diffviewer.patiencediff import PatienceDiffer
+        cls = PatienceDiffer
     elif compat_version == DiffCompatVersion.SMDIFFER:
         from reviewboard.diffviewer.smdiff import SMDiffer
         cls = SMDiffer
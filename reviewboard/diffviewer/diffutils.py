@@ -1,18 +1,28 @@
 from __future__ import unicode_literals
 
+import logging
 import os
 import re
 import subprocess
 import tempfile
+from multiprocessing.pool import ThreadPool
 
+from django.core.cache import cache
+from django.db import connection
 from django.utils import six
-from django.utils.translation import ugettext as _
+from django.utils.translation import (activate, deactivate, get_language,
+                                      ugettext as _)
+from djblets.cache.backend import make_cache_key
 from djblets.log import log_timed
 from djblets.siteconfig.models import SiteConfiguration
 from djblets.util.contextmanagers import controlled_subprocess
 
 from reviewboard.accounts.models import Profile
 from reviewboard.admin.checks import get_can_enable_syntax_highlighting
+from reviewboard.diffviewer.original_file_cache import (
+    get_original_file_cache,
+    make_original_file_key)
+from reviewboard.diffviewer.patcher import PatchError, apply_patch
 from reviewboard.scmtools.core import PRE_CREATION, HEAD
 
 
@@ -88,9 +98,13 @@ def convert_line_endings(data):
 
 
 def patch(diff, file, filename, request=None):
-    """Apply a diff to a file.  Delegates out to `patch` because noone
-       except Larry Wall knows how to patch."""
+    """Apply a diff to a file.
 
+    Unified diffs are applied in-process, which avoids the cost of spawning
+    `patch` for every file. Anything that can't be applied that way (context
+    diffs, or hunks that fail to apply) is handed to `patch`, because noone
+    except Larry Wall knows how to patch.
+    """
     log_timer = log_timed("Patching file %s" % filename,
                           request=request)
 
@@ -98,16 +112,25 @@ def patch(diff, file, filename, request=None):
         # Someone uploaded an unchanged file. Return the one we're patching.
         return file
 
+    file = convert_line_endings(file)
+    diff = convert_line_endings(diff)
+
+    try:
+        data = apply_patch(diff, file)
+        log_timer.done()
+
+        return data
+    except PatchError as e:
+        logging.debug('Falling back on patch for %s: %s', filename, e)
+
     # Prepare the temporary directory if none is available
     tempdir = tempfile.mkdtemp(prefix='reviewboard.')
 
     (fd, oldfile) = tempfile.mkstemp(dir=tempdir)
     f = os.fdopen(fd, "w+b")
-    f.write(convert_line_endings(file))
+    f.write(file)
     f.close()
 
-    diff = convert_line_endings(diff)
-
     newfile = '%s-new' % oldfile
 
     process = subprocess.Popen(['patch', '-o', newfile, oldfile],
@@ -159,7 +182,23 @@ def get_original_file(filediff, request, encoding_list):
     it exists.
 
     SCM exceptions are passed back to the caller.
+
+    If the ``diffviewer_original_file_cache_size`` setting is enabled, the
+    resulting file is kept in a per-process cache, so that it's only
+    normalized and patched once for every diff it appears in.
     """
+    file_cache = get_original_file_cache()
+    cache_key = None
+
+    if file_cache.max_size > 0:
+        cache_key = make_original_file_key(filediff, encoding_list)
+
+        if cache_key is not None:
+            data = file_cache.get(cache_key)
+
+            if data is not None:
+                return data
+
     data = b""
 
     if filediff.source_revision != PRE_CREATION:
@@ -179,10 +218,8 @@ def get_original_file(filediff, request, encoding_list):
         # This is mostly only a problem if the diff chunks aren't in the
         # cache, though if several people are working off the same file,
         # we'll be doing extra work to convert those line endings for each
-        # of those instead of once.
-        #
-        # Only other option is to cache the resulting file, but then we're
-        # duplicating the cached contents.
+        # of those instead of once, unless the original file cache is
+        # enabled.
         data = convert_line_endings(data)
 
         # Convert back to bytes using whichever encoding we used to decode.
@@ -193,9 +230,86 @@ def get_original_file(filediff, request, encoding_list):
         data = patch(filediff.parent_diff, data, filediff.source_file,
                      request)
 
+    if cache_key is not None:
+        file_cache.set(cache_key, data)
+
     return data
 
 
+def prefetch_original_files(files, enable_syntax_highlighting=True,
+                            request=None):
+    """Fetches the original versions of files in a diff, in bulk.
+
+    This accepts a list of files (generated by get_diff_files). Files whose
+    chunks (with the given syntax highlighting option) are already cached
+    don't need their original files, and are skipped. The source files of
+    each remaining FileDiff (and interdiff FileDiff) are fetched together
+    through Repository.prefetch_files, using as few requests to each
+    repository as it allows, and stored in the cache. get_original_file can
+    then read them from the cache instead of fetching them one at a time.
+
+    Any errors are logged and otherwise ignored. The files will be fetched
+    again when they're needed, and any errors reported then.
+    """
+    to_fetch = {}
+
+    for diff_file in _get_files_without_cached_chunks(
+            files, enable_syntax_highlighting, request):
+        for filediff in (diff_file['filediff'], diff_file['interfilediff']):
+            if (filediff is None or
+                filediff.binary or
+                filediff.source_revision == PRE_CREATION):
+                continue
+
+            diffset = filediff.diffset
+            key = (diffset.repository_id, diffset.base_commit_id)
+
+            if key not in to_fetch:
+                to_fetch[key] = (diffset.repository, set())
+
+            to_fetch[key][1].add((filediff.source_file,
+                                  filediff.source_revision))
+
+    for (repository_id, base_commit_id), (repository, file_infos) in \
+            six.iteritems(to_fetch):
+        try:
+            repository.prefetch_files(sorted(file_infos),
+                                      base_commit_id=base_commit_id,
+                                      request=request)
+        except Exception as e:
+            logging.warning('Unable to prefetch %d files from repository '
+                            '%s: %s',
+                            len(file_infos), repository_id, e,
+                            request=request)
+
+
+def _get_files_without_cached_chunks(files, enable_syntax_highlighting,
+                                     request):
+    """Returns the files in a list whose diff chunks aren't cached.
+
+    This only checks whether the cache keys exist, without loading the
+    chunks.
+    """
+    from reviewboard.diffviewer.chunk_generator import get_diff_chunk_generator
+
+    keys = [
+        make_cache_key(get_diff_chunk_generator(
+            request,
+            diff_file['filediff'],
+            diff_file['interfilediff'],
+            diff_file['force_interdiff'],
+            enable_syntax_highlighting).make_cache_key())
+        for diff_file in files
+    ]
+    cached_keys = cache.get_many(keys)
+
+    return [
+        diff_file
+        for diff_file, key in zip(files, keys)
+        if key not in cached_keys
+    ]
+
+
 def get_patched_file(buffer, filediff, request):
     tool = filediff.diffset.repository.get_scmtool()
     diff = tool.normalize_patch(filediff.diff, filediff.source_file,
@@ -383,17 +497,32 @@ def populate_diff_chunks(files, enable_syntax_highlighting=True,
     This accepts a list of files (generated by get_diff_files) and generates
     diff chunk data for each file in the list. The chunk data is stored in
     the file state.
+
+    If the ``diffviewer_chunk_generator_threads`` setting is greater than 1,
+    the chunks for the files will be generated concurrently in a bounded
+    pool of threads. The chunks are still stored in the same cache keys,
+    and the files keep their order.
     """
     from reviewboard.diffviewer.chunk_generator import get_diff_chunk_generator
 
-    for diff_file in files:
-        generator = get_diff_chunk_generator(request,
-                                             diff_file['filediff'],
-                                             diff_file['interfilediff'],
-                                             diff_file['force_interdiff'],
-                                             enable_syntax_highlighting)
-        chunks = generator.get_chunks()
+    generators = [
+        get_diff_chunk_generator(request,
+                                 diff_file['filediff'],
+                                 diff_file['interfilediff'],
+                                 diff_file['force_interdiff'],
+                                 enable_syntax_highlighting)
+        for diff_file in files
+    ]
+
+    siteconfig = SiteConfiguration.objects.get_current()
+    max_threads = siteconfig.get('diffviewer_chunk_generator_threads')
 
+    if max_threads > 1 and len(generators) > 1:
+        all_chunks = _get_chunks_concurrently(generators, max_threads)
+    else:
+        all_chunks = [generator.get_chunks() for generator in generators]
+
+    for diff_file, chunks in zip(files, all_chunks):
         diff_file.update({
             'chunks': chunks,
             'num_chunks': len(chunks),
@@ -417,6 +546,51 @@ def populate_diff_chunks(files, enable_syntax_highlighting=True,
         })
 
 
+def _get_chunks_concurrently(generators, max_threads):
+    """Returns the chunks for each generator, computed in a thread pool.
+
+    The returned list of chunks is in the same order as the generators.
+
+    Any database state needed to generate the chunks is loaded up-front in
+    the calling thread, so that the worker threads only have to deal with
+    the cache, the repository and the differ. Each worker thread activates
+    the caller's language, in order to compute the same cache keys.
+    """
+    for generator in generators:
+        for filediff in (generator.filediff, generator.interfilediff):
+            if filediff and not filediff.binary and not filediff.deleted:
+                # Accessing these will fetch and store the related
+                # FileDiffData, DiffSet and Repository state on the objects.
+                filediff.diff
+                filediff.parent_diff
+
+                repository = filediff.diffset.repository
+                repository.tool.get_scmtool_class()
+                repository.hosting_account
+
+    language = get_language()
+
+    def _get_chunks(generator):
+        activate(language)
+
+        try:
+            return generator.get_chunks()
+        finally:
+            deactivate()
+
+            # Each thread has its own database connection, which would
+            # otherwise be left open.
+            connection.close()
+
+    pool = ThreadPool(min(max_threads, len(generators)))
+
+    try:
+        return pool.map(_get_chunks, generators)
+    finally:
+        pool.close()
+        pool.join()
+
+
 def get_file_chunks_in_range(context, filediff, interfilediff,
                              first_line, num_lines):
     """
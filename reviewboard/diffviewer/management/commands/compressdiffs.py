@@ -0,0 +1,57 @@
+from __future__ import unicode_literals
+
+import optparse
+
+from django.core.management.base import BaseCommand
+
+from reviewboard.diffviewer.models import FileDiffData
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        optparse.make_option('--batch-size', type='int', dest='batch_size',
+                             default=100,
+                             help='The number of diffs to load and save at '
+                                  'a time (default 100)'),
+        optparse.make_option('--start-after', dest='start_after',
+                             default=None,
+                             help='Resume processing after the diff with '
+                                  'this hash'),
+    )
+    help = ('Compresses the diffs stored in the database, reducing space '
+            'requirements')
+    requires_model_validation = True
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            'Compressing stored diffs...\n'
+            '\n'
+            'This may take a while. It is safe to continue using '
+            'Review Board while this is\n'
+            'processing. If interrupted, it can be resumed by passing '
+            'the last hash shown\n'
+            'to --start-after.\n'
+            '\n')
+
+        info = FileDiffData.objects.compress_all(
+            batch_size=options['batch_size'],
+            start_after=options['start_after'],
+            progress_func=self._report_progress)
+
+        if not info['processed']:
+            self.stdout.write('No diffs to process.\n')
+            return
+
+        old_size = info['old_size']
+        new_size = info['new_size']
+
+        self.stdout.write(
+            '\n'
+            'Compressed %d of %d stored diffs, from %d bytes to %d bytes '
+            '(%d%% savings)\n'
+            % (info['compressed'], info['processed'], old_size, new_size,
+               100 - (100 * new_size // max(old_size, 1))))
+
+    def _report_progress(self, num_processed, last_hash):
+        self.stdout.write('Processed %d diffs (last hash %s)\n'
+                          % (num_processed, last_hash))
@@ -0,0 +1,62 @@
+from __future__ import unicode_literals
+
+import optparse
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from reviewboard.diffviewer.cache_warmer import warm_diffset_chunks
+from reviewboard.diffviewer.models import DiffSet
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        optparse.make_option('--days', type='int', dest='days', default=7,
+                             help='Only process diffs uploaded within this '
+                                  'many days (default 7)'),
+        optparse.make_option('--max-files', type='int', dest='max_files',
+                             default=0,
+                             help='The maximum number of files to process '
+                                  'per diff (default is no limit)'),
+        optparse.make_option('--no-interdiffs', action='store_false',
+                             dest='interdiffs', default=True,
+                             help="Don't generate interdiffs between "
+                                  "consecutive revisions"),
+    )
+    help = ('Pre-generates and caches the side-by-side diffs for recently '
+            'published diffs')
+    requires_model_validation = True
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        max_files = options['max_files']
+
+        diffsets = DiffSet.objects.filter(
+            history__isnull=False,
+            timestamp__gte=since).order_by('history', 'revision')
+
+        self.stdout.write('Processing %d diffs...\n' % diffsets.count())
+
+        prev_diffset = None
+        num_files = 0
+
+        for diffset in diffsets.iterator():
+            if (options['interdiffs'] and prev_diffset and
+                prev_diffset.history_id == diffset.history_id):
+                interdiffs = [(diffset, None), (prev_diffset, diffset)]
+            else:
+                interdiffs = [(diffset, None)]
+
+            for source_diffset, interdiffset in interdiffs:
+                try:
+                    num_files += warm_diffset_chunks(source_diffset,
+                                                     interdiffset,
+                                                     max_files)
+                except Exception as e:
+                    self.stderr.write('Unable to generate diffs for diffset '
+                                      '%s: %s\n' % (source_diffset.pk, e))
+
+            prev_diffset = diffset
+
+        self.stdout.write('Generated diffs for %d files.\n' % num_files)
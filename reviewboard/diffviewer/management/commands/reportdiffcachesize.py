@@ -0,0 +1,110 @@
+from __future__ import unicode_literals
+
+import optparse
+import time
+import zlib
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.six.moves import cPickle as pickle
+from djblets.cache.backend import CACHE_CHUNK_SIZE
+
+from reviewboard.diffviewer.chunk_generator import get_diff_chunk_generator
+from reviewboard.diffviewer.chunk_serializer import (deserialize_chunks,
+                                                     serialize_chunks)
+from reviewboard.diffviewer.models import FileDiff
+
+
+def _measure(data, load_func):
+    """Returns the cached size of data, and the time to load it.
+
+    This stores the data the same way cache_memoize does for large data
+    (pickled and zlib-compressed).
+    """
+    stored = zlib.compress(pickle.dumps(data))
+
+    start = time.time()
+    load_func(pickle.loads(zlib.decompress(stored)))
+
+    return len(stored), time.time() - start
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        optparse.make_option('--days', type='int', dest='days', default=7,
+                             help='Only process diffs uploaded within this '
+                                  'many days (default 7)'),
+        optparse.make_option('--max-files', type='int', dest='max_files',
+                             default=100,
+                             help='The maximum number of files to process '
+                                  '(default 100)'),
+    )
+    help = ('Reports the size of the cached side-by-side diffs for recent '
+            'files, comparing the compact cache format with the legacy '
+            'format')
+    requires_model_validation = True
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+
+        filediffs = (
+            FileDiff.objects
+            .filter(diffset__history__isnull=False,
+                    diffset__timestamp__gte=since,
+                    binary=False)
+            .exclude(status=FileDiff.DELETED)
+            .exclude(source_revision='')
+            .select_related('diffset', 'diffset__repository')
+            .order_by('-pk')[:options['max_files']])
+
+        num_files = 0
+        legacy_size = 0
+        legacy_items = 0
+        legacy_load_time = 0
+        compact_size = 0
+        compact_items = 0
+        compact_load_time = 0
+
+        for filediff in filediffs:
+            generator = get_diff_chunk_generator(None, filediff)
+
+            try:
+                chunks = list(generator._get_chunks_uncached())
+            except Exception as e:
+                self.stderr.write('Unable to generate diff for filediff '
+                                  '%s: %s\n' % (filediff.pk, e))
+                continue
+
+            size, load_time = _measure(chunks, lambda data: data)
+            legacy_size += size
+            legacy_items += size // CACHE_CHUNK_SIZE + 1
+            legacy_load_time += load_time
+
+            size, load_time = _measure(serialize_chunks(chunks),
+                                       deserialize_chunks)
+            compact_size += size
+            compact_items += size // CACHE_CHUNK_SIZE + 1
+            compact_load_time += load_time
+
+            num_files += 1
+
+        if not num_files:
+            self.stdout.write('No files to report on.\n')
+            return
+
+        self.stdout.write('Cache usage for %d files:\n\n' % num_files)
+        self.stdout.write('%-8s %14s %14s %14s\n'
+                          % ('Format', 'Size (bytes)', 'Cache items',
+                             'Load time (s)'))
+        self.stdout.write('%-8s %14d %14d %14.3f\n'
+                          % ('Legacy', legacy_size, legacy_items,
+                             legacy_load_time))
+        self.stdout.write('%-8s %14d %14d %14.3f\n'
+                          % ('Compact', compact_size, compact_items,
+                             compact_load_time))
+
+        if compact_size:
+            self.stdout.write('\nThe compact format is %.1f%% of the size '
+                              'of the legacy format.\n'
+                              % (100.0 * compact_size / legacy_size))
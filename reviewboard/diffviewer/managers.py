@@ -1,6 +1,8 @@
 from __future__ import unicode_literals
 
+import json
 import os
+import zlib
 
 from django.db import models
 from django.db.models import Q
@@ -73,16 +75,88 @@ class FileDiffDataManager(models.Manager):
     Sets the binary data to a Base64DecodedValue, so that Base64Field is
     forced to encode the data. This is a workaround to Base64Field checking
     if the object has been saved into the database using the pk.
+
+    New data is compressed, if that makes it smaller.
     """
     def get_or_create(self, *args, **kwargs):
+        from reviewboard.diffviewer.models import FileDiffData
+
         defaults = kwargs.get('defaults', {})
 
         if defaults and defaults['binary']:
-            defaults['binary'] = \
-                Base64DecodedValue(kwargs['defaults']['binary'])
+            data = defaults['binary']
+            compressed = zlib.compress(data)
+
+            if len(compressed) < len(data):
+                data = compressed
+
+                # JSONField expects serialized data when constructing.
+                defaults['extra_data'] = json.dumps({
+                    'compression': FileDiffData.COMPRESSION_ZLIB,
+                })
+
+            defaults['binary'] = Base64DecodedValue(data)
 
         return super(FileDiffDataManager, self).get_or_create(*args, **kwargs)
 
+    def compress_all(self, batch_size=100, start_after=None,
+                     progress_func=None):
+        """Compresses the data stored in existing FileDiffData.
+
+        Rows are processed in batches of batch_size, in order of their
+        hashes, so the whole table is never loaded at once. Processing
+        starts after the hash given in start_after, if any, which allows an
+        interrupted run to be resumed. Rows already compressed, or that
+        wouldn't be made smaller, are left alone.
+
+        After each batch, progress_func (if provided) is called with the
+        number of rows processed so far and the last hash processed.
+
+        This will return a dictionary with the result of the process.
+        """
+        queryset = self.order_by('pk')
+        last_pk = start_after
+        total_processed = 0
+        total_compressed = 0
+        old_size = 0
+        new_size = 0
+
+        while True:
+            if last_pk:
+                batch = queryset.filter(pk__gt=last_pk)
+            else:
+                batch = queryset
+
+            batch = list(batch[:batch_size])
+
+            if not batch:
+                break
+
+            for filediff_data in batch:
+                stored_size = len(filediff_data.get_binary_base64())
+                old_size += stored_size
+
+                if filediff_data.compress():
+                    filediff_data.save(update_fields=['binary', 'extra_data'])
+                    total_compressed += 1
+                    new_size += len(filediff_data.get_binary_base64())
+                else:
+                    new_size += stored_size
+
+            total_processed += len(batch)
+            last_pk = batch[-1].pk
+
+            if progress_func:
+                progress_func(total_processed, last_pk)
+
+        return {
+            'processed': total_processed,
+            'compressed': total_compressed,
+            'old_size': old_size,
+            'new_size': new_size,
+            'last_hash': last_pk,
+        }
+
 
 class DiffSetManager(models.Manager):
     """A custom manager for DiffSet objects.
@@ -154,13 +228,13 @@ class DiffSetManager(models.Manager):
             diff_file_contents, repository.get_encoding_list())
         parser = tool.get_parser(diff_text)
 
-        files = list(self._process_files(
+        files = self._process_files(
             parser,
             basedir,
             repository,
             base_commit_id,
             request,
-            check_existence=(not parent_diff_file_contents)))
+            check_existence=(not parent_diff_file_contents))
 
         # Parse the diff
         if len(files) == 0:
@@ -201,7 +275,7 @@ class DiffSetManager(models.Manager):
             basedir=basedir,
             history=diffset_history,
             repository=repository,
-            diffcompat=DiffCompatVersion.DEFAULT,
+            diffcompat=self._get_diff_compat_version(repository),
             base_commit_id=base_commit_id)
 
         if save:
@@ -245,9 +319,38 @@ class DiffSetManager(models.Manager):
 
         return diffset
 
+    def _get_diff_compat_version(self, repository):
+        """Returns the diff compatibility version for new diffs.
+
+        This is the version chosen for the repository, if any, or the
+        site-wide version otherwise.
+        """
+        compat_version = None
+
+        if repository.extra_data:
+            compat_version = repository.extra_data.get('diff_compat_version')
+
+        if compat_version is None:
+            siteconfig = SiteConfiguration.objects.get_current()
+            compat_version = siteconfig.get('diffviewer_diff_compat_version',
+                                            DiffCompatVersion.DEFAULT)
+
+        return compat_version
+
     def _process_files(self, parser, basedir, repository, base_commit_id,
                        request, check_existence=False, limit_to=None):
+        """Returns the files parsed from a diff.
+
+        The original filenames and revisions of the files are normalized.
+        If check_existence is True, the original versions of the files are
+        checked for existence in the repository. The checks are made
+        together through Repository.get_file_exists_many, which can check
+        several files at once. FileNotFoundError is raised for the first
+        missing file in the diff.
+        """
         tool = repository.get_scmtool()
+        files = []
+        files_to_check = []
 
         for f in parser.parse():
             f2, revision = tool.parse_diff_revision(f.origFile, f.origInfo,
@@ -264,21 +367,32 @@ class DiffSetManager(models.Manager):
                 continue
 
             # FIXME: this would be a good place to find permissions errors
-            if (revision != PRE_CREATION and
+            if (check_existence and
+                revision != PRE_CREATION and
                 revision != UNKNOWN and
                 not f.binary and
                 not f.deleted and
-                not f.moved and
-                (check_existence and
-                 not repository.get_file_exists(filename, revision,
-                                                base_commit_id=base_commit_id,
-                                                request=request))):
-                raise FileNotFoundError(filename, revision, base_commit_id)
+                not f.moved):
+                files_to_check.append((filename, revision))
 
             f.origFile = filename
             f.origInfo = revision
 
-            yield f
+            files.append(f)
+
+        if files_to_check:
+            exists_list = repository.get_file_exists_many(
+                files_to_check,
+                base_commit_id=base_commit_id,
+                request=request)
+
+            for (filename, revision), exists in zip(files_to_check,
+                                                    exists_list):
+                if not exists:
+                    raise FileNotFoundError(filename, revision,
+                                            base_commit_id)
+
+        return files
 
     def _compare_files(self, filename1, filename2):
         """
@@ -2,12 +2,13 @@ from __future__ import unicode_literals
 
 import hashlib
 import logging
+import zlib
 
 from django.db import models
 from django.utils import timezone
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
-from djblets.db.fields import Base64Field, JSONField
+from djblets.db.fields import Base64DecodedValue, Base64Field, JSONField
 
 from reviewboard.diffviewer.managers import (FileDiffDataManager,
                                              FileDiffManager,
@@ -21,13 +22,65 @@ class FileDiffData(models.Model):
     Contains hash and base64 pairs.
 
     These pairs are used to reduce diff database storage.
+
+    The stored data may be compressed, which is recorded in the
+    ``compression`` key in extra_data. Use the content property to get the
+    diff itself, rather than binary.
     """
+    COMPRESSION_ZLIB = 'zlib'
+
     binary_hash = models.CharField(_("hash"), max_length=40, primary_key=True)
     binary = Base64Field(_("base64"))
     objects = FileDiffDataManager()
 
     extra_data = JSONField(null=True)
 
+    @property
+    def compression(self):
+        """The compression used for the stored data, or None."""
+        return self.extra_data.get('compression')
+
+    @property
+    def content(self):
+        """The diff data, decompressed if needed.
+
+        The result is kept on the instance, so that the data is only
+        decoded once.
+        """
+        stored = self.get_binary_base64()
+
+        if getattr(self, '_content_stored', None) is not stored:
+            data = self.binary
+
+            if self.compression == self.COMPRESSION_ZLIB:
+                data = zlib.decompress(data)
+
+            self._content = data
+            self._content_stored = stored
+
+        return self._content
+
+    def compress(self):
+        """Compresses the stored data, if not already compressed.
+
+        The data is only compressed if that makes it smaller. Returns
+        whether the stored data was changed. The caller is responsible for
+        saving.
+        """
+        if self.compression:
+            return False
+
+        data = self.binary
+        compressed = zlib.compress(data)
+
+        if len(compressed) >= len(data):
+            return False
+
+        self.binary = Base64DecodedValue(compressed)
+        self.extra_data['compression'] = self.COMPRESSION_ZLIB
+
+        return True
+
     @property
     def insert_count(self):
         return self.extra_data.get('insert_count')
@@ -53,7 +106,7 @@ class FileDiffData(models.Model):
         logging.debug('Recalculating insert/delete line counts on '
                       'FileDiffData %s' % self.pk)
 
-        files = tool.get_parser(self.binary).parse()
+        files = tool.get_parser(self.content).parse()
 
         if len(files) != 1:
             logging.error('Failed to correctly parse stored diff data in '
@@ -133,7 +186,7 @@ class FileDiff(models.Model):
         if not self.diff_hash:
             self._migrate_diff_data()
 
-        return self.diff_hash.binary
+        return self.diff_hash.content
 
     def _set_diff(self, diff):
         hashkey = self._hash_hexdigest(diff)
@@ -152,7 +205,7 @@ class FileDiff(models.Model):
             self._migrate_diff_data()
 
         if self.parent_diff_hash:
-            return self.parent_diff_hash.binary
+            return self.parent_diff_hash.content
         else:
             return None
 
@@ -1,5 +1,7 @@
 from __future__ import unicode_literals
 
+from array import array
+
 from djblets.util.compat.six.moves import range
 
 from reviewboard.diffviewer.differ import Differ, DiffCompatVersion
@@ -706,3 +708,321 @@ class MyersDiffer(Differ):
             result *= 2
 
         return result
+
+
+class ArrayMyersDiffer(MyersDiffer):
+    """A faster variant of MyersDiffer for large files.
+
+    This produces the same opcodes as MyersDiffer. The search vectors are
+    stored in arrays of machine integers indexed directly by diagonal, and
+    the hot loops of the Shortest Middle Snake search work on local
+    references rather than attribute lookups.
+
+    This is most noticeable on big files with many changes, where nearly
+    all the time is spent in the snake search.
+    """
+    def _gen_diff_data(self):
+        if self.a_data and self.b_data:
+            return
+
+        self.a_data = self.DiffData(self._gen_diff_codes(self.a, False))
+        self.b_data = self.DiffData(self._gen_diff_codes(self.b, True))
+
+        self._discard_confusing_lines()
+
+        self.max_lines = (self.a_data.undiscarded_lines +
+                          self.b_data.undiscarded_lines + 3)
+
+        # The diagonals are indexed directly by k. Negative diagonals wrap
+        # around to the end of the vectors, which are large enough that
+        # they never overlap the positive ones.
+        vector_size = (self.a_data.undiscarded_lines +
+                       self.b_data.undiscarded_lines + 3)
+        self.fdiag = array(str('l'), [0]) * vector_size
+        self.bdiag = array(str('l'), [0]) * vector_size
+        self.downoff = self.upoff = 0
+
+        self._lcs(0, self.a_data.undiscarded_lines,
+                  0, self.b_data.undiscarded_lines,
+                  self.minimal_diff)
+        self._shift_chunks(self.a_data, self.b_data)
+        self._shift_chunks(self.b_data, self.a_data)
+
+    def _gen_diff_codes(self, lines, is_modified_file):
+        """
+        Converts all unique lines of text into unique numbers.
+
+        This is the same as MyersDiffer._gen_diff_codes, with the lookups
+        hoisted out of the loop.
+        """
+        code_table = self.code_table
+        interesting_line_table = self.interesting_line_table
+        interesting_line_regexes = self.interesting_line_regexes
+        ignore_space = self.ignore_space
+        codes = []
+
+        if is_modified_file:
+            interesting_lines = self.interesting_lines[1]
+        else:
+            interesting_lines = self.interesting_lines[0]
+
+        for linenum, raw_line in enumerate(lines):
+            stripped_line = raw_line.lstrip()
+
+            # We still want to show lines that contain only whitespace.
+            if ignore_space and stripped_line:
+                line = stripped_line
+            else:
+                line = raw_line
+
+            code = code_table.get(line)
+
+            if code is None:
+                self.last_code += 1
+                code = self.last_code
+                code_table[line] = code
+                interesting_line_name = None
+
+                if stripped_line:
+                    for name, regex in interesting_line_regexes:
+                        if regex.match(raw_line):
+                            interesting_line_name = name
+                            interesting_line_table[code] = name
+                            break
+            else:
+                interesting_line_name = interesting_line_table.get(code)
+
+            if interesting_line_name:
+                interesting_lines[interesting_line_name].append(
+                    (linenum, raw_line))
+
+            codes.append(code)
+
+        return codes
+
+    def _find_sms(self, a_lower, a_upper, b_lower, b_upper, find_minimal):
+        """
+        Finds the Shortest Middle Snake.
+
+        This is the same search as MyersDiffer._find_sms, with all state
+        held in local variables.
+        """
+        a = self.a_data.undiscarded
+        b = self.b_data.undiscarded
+        down_vector = self.fdiag
+        up_vector = self.bdiag
+        snake_limit = self.SNAKE_LIMIT
+        max_lines = self.max_lines
+        cost_bail = (self.compat_version >=
+                     DiffCompatVersion.MYERS_SMS_COST_BAIL)
+
+        down_k = a_lower - b_lower
+        up_k = a_upper - b_upper
+        odd_delta = (down_k - up_k) % 2 != 0
+
+        down_vector[down_k] = a_lower
+        up_vector[up_k] = a_upper
+
+        dmin = a_lower - b_upper
+        dmax = a_upper - b_lower
+
+        down_min = down_max = down_k
+        up_min = up_max = up_k
+
+        cost = 0
+        max_cost = max(256, self._very_approx_sqrt(max_lines * 4))
+
+        while True:
+            cost += 1
+            big_snake = False
+
+            if down_min > dmin:
+                down_min -= 1
+                down_vector[down_min - 1] = -1
+            else:
+                down_min += 1
+
+            if down_max < dmax:
+                down_max += 1
+                down_vector[down_max + 1] = -1
+            else:
+                down_max -= 1
+
+            # Extend the forward path
+            for k in range(down_max, down_min - 1, -2):
+                tlo = down_vector[k - 1]
+                thi = down_vector[k + 1]
+
+                if tlo >= thi:
+                    x = tlo + 1
+                else:
+                    x = thi
+
+                y = x - k
+                old_x = x
+
+                while x < a_upper and y < b_upper and a[x] == b[y]:
+                    x += 1
+                    y += 1
+
+                if (odd_delta and up_min <= k <= up_max and
+                        up_vector[k] <= x):
+                    return x, y, True, True
+
+                if x - old_x > snake_limit:
+                    big_snake = True
+
+                down_vector[k] = x
+
+            # Extend the reverse path
+            if up_min > dmin:
+                up_min -= 1
+                up_vector[up_min - 1] = max_lines
+            else:
+                up_min += 1
+
+            if up_max < dmax:
+                up_max += 1
+                up_vector[up_max + 1] = max_lines
+            else:
+                up_max -= 1
+
+            for k in range(up_max, up_min - 1, -2):
+                tlo = up_vector[k - 1]
+                thi = up_vector[k + 1]
+
+                if tlo < thi:
+                    x = tlo
+                else:
+                    x = thi - 1
+
+                y = x - k
+                old_x = x
+
+                while x > a_lower and y > b_lower and a[x - 1] == b[y - 1]:
+                    x -= 1
+                    y -= 1
+
+                if (not odd_delta and down_min <= k <= down_max and
+                        x <= down_vector[k]):
+                    return x, y, True, True
+
+                if old_x - x > snake_limit:
+                    big_snake = True
+
+                up_vector[k] = x
+
+            if find_minimal:
+                continue
+
+            if cost > 200 and big_snake:
+                ret_x, ret_y, best = self._find_diagonal(
+                    down_min, down_max, down_k, 0, 0, down_vector,
+                    lambda x: x - a_lower,
+                    lambda x: a_lower + snake_limit <= x < a_upper,
+                    lambda y: b_lower + snake_limit <= y < b_upper,
+                    lambda i, k: i - k,
+                    1, cost)
+
+                if best > 0:
+                    return ret_x, ret_y, True, False
+
+                ret_x, ret_y, best = self._find_diagonal(
+                    up_min, up_max, up_k, best, 0, up_vector,
+                    lambda x: a_upper - x,
+                    lambda x: a_lower < x <= a_upper - snake_limit,
+                    lambda y: b_lower < y <= b_upper - snake_limit,
+                    lambda i, k: i + k,
+                    0, cost)
+
+                if best > 0:
+                    return ret_x, ret_y, False, True
+
+            if cost >= max_cost and cost_bail:
+                fx_best = bx_best = 0
+
+                # Find the forward diagonal that maximized x + y
+                fxy_best = -1
+                for d in range(down_max, down_min - 1, -2):
+                    x = min(down_vector[d], a_upper)
+                    y = x - d
+
+                    if b_upper < y:
+                        x = b_upper + d
+                        y = b_upper
+
+                    if fxy_best < x + y:
+                        fxy_best = x + y
+                        fx_best = x
+
+                # Find the backward diagonal that minimizes x + y
+                bxy_best = max_lines
+                for d in range(up_max, up_min - 1, -2):
+                    x = max(a_lower, up_vector[d])
+                    y = x - d
+
+                    if y < b_lower:
+                        x = b_lower + d
+                        y = b_lower
+
+                    if x + y < bxy_best:
+                        bxy_best = x + y
+                        bx_best = x
+
+                # Use the better of the two diagonals
+                if (a_upper + b_upper - bxy_best <
+                        fxy_best - (a_lower + b_lower)):
+                    return fx_best, fxy_best - fx_best, True, False
+                else:
+                    return bx_best, bxy_best - bx_best, False, True
+
+    def _lcs(self, a_lower, a_upper, b_lower, b_upper, find_minimal):
+        """
+        The divide-and-conquer implementation of the Longest Common
+        Subsequence (LCS) algorithm.
+
+        This is the same as MyersDiffer._lcs, but walks the remaining
+        ranges in a loop instead of recursing on the upper half.
+        """
+        a = self.a_data.undiscarded
+        b = self.b_data.undiscarded
+        a_modified = self.a_data.modified
+        b_modified = self.b_data.modified
+        a_real_indexes = self.a_data.real_indexes
+        b_real_indexes = self.b_data.real_indexes
+
+        while True:
+            # Fast walkthrough equal lines at the start
+            while (a_lower < a_upper and b_lower < b_upper and
+                   a[a_lower] == b[b_lower]):
+                a_lower += 1
+                b_lower += 1
+
+            while (a_upper > a_lower and b_upper > b_lower and
+                   a[a_upper - 1] == b[b_upper - 1]):
+                a_upper -= 1
+                b_upper -= 1
+
+            if a_lower == a_upper:
+                # Inserted lines.
+                for i in range(b_lower, b_upper):
+                    b_modified[b_real_indexes[i]] = True
+
+                return
+            elif b_lower == b_upper:
+                # Deleted lines
+                for i in range(a_lower, a_upper):
+                    a_modified[a_real_indexes[i]] = True
+
+                return
+
+            # Find the middle snake and length of an optimal path for A and B
+            x, y, low_minimal, high_minimal = \
+                self._find_sms(a_lower, a_upper, b_lower, b_upper,
+                               find_minimal)
+
+            self._lcs(a_lower, x, b_lower, y, low_minimal)
+
+            a_lower = x
+            b_lower = y
+            find_minimal = high_minimal
@@ -1,7 +1,9 @@
 from __future__ import unicode_literals
 
+import logging
 import re
 
+from djblets.log import log_timed
 from djblets.util.compat import six
 from djblets.util.compat.six.moves import range
 
@@ -16,6 +18,15 @@ class DiffOpcodeGenerator(object):
     MOVE_PREFERRED_MIN_LINES = 2
     MOVE_MIN_LINE_LENGTH = 20
 
+    # Inserted lines matching more removed lines than this (closing braces,
+    # common statements, etc.) can only continue existing move ranges,
+    # rather than starting new ones.
+    MOVE_MAX_CANDIDATES = 100
+
+    # The maximum number of removed lines compared against inserted lines
+    # for a file, before giving up on finding any further moves.
+    MOVE_MAX_WORK = 1000000
+
     def __init__(self, differ, filediff=None, interfilediff=None):
         self.differ = differ
         self.filediff = filediff
@@ -36,11 +47,23 @@ class DiffOpcodeGenerator(object):
         self.inserts = []
 
         self._precompute_opcodes()
+
+        log_timer = log_timed('Computing moves for %s' % self._get_log_name())
         self._compute_moves()
+        log_timer.done()
 
         for opcodes in self.groups:
             yield opcodes
 
+    def _get_log_name(self):
+        if self.interfilediff:
+            return 'interdiff of filediffs %s and %s' % (
+                self.filediff.pk, self.interfilediff.pk)
+        elif self.filediff:
+            return 'filediff %s' % self.filediff.pk
+        else:
+            return 'diff'
+
     def _apply_processors(self, opcodes):
         if self.interfilediff:
             # Filter out any lines unrelated to these changes from the
@@ -115,9 +138,22 @@ class DiffOpcodeGenerator(object):
         # The algorithm will be documented as we go in the code.
         #
         # We start by looping through all the inserted groups.
+        #
+        # Each removed line compared against an inserted line counts
+        # towards move_work. If this goes over MOVE_MAX_WORK, the file is
+        # too large or repetitive for us to look for moves in a reasonable
+        # amount of time, and we stop with the moves found so far.
+        self.move_work = 0
+
         for insert in self.inserts:
             self._compute_move_for_insert(*insert)
 
+            if self.move_work > self.MOVE_MAX_WORK:
+                logging.debug('Stopped computing moves for %s after %d '
+                              'line comparisons',
+                              self._get_log_name(), self.move_work)
+                break
+
     def _compute_move_for_insert(self, itag, ii1, ii2, ij1, ij2, imeta):
         # Store some state on the range we'll be working with inside this
         # insert group.
@@ -150,7 +186,36 @@ class DiffOpcodeGenerator(object):
 
             updated_range = False
 
-            if iline and iline in self.removes:
+            if self.move_work > self.MOVE_MAX_WORK:
+                return
+
+            candidates = iline and self.removes.get(iline)
+
+            if candidates and len(candidates) > self.MOVE_MAX_CANDIDATES:
+                # This line matches too many removed lines to be worth
+                # trying each as the start of a new move range. Instead,
+                # we only look at the move ranges we've already found, and
+                # extend any where the next removed line matches this one.
+                #
+                # This avoids the cost of scanning every candidate for very
+                # common lines, which would otherwise make this quadratic.
+                self.move_work += len(r_move_ranges)
+                prev_key = '%s-%s-%s-%s' % candidates[-1][1][1:5]
+
+                for key, r_move_range in list(six.iteritems(r_move_ranges)):
+                    r_start, r_end, rgroup = r_move_range
+                    ri = r_end + 1
+
+                    # Removed lines are only matched within the range's own
+                    # remove group, as with the candidates below.
+                    if ri < rgroup[2] and self.differ.a[ri].strip() == iline:
+                        r_move_ranges[key] = (r_start, ri, rgroup)
+                        updated_range = True
+
+                if not updated_range and r_move_ranges:
+                    # See below.
+                    i_move_cur -= 1
+            elif candidates:
                 # The inserted line at this location has a corresponding
                 # removed line.
                 #
@@ -166,7 +231,9 @@ class DiffOpcodeGenerator(object):
                 #
                 # If there isn't any move information for this line, we'll
                 # simply add it to the move ranges.
-                for ri, rgroup in self.removes.get(iline, []):
+                self.move_work += len(candidates)
+
+                for ri, rgroup in candidates:
                     key = '%s-%s-%s-%s' % rgroup[1:5]
                     prev_key = key
 
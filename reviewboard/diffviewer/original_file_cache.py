@@ -0,0 +1,128 @@
+from __future__ import unicode_literals
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from djblets.siteconfig.models import SiteConfiguration
+
+from reviewboard.scmtools.core import HEAD, PRE_CREATION
+
+
+class OriginalFileCache(object):
+    """An in-memory LRU cache of original files used in diffs.
+
+    Building the original version of a file for a diff requires fetching it
+    from the repository, normalizing its line endings, and applying any
+    parent diff. This cache stores the result, so that the work is only done
+    once per source file state, rather than once for every diff or interdiff
+    that file appears in.
+
+    The cache is per-process and bounded by the total size of the stored
+    files. When it's full, the least recently used files are evicted.
+    """
+    def __init__(self, max_size=0):
+        self.max_size = max_size
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached file for a key, or None if not cached."""
+        with self._lock:
+            data = self._entries.pop(key, None)
+
+            if data is not None:
+                # Move it to the end, marking it as recently used.
+                self._entries[key] = data
+
+            return data
+
+    def set(self, key, data):
+        """Stores a file in the cache.
+
+        Least recently used files are evicted to make room. Files larger
+        than the cache itself are not stored.
+        """
+        if len(data) > self.max_size:
+            return
+
+        with self._lock:
+            old_data = self._entries.pop(key, None)
+
+            if old_data is not None:
+                self.size -= len(old_data)
+
+            while self._entries and self.size + len(data) > self.max_size:
+                evicted_key, evicted_data = self._entries.popitem(last=False)
+                self.size -= len(evicted_data)
+
+            self._entries[key] = data
+            self.size += len(data)
+
+    def clear(self):
+        """Removes all files from the cache."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def make_original_file_key(filediff, encoding_list):
+    """Returns the cache key for the original version of a file in a diff.
+
+    The key covers everything that affects the result: the repository, path,
+    revision, base commit, the parent diff, and the encodings used to
+    normalize the file.
+
+    None is returned if the file shouldn't be cached. This is the case for
+    HEAD revisions, which can change over time, and for new files without a
+    parent diff, which are empty.
+    """
+    if filediff.source_revision == HEAD:
+        return None
+
+    parent_diff_hash = None
+
+    if filediff.parent_diff_hash_id:
+        parent_diff_hash = filediff.parent_diff_hash_id
+    elif filediff.parent_diff:
+        parent_diff_hash = hashlib.sha1(filediff.parent_diff).hexdigest()
+    elif filediff.source_revision == PRE_CREATION:
+        return None
+
+    diffset = filediff.diffset
+
+    return (diffset.repository_id,
+            filediff.source_file,
+            filediff.source_revision,
+            diffset.base_commit_id,
+            parent_diff_hash,
+            tuple(encoding_list))
+
+
+_original_file_cache = None
+
+
+def get_original_file_cache():
+    """Returns the OriginalFileCache for this process.
+
+    The size of the cache is kept in sync with the
+    ``diffviewer_original_file_cache_size`` setting.
+    """
+    global _original_file_cache
+
+    siteconfig = SiteConfiguration.objects.get_current()
+    max_size = siteconfig.get('diffviewer_original_file_cache_size')
+
+    if _original_file_cache is None:
+        _original_file_cache = OriginalFileCache(max_size)
+    elif _original_file_cache.max_size != max_size:
+        _original_file_cache.max_size = max_size
+
+        if max_size < _original_file_cache.size:
+            _original_file_cache.clear()
+
+    return _original_file_cache
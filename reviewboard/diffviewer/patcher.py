@@ -0,0 +1,372 @@
+"""An in-process applier for unified diffs.
+
+This applies a single-file unified diff to a file's contents without
+spawning a :command:`patch` process. It follows the rules GNU patch uses to
+locate hunks (including line offsets and fuzz), so that the results are
+identical to those produced by :command:`patch`.
+
+Anything that this can't handle (context diffs, multi-file diffs, hunks that
+don't apply) raises :py:class:`PatchError`, and the caller is expected to
+fall back on :command:`patch`.
+"""
+from __future__ import unicode_literals
+
+import re
+
+
+# The maximum fuzz factor tried when locating a hunk. This matches the
+# default used by GNU patch.
+MAX_FUZZ = 2
+
+HUNK_HEADER_RE = re.compile(br'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+# Lines that mark the start of another file's diff. These aren't supported,
+# since only one file is being patched.
+FILE_HEADER_PREFIXES = (b'--- ', b'+++ ', b'*** ', b'diff ', b'Index: ')
+
+
+class PatchError(Exception):
+    """The diff couldn't be applied in-process."""
+    pass
+
+
+class Hunk(object):
+    """A hunk in a unified diff.
+
+    The lines are stored as a list of ``(op, line)`` tuples, where ``op`` is
+    one of ``' '``, ``'-'`` or ``'+'``, and ``line`` includes its newline
+    (unless it's marked as having no newline at the end of the file).
+    """
+    def __init__(self, old_start, old_count, new_start, new_count):
+        self.old_start = old_start
+        self.old_count = old_count
+        self.new_start = new_start
+        self.new_count = new_count
+        self.lines = []
+
+    @property
+    def first(self):
+        """The 1-based line number the hunk is expected to apply at.
+
+        Hunks that don't remove or keep any lines append after the
+        old starting line, as in GNU patch.
+        """
+        if self.old_count == 0:
+            return self.old_start + 1
+        else:
+            return self.old_start
+
+    def finalize(self):
+        """Computes the pattern and context information for the hunk."""
+        self.pattern = [
+            line
+            for op, line in self.lines
+            if op != b'+'
+        ]
+
+        self.prefix_context = 0
+
+        for op, line in self.lines:
+            if op != b' ':
+                break
+
+            self.prefix_context += 1
+
+        self.suffix_context = 0
+
+        for op, line in reversed(self.lines):
+            if op != b' ':
+                break
+
+            self.suffix_context += 1
+
+        if self.prefix_context == len(self.lines):
+            # There are no changes in this hunk, so it's all prefix context.
+            self.suffix_context = 0
+
+        self.context = max(self.prefix_context, self.suffix_context)
+
+
+def split_lines(data):
+    """Splits data into lines, keeping the trailing newlines."""
+    lines = data.split(b'\n')
+
+    if lines[-1] == b'':
+        lines.pop()
+        return [line + b'\n' for line in lines]
+    else:
+        last = lines.pop()
+        return [line + b'\n' for line in lines] + [last]
+
+
+def parse_hunks(diff):
+    """Parses the hunks out of a single-file unified diff.
+
+    Any headers before the first hunk are skipped. A PatchError is raised
+    if no hunks are found, if the hunks are malformed, or if the diff
+    appears to cover more than one file.
+    """
+    hunks = []
+    lines = split_lines(diff)
+    num_lines = len(lines)
+    i = 0
+
+    # Skip past the headers.
+    while i < num_lines and not lines[i].startswith(b'@@ '):
+        i += 1
+
+    while i < num_lines:
+        line = lines[i]
+
+        if not line.startswith(b'@@ '):
+            if hunks and line.startswith(FILE_HEADER_PREFIXES):
+                raise PatchError('The diff contains more than one file')
+
+            # GNU patch ignores anything else between or after the hunks.
+            i += 1
+            continue
+
+        m = HUNK_HEADER_RE.match(line)
+
+        if not m:
+            raise PatchError('Malformed hunk header on line %d' % (i + 1))
+
+        old_start, old_count, new_start, new_count = m.groups()
+        hunk = Hunk(int(old_start),
+                    int(old_count or 1),
+                    int(new_start),
+                    int(new_count or 1))
+        old_left = hunk.old_count
+        new_left = hunk.new_count
+        i += 1
+
+        while old_left > 0 or new_left > 0:
+            if i >= num_lines:
+                raise PatchError('Unexpected end of diff in hunk')
+
+            line = lines[i]
+            op = line[:1]
+
+            if op == b'\n':
+                # Some tools strip the trailing whitespace from empty
+                # context lines.
+                op = b' '
+                line = b' \n'
+
+            if op == b' ':
+                old_left -= 1
+                new_left -= 1
+            elif op == b'-':
+                old_left -= 1
+            elif op == b'+':
+                new_left -= 1
+            elif op == b'\\' and hunk.lines:
+                _strip_newline(hunk)
+                i += 1
+                continue
+            else:
+                raise PatchError('Unexpected line %d in hunk' % (i + 1))
+
+            if old_left < 0 or new_left < 0:
+                raise PatchError('Hunk ending on line %d is longer than '
+                                 'its header states' % (i + 1))
+
+            hunk.lines.append((op, line[1:]))
+            i += 1
+
+        # The last line of the hunk may be followed by a
+        # "\ No newline at end of file" marker.
+        if i < num_lines and lines[i].startswith(b'\\'):
+            _strip_newline(hunk)
+            i += 1
+
+        hunk.finalize()
+        hunks.append(hunk)
+
+    if not hunks:
+        raise PatchError('No unified diff hunks were found')
+
+    return hunks
+
+
+def _strip_newline(hunk):
+    """Strips the newline from the last line in a hunk.
+
+    This handles the "\\ No newline at end of file" marker.
+    """
+    op, line = hunk.lines[-1]
+
+    if line.endswith(b'\n'):
+        hunk.lines[-1] = (op, line[:-1])
+
+
+class Patcher(object):
+    """Applies the hunks from a unified diff to a list of lines.
+
+    This mirrors the hunk placement logic of GNU patch. Each hunk is first
+    tried where the diff says it belongs (adjusted by the offset of the
+    previous hunk), and then at increasing distances before and after that
+    point. If that fails, the hunk is tried again ignoring up to
+    :py:data:`MAX_FUZZ` lines of context on each end.
+    """
+    def __init__(self, lines):
+        self.lines = lines
+        self.offset = 0
+        self.last_frozen_line = 0
+
+    def apply(self, hunks):
+        """Applies the hunks, returning the resulting list of lines."""
+        result = []
+
+        for hunk in hunks:
+            where = 0
+
+            for fuzz in range(min(MAX_FUZZ, hunk.context) + 1):
+                where = self._locate_hunk(hunk, fuzz)
+
+                if where:
+                    break
+
+            if not where:
+                raise PatchError('Hunk at line %d failed to apply'
+                                 % hunk.old_start)
+
+            # Lines from the file are only copied up to each change, so
+            # context lines (including any ignored due to fuzz) are kept
+            # as they are in the file, and the trailing context can be
+            # shared with the next hunk.
+            pos = where - 1
+
+            for op, line in hunk.lines:
+                if op == b' ':
+                    pos += 1
+                elif op == b'-':
+                    self._copy_till(result, pos)
+                    self.last_frozen_line += 1
+                    pos += 1
+                else:
+                    self._copy_till(result, pos)
+                    result.append(line)
+
+        result.extend(self.lines[self.last_frozen_line:])
+
+        return result
+
+    def _copy_till(self, result, line_num):
+        """Copies lines from the file up to (but not including) a line.
+
+        line_num is a 0-based index into the file's lines.
+        """
+        if self.last_frozen_line > line_num:
+            raise PatchError('Misordered hunks')
+
+        result.extend(self.lines[self.last_frozen_line:line_num])
+        self.last_frozen_line = line_num
+
+    def _locate_hunk(self, hunk, fuzz):
+        """Returns the 1-based line number where a hunk applies.
+
+        This returns 0 if the hunk can't be applied at the given fuzz
+        factor. It's a port of ``locate_hunk`` from GNU patch.
+        """
+        first_guess = hunk.first + self.offset
+        pat_lines = len(hunk.pattern)
+        input_lines = len(self.lines)
+        prefix_fuzz = fuzz + hunk.prefix_context - hunk.context
+        suffix_fuzz = fuzz + hunk.suffix_context - hunk.context
+        max_where = input_lines - (pat_lines - suffix_fuzz) + 1
+        min_where = self.last_frozen_line + 1
+        max_pos_offset = max_where - first_guess
+        max_neg_offset = first_guess - min_where
+        max_offset = max(max_pos_offset, max_neg_offset)
+
+        if not pat_lines:
+            # An empty pattern always matches.
+            return first_guess
+
+        # Don't try lines <= 0.
+        if first_guess <= max_neg_offset:
+            max_neg_offset = first_guess - 1
+
+        if prefix_fuzz < 0 and hunk.first <= 1:
+            # This can only match the start of the file.
+            if (suffix_fuzz < 0 and
+                (pat_lines != input_lines or
+                 hunk.prefix_context < self.last_frozen_line)):
+                # This can only match the entire file.
+                return 0
+
+            offset = 1 - first_guess
+
+            if (self.last_frozen_line <= hunk.prefix_context and
+                offset <= max_pos_offset and
+                self._matches(hunk, first_guess + offset, 0,
+                              max(suffix_fuzz, 0))):
+                self.offset += offset
+                return first_guess + offset
+            else:
+                return 0
+        elif prefix_fuzz < 0:
+            prefix_fuzz = 0
+
+        if suffix_fuzz < 0:
+            # This can only match the end of the file.
+            offset = first_guess - (input_lines - pat_lines + 1)
+
+            if (offset <= max_neg_offset and
+                self._matches(hunk, first_guess - offset, prefix_fuzz, 0)):
+                self.offset -= offset
+                return first_guess - offset
+            else:
+                return 0
+
+        for offset in range(max_offset + 1):
+            if (offset <= max_pos_offset and
+                self._matches(hunk, first_guess + offset, prefix_fuzz,
+                              suffix_fuzz)):
+                self.offset += offset
+                return first_guess + offset
+
+            if (0 < offset <= max_neg_offset and
+                self._matches(hunk, first_guess - offset, prefix_fuzz,
+                              suffix_fuzz)):
+                self.offset -= offset
+                return first_guess - offset
+
+        return 0
+
+    def _matches(self, hunk, where, prefix_fuzz, suffix_fuzz):
+        """Returns whether the hunk's pattern matches at a line number.
+
+        The first prefix_fuzz and last suffix_fuzz lines of the pattern
+        are ignored.
+        """
+        pattern = hunk.pattern
+        start = where - 1 + prefix_fuzz
+        end = where - 1 + len(pattern) - suffix_fuzz
+
+        if start < 0 or end > len(self.lines):
+            return False
+
+        return (self.lines[start:end] ==
+                pattern[prefix_fuzz:len(pattern) - suffix_fuzz])
+
+
+def apply_patch(diff, data):
+    """Applies a single-file unified diff to the provided data.
+
+    Both the diff and the data are expected to have Unix line endings.
+
+    Raises PatchError if the diff isn't a unified diff this can handle, or
+    if any of its hunks fail to apply.
+    """
+    hunks = parse_hunks(diff)
+    lines = Patcher(split_lines(data)).apply(hunks)
+
+    # A line missing its newline only stays that way if it ends up at the
+    # end of the file.
+    for i, line in enumerate(lines[:-1]):
+        if not line.endswith(b'\n'):
+            lines[i] = line + b'\n'
+
+    return b''.join(lines)
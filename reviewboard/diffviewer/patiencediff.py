@@ -0,0 +1,183 @@
+from __future__ import unicode_literals
+
+from bisect import bisect_left
+
+from djblets.util.compat import six
+from djblets.util.compat.six.moves import range
+
+from reviewboard.diffviewer.differ import DiffCompatVersion
+from reviewboard.diffviewer.myersdiff import ArrayMyersDiffer, MyersDiffer
+
+
+class PatienceDiffer(MyersDiffer):
+    """An implementation of the Patience Diff algorithm.
+
+    Patience diff anchors the diff on lines that appear exactly once in
+    both files, keeping the longest sequence of them that appear in the
+    same order, and then recursively diffs the ranges between those lines.
+    Ranges without any unique lines are diffed with the Myers algorithm.
+
+    This tends to produce much cleaner diffs for large refactors, where
+    Myers matches up common lines (blank lines, braces, etc.) across
+    unrelated code and fragments the changes. The cleaner blocks of
+    inserted and deleted lines also make move detection more effective.
+    Since most lines in source files are unique, this runs in close to
+    linear time.
+
+    The results are post-processed and returned in the same way as in
+    MyersDiffer.
+    """
+    def _gen_diff_data(self):
+        """
+        Generate all the diff data needed to return opcodes or the diff ratio.
+        This is only called once during the liftime of a PatienceDiffer
+        instance.
+        """
+        if self.a_data and self.b_data:
+            return
+
+        self.a_data = self.DiffData(self._gen_diff_codes(self.a, False))
+        self.b_data = self.DiffData(self._gen_diff_codes(self.b, True))
+
+        self._patience_diff()
+        self._shift_chunks(self.a_data, self.b_data)
+        self._shift_chunks(self.b_data, self.a_data)
+
+    def _patience_diff(self):
+        """Marks the modified lines in both files."""
+        a = self.a_data.data
+        b = self.b_data.data
+        a_modified = self.a_data.modified
+        b_modified = self.b_data.modified
+        ranges = [(0, self.a_data.length, 0, self.b_data.length)]
+
+        while ranges:
+            a_lower, a_upper, b_lower, b_upper = ranges.pop()
+
+            # Skip past the equal lines at the start and end.
+            while (a_lower < a_upper and b_lower < b_upper and
+                   a[a_lower] == b[b_lower]):
+                a_lower += 1
+                b_lower += 1
+
+            while (a_upper > a_lower and b_upper > b_lower and
+                   a[a_upper - 1] == b[b_upper - 1]):
+                a_upper -= 1
+                b_upper -= 1
+
+            if a_lower == a_upper:
+                # Inserted lines.
+                for j in range(b_lower, b_upper):
+                    b_modified[j] = True
+            elif b_lower == b_upper:
+                # Deleted lines.
+                for i in range(a_lower, a_upper):
+                    a_modified[i] = True
+            else:
+                matches = self._find_unique_matches(a_lower, a_upper,
+                                                    b_lower, b_upper)
+
+                if matches:
+                    # Diff the ranges between each of the matched lines.
+                    for i, j in matches:
+                        ranges.append((a_lower, i, b_lower, j))
+                        a_lower = i + 1
+                        b_lower = j + 1
+
+                    ranges.append((a_lower, a_upper, b_lower, b_upper))
+                else:
+                    self._myers_diff(a_lower, a_upper, b_lower, b_upper)
+
+    def _find_unique_matches(self, a_lower, a_upper, b_lower, b_upper):
+        """Returns the anchoring lines for a range of the files.
+
+        This finds the lines that appear exactly once in each range, and
+        returns the longest sequence of them that appear in the same order
+        in both, as a list of (a_index, b_index) tuples.
+        """
+        a = self.a_data.data
+        b = self.b_data.data
+
+        # Maps each line code to [a_count, a_index, b_count, b_index].
+        lines = {}
+
+        for i in range(a_lower, a_upper):
+            info = lines.get(a[i])
+
+            if info is None:
+                lines[a[i]] = [1, i, 0, 0]
+            else:
+                info[0] += 1
+
+        for j in range(b_lower, b_upper):
+            info = lines.get(b[j])
+
+            if info is not None:
+                info[2] += 1
+                info[3] = j
+
+        unique = sorted(
+            (info[3], info[1])
+            for info in six.itervalues(lines)
+            if info[0] == 1 and info[2] == 1
+        )
+
+        return self._longest_increasing_sequence(unique)
+
+    def _longest_increasing_sequence(self, pairs):
+        """Returns the longest sequence of lines in order in both files.
+
+        pairs is a list of (b_index, a_index) tuples sorted by b_index. The
+        result is a list of (a_index, b_index) tuples, using patience
+        sorting.
+        """
+        # The smallest a_index ending a sequence of each length, the
+        # index into pairs for it, and a back-reference to the previous
+        # pair for each pair.
+        tails = []
+        tail_indexes = []
+        prev = [None] * len(pairs)
+
+        for n, (j, i) in enumerate(pairs):
+            pos = bisect_left(tails, i)
+
+            if pos > 0:
+                prev[n] = tail_indexes[pos - 1]
+
+            if pos == len(tails):
+                tails.append(i)
+                tail_indexes.append(n)
+            else:
+                tails[pos] = i
+                tail_indexes[pos] = n
+
+        result = []
+
+        if tail_indexes:
+            n = tail_indexes[-1]
+
+            while n is not None:
+                j, i = pairs[n]
+                result.append((i, j))
+                n = prev[n]
+
+            result.reverse()
+
+        return result
+
+    def _myers_diff(self, a_lower, a_upper, b_lower, b_upper):
+        """Marks the modified lines in a range using the Myers algorithm."""
+        differ = ArrayMyersDiffer(
+            self.a[a_lower:a_upper],
+            self.b[b_lower:b_upper],
+            ignore_space=self.ignore_space,
+            compat_version=DiffCompatVersion.MYERS_SMS_COST_BAIL)
+        differ._gen_diff_data()
+
+        for data, lower, modified in ((differ.a_data, a_lower,
+                                       self.a_data.modified),
+                                      (differ.b_data, b_lower,
+                                       self.b_data.modified)):
+            for i, is_modified in six.iteritems(data.modified):
+                if is_modified:
+                    modified[lower + i] = True
@@ -2,27 +2,49 @@ from __future__ import unicode_literals
 
 import imp
 import os
+import random
+import zlib
 
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.http import HttpResponse
-from djblets.cache.backend import cache_memoize
+from django.utils.safestring import SafeText, mark_safe
+from djblets.cache.backend import cache_memoize, make_cache_key
+from djblets.db.fields import Base64DecodedValue
 from djblets.siteconfig.models import SiteConfiguration
+from djblets.util.compat import six
 from djblets.util.compat.six.moves import zip_longest
 from kgb import SpyAgency
 import nose
 
+import reviewboard.diffviewer.cache_warmer as cache_warmer
 import reviewboard.diffviewer.diffutils as diffutils
 import reviewboard.diffviewer.parser as diffparser
-from reviewboard.diffviewer.chunk_generator import DiffChunkGenerator
+from reviewboard.diffviewer.chunk_generator import (DiffChunkGenerator,
+                                                   get_diff_chunk_generator)
+from reviewboard.diffviewer.chunk_serializer import (CHUNKS_FORMAT_ID,
+                                                     CHUNKS_FORMAT_VERSION,
+                                                     ChunkFormatError,
+                                                     deserialize_chunks,
+                                                     serialize_chunks)
+from reviewboard.diffviewer.differ import DiffCompatVersion, get_differ
 from reviewboard.diffviewer.errors import UserVisibleError
 from reviewboard.diffviewer.forms import UploadDiffForm
-from reviewboard.diffviewer.models import DiffSet, FileDiff
-from reviewboard.diffviewer.myersdiff import MyersDiffer
+from reviewboard.diffviewer.models import DiffSet, FileDiff, FileDiffData
+from reviewboard.diffviewer.myersdiff import ArrayMyersDiffer, MyersDiffer
 from reviewboard.diffviewer.opcode_generator import get_diff_opcode_generator
+from reviewboard.diffviewer.original_file_cache import (
+    OriginalFileCache,
+    get_original_file_cache)
+from reviewboard.diffviewer.patcher import PatchError, apply_patch
+from reviewboard.diffviewer.patiencediff import PatienceDiffer
 from reviewboard.diffviewer.renderers import DiffRenderer
 from reviewboard.diffviewer.processors import (filter_interdiff_opcodes,
                                                merge_adjacent_chunks)
 from reviewboard.diffviewer.templatetags.difftags import highlightregion
+from reviewboard.scmtools.core import HEAD, PRE_CREATION
+from reviewboard.scmtools.errors import FileNotFoundError, SCMError
 from reviewboard.scmtools.models import Repository, Tool
 from reviewboard.testing import TestCase
 
@@ -55,6 +77,144 @@ class MyersDifferTest(TestCase):
         self.assertEquals(opcodes, expected)
 
 
+class ArrayMyersDifferTests(TestCase):
+    """Unit tests for ArrayMyersDiffer."""
+    PREFIX = os.path.join(os.path.dirname(__file__), 'testdata')
+
+    def test_get_differ(self):
+        """Testing get_differ with use_array_differ"""
+        self.assertTrue(isinstance(get_differ([], []), ArrayMyersDiffer))
+        self.assertFalse(isinstance(
+            get_differ([], [], use_array_differ=False),
+            ArrayMyersDiffer))
+
+    def test_matches_myers_differ_with_testdata(self):
+        """Testing ArrayMyersDiffer matches MyersDiffer on testdata"""
+        for filename in os.listdir(os.path.join(self.PREFIX, 'new_src')):
+            if filename.endswith('.pyc'):
+                continue
+
+            with open(os.path.join(self.PREFIX, 'orig_src', filename)) as f:
+                a = f.read().splitlines()
+
+            with open(os.path.join(self.PREFIX, 'new_src', filename)) as f:
+                b = f.read().splitlines()
+
+            self._compare_differs(a, b, filename=filename)
+
+    def test_matches_myers_differ_with_random_changes(self):
+        """Testing ArrayMyersDiffer matches MyersDiffer on random changes"""
+        rand = random.Random(0)
+
+        for i in range(20):
+            num_lines = rand.randint(0, 500)
+            num_unique = rand.randint(1, num_lines + 1)
+            a = [
+                '%sline %s' % (' ' * rand.randint(0, 2),
+                               rand.randint(0, num_unique))
+                for j in range(num_lines)
+            ]
+            b = []
+
+            for line in a:
+                r = rand.random()
+
+                if r < 0.1:
+                    continue
+                elif r < 0.2:
+                    b.append('changed %s' % line)
+                elif r < 0.3:
+                    b.append(line)
+                    b.append('line %s' % rand.randint(0, num_unique))
+                else:
+                    b.append(line)
+
+            self._compare_differs(a, b)
+
+    def _compare_differs(self, a, b, filename=''):
+        for compat_version in DiffCompatVersion.MYERS_VERSIONS:
+            for ignore_space in (False, True):
+                differs = []
+
+                for cls in (MyersDiffer, ArrayMyersDiffer):
+                    differ = cls(a, b, ignore_space=ignore_space,
+                                 compat_version=compat_version)
+                    differ.add_interesting_lines_for_headers(filename)
+                    differs.append(differ)
+
+                self.assertEqual(list(differs[1].get_opcodes()),
+                                 list(differs[0].get_opcodes()))
+                self.assertEqual(differs[1].interesting_lines,
+                                 differs[0].interesting_lines)
+
+
+class PatienceDifferTests(TestCase):
+    """Unit tests for PatienceDiffer."""
+    def test_get_differ(self):
+        """Testing get_differ with DiffCompatVersion.PATIENCE"""
+        self.assertTrue(isinstance(
+            get_differ([], [], compat_version=DiffCompatVersion.PATIENCE),
+            PatienceDiffer))
+
+    def test_moved_function(self):
+        """Testing PatienceDiffer with a moved function"""
+        func1 = ['def func1():', '    a = 1', '    return a', '']
+        func2 = ['def func2():', '    b = 2', '    return b', '']
+        func3 = ['def func3():', '    c = 3', '    return c', '']
+
+        opcodes = list(PatienceDiffer(func1 + func2 + func3,
+                                      func2 + func3 + func1).get_opcodes())
+
+        self.assertEqual(opcodes, [
+            ('delete', 0, 4, 0, 0),
+            ('equal', 4, 11, 0, 7),
+            ('insert', 11, 11, 7, 11),
+            ('equal', 11, 12, 11, 12),
+        ])
+
+    def test_with_repeated_lines(self):
+        """Testing PatienceDiffer with ranges that have no unique lines"""
+        a = ['{', 'x', '}', '{', 'x', '}', 'unique']
+        b = ['{', 'y', '}', '{', 'x', '}', 'unique', '{', '}']
+
+        self._check_opcodes(a, b)
+
+    def test_with_random_changes(self):
+        """Testing PatienceDiffer opcodes with random changes"""
+        rand = random.Random(0)
+
+        for i in range(20):
+            a = [
+                'line %s' % rand.randint(0, 50)
+                for j in range(rand.randint(0, 300))
+            ]
+            b = [
+                line
+                for line in a
+                if rand.random() > 0.2
+            ]
+
+            for j in range(rand.randint(0, 30)):
+                b.insert(rand.randint(0, len(b)),
+                         'line %s' % rand.randint(0, 100))
+
+            self._check_opcodes(a, b)
+
+    def _check_opcodes(self, a, b):
+        """Checks that the opcodes from PatienceDiffer turn a into b."""
+        result = []
+
+        for tag, i1, i2, j1, j2 in PatienceDiffer(a, b).get_opcodes():
+            if tag == 'equal':
+                self.assertEqual(a[i1:i2], b[j1:j2])
+            elif tag == 'replace':
+                self.assertEqual(i2 - i1, j2 - j1)
+
+            result += b[j1:j2]
+
+        self.assertEqual(result, b)
+
+
 class InterestingLinesTest(TestCase):
     PREFIX = os.path.join(os.path.dirname(__file__), 'testdata')
 
@@ -453,15 +613,74 @@ class DiffParserTest(TestCase):
         self.assertEqual(files[0].insert_count, 3)
         self.assertEqual(files[0].delete_count, 4)
 
+    def test_move_detection_with_common_lines(self):
+        """Testing diff viewer move detection with lines over the
+        candidate limit
+        """
+        block = [
+            'this is line 1, and it is sufficiently long',
+            'common line',
+            'common line',
+            'this is line 2, and it is sufficiently long',
+        ]
+        other = [
+            'unchanged line %d' % i
+            for i in range(1, 6)
+        ]
+
+        self._test_move_detection(
+            block + other,
+            other + block,
+            [
+                {
+                    6: 1,
+                    7: 2,
+                    8: 3,
+                    9: 4,
+                }
+            ],
+            [
+                {
+                    1: 6,
+                    2: 7,
+                    3: 8,
+                    4: 9,
+                }
+            ],
+            MOVE_MAX_CANDIDATES=1)
+
+    def test_move_detection_with_work_limit(self):
+        """Testing diff viewer move detection stops after MOVE_MAX_WORK"""
+        self._test_move_detection(
+            [
+                'this is line 1, and it is sufficiently long',
+                '-------------------------------------------',
+                '-------------------------------------------',
+                'this is line 2, and it is sufficiently long',
+            ],
+            [
+                'this is line 2, and it is sufficiently long',
+                '-------------------------------------------',
+                '-------------------------------------------',
+                'this is line 1, and it is sufficiently long',
+            ],
+            [],
+            [],
+            MOVE_MAX_WORK=0)
+
     def _get_file(self, *relative):
         path = os.path.join(*tuple([self.PREFIX] + list(relative)))
         with open(path, 'rb') as f:
             return f.read()
 
-    def _test_move_detection(self, a, b, expected_i_moves, expected_r_moves):
+    def _test_move_detection(self, a, b, expected_i_moves, expected_r_moves,
+                             **generator_attrs):
         differ = MyersDiffer(a, b)
         opcode_generator = get_diff_opcode_generator(differ)
 
+        for name, value in six.iteritems(generator_attrs):
+            setattr(opcode_generator, name, value)
+
         r_moves = []
         i_moves = []
 
@@ -478,6 +697,128 @@ class DiffParserTest(TestCase):
         self.assertEqual(r_moves, expected_r_moves)
 
 
+class PatcherTests(SpyAgency, TestCase):
+    """Unit tests for the in-process patcher."""
+    PREFIX = os.path.join(os.path.dirname(__file__), 'testdata')
+
+    def test_apply_testdata(self):
+        """Testing apply_patch with the unified diffs in testdata"""
+        unified_dir = os.path.join(self.PREFIX, 'diffs', 'unified')
+
+        for diff_filename in sorted(os.listdir(unified_dir)):
+            filename = diff_filename[:-len('.diff')]
+            diff = self._get_file('diffs', 'unified', diff_filename)
+            old = self._get_file('orig_src', filename)
+
+            if filename == 'nuke_me':
+                # This file is deleted in new_src.
+                new = b''
+            elif filename == 'README.crlf':
+                # This is README with CRLF line endings.
+                new = self._get_file('new_src', 'README')
+            else:
+                new = self._get_file('new_src', filename)
+
+            self.assertEqual(
+                apply_patch(diffutils.convert_line_endings(diff),
+                            diffutils.convert_line_endings(old)),
+                diffutils.convert_line_endings(new))
+
+    def test_apply_with_offset(self):
+        """Testing apply_patch with hunks at an offset"""
+        diff = (
+            b'--- README\n'
+            b'+++ README\n'
+            b'@@ -1,3 +1,3 @@\n'
+            b' line 1\n'
+            b'-line 2\n'
+            b'+line 2 changed\n'
+            b' line 3\n'
+        )
+
+        self.assertEqual(
+            apply_patch(diff, b'line 0\nline 0\nline 1\nline 2\nline 3\n'),
+            b'line 0\nline 0\nline 1\nline 2 changed\nline 3\n')
+
+    def test_apply_with_fuzz(self):
+        """Testing apply_patch with hunks requiring fuzz"""
+        diff = (
+            b'--- README\n'
+            b'+++ README\n'
+            b'@@ -1,5 +1,5 @@\n'
+            b' line 1\n'
+            b' line 2\n'
+            b'-line 3\n'
+            b'+line 3 changed\n'
+            b' line 4\n'
+            b' line 5\n'
+        )
+
+        self.assertEqual(
+            apply_patch(diff, b'line 1\nline 2 local\nline 3\nline 4\n'
+                              b'line 5\n'),
+            b'line 1\nline 2 local\nline 3 changed\nline 4\nline 5\n')
+
+    def test_apply_with_no_newline(self):
+        """Testing apply_patch with "No newline at end of file" markers"""
+        diff = (
+            b'--- README\n'
+            b'+++ README\n'
+            b'@@ -1,2 +1,2 @@\n'
+            b' line 1\n'
+            b'-line 2\n'
+            b'\\ No newline at end of file\n'
+            b'+line 2\n'
+        )
+
+        self.assertEqual(apply_patch(diff, b'line 1\nline 2'),
+                         b'line 1\nline 2\n')
+
+    def test_apply_with_failed_hunk(self):
+        """Testing apply_patch with a hunk that doesn't apply"""
+        diff = (
+            b'--- README\n'
+            b'+++ README\n'
+            b'@@ -1,2 +1,2 @@\n'
+            b' line 1\n'
+            b'-line 2\n'
+            b'+line 2 changed\n'
+        )
+
+        self.assertRaises(PatchError,
+                          lambda: apply_patch(diff, b'line 1\nline 3\n'))
+
+    def test_patch_without_subprocess(self):
+        """Testing patch applies unified diffs in-process"""
+        self.spy_on(diffutils.apply_patch)
+        self.spy_on(diffutils.tempfile.mkdtemp)
+
+        diff = self._get_file('diffs', 'unified', 'foo.c.diff')
+        patched = diffutils.patch(diff, self._get_file('orig_src', 'foo.c'),
+                                  'foo.c')
+
+        self.assertEqual(patched, self._get_file('new_src', 'foo.c'))
+        self.assertTrue(diffutils.apply_patch.called)
+        self.assertFalse(diffutils.tempfile.mkdtemp.called)
+
+    def test_patch_with_context_diff(self):
+        """Testing patch falls back on the patch command for context diffs"""
+        self.spy_on(diffutils.tempfile.mkdtemp)
+
+        diff = self._get_file('diffs', 'context', 'foo.c.diff')
+        patched = diffutils.patch(diff, self._get_file('orig_src', 'foo.c'),
+                                  'foo.c')
+
+        self.assertEqual(patched, self._get_file('new_src', 'foo.c'))
+        self.assertTrue(diffutils.tempfile.mkdtemp.called)
+
+    def _get_file(self, *relative):
+        path = os.path.join(*tuple([self.PREFIX] + list(relative)))
+
+        with open(path, 'rb') as f:
+            return f.read()
+
+
 class FileDiffMigrationTests(TestCase):
     fixtures = ['test_scmtools']
 
@@ -524,7 +865,7 @@ class FileDiffMigrationTests(TestCase):
 
         self.assertEqual(diff, self.diff)
         self.assertEqual(self.filediff.diff64, '')
-        self.assertEqual(self.filediff.diff_hash.binary, self.diff)
+        self.assertEqual(self.filediff.diff_hash.content, self.diff)
         self.assertEqual(self.filediff.diff, diff)
         self.assertEqual(self.filediff.parent_diff, None)
         self.assertEqual(self.filediff.parent_diff_hash, None)
@@ -543,7 +884,7 @@ class FileDiffMigrationTests(TestCase):
 
         self.assertEqual(parent_diff, self.parent_diff)
         self.assertEqual(self.filediff.parent_diff64, '')
-        self.assertEqual(self.filediff.parent_diff_hash.binary,
+        self.assertEqual(self.filediff.parent_diff_hash.content,
                          self.parent_diff)
         self.assertEqual(self.filediff.parent_diff, self.parent_diff)
 
@@ -589,6 +930,126 @@ class FileDiffMigrationTests(TestCase):
         self.assertEqual(self.filediff.diff_hash.delete_count, 20)
 
 
+class FileDiffDataCompressionTests(TestCase):
+    """Unit tests for compressed FileDiffData storage."""
+    def setUp(self):
+        self.diff = (
+            b'diff --git a/README b/README\n'
+            b'index d6613f5..5b50866 100644\n'
+            b'--- README\n'
+            b'+++ README\n'
+            b'@ -1,10 +1,10 @@\n' +
+            b'-blah blah\n' * 10 +
+            b'+blah!\n' * 10)
+
+    def _create_uncompressed(self, data):
+        filediff_data = FileDiffData(binary_hash='a' * 40,
+                                     binary=Base64DecodedValue(data))
+        filediff_data.save()
+
+        return filediff_data
+
+    def test_get_or_create_compresses(self):
+        """Testing FileDiffData.objects.get_or_create compresses data"""
+        filediff_data, is_new = FileDiffData.objects.get_or_create(
+            binary_hash='a' * 40,
+            defaults={
+                'binary': self.diff,
+            })
+
+        filediff_data = FileDiffData.objects.get(pk=filediff_data.pk)
+        self.assertEqual(filediff_data.compression,
+                         FileDiffData.COMPRESSION_ZLIB)
+        self.assertEqual(filediff_data.binary, zlib.compress(self.diff))
+        self.assertEqual(filediff_data.content, self.diff)
+
+    def test_get_or_create_incompressible(self):
+        """Testing FileDiffData.objects.get_or_create with data that
+        doesn't compress
+        """
+        data = b'x'
+
+        filediff_data, is_new = FileDiffData.objects.get_or_create(
+            binary_hash='a' * 40,
+            defaults={
+                'binary': data,
+            })
+
+        filediff_data = FileDiffData.objects.get(pk=filediff_data.pk)
+        self.assertEqual(filediff_data.compression, None)
+        self.assertEqual(filediff_data.binary, data)
+        self.assertEqual(filediff_data.content, data)
+
+    def test_content_uncompressed(self):
+        """Testing FileDiffData.content with uncompressed data"""
+        self._create_uncompressed(self.diff)
+
+        filediff_data = FileDiffData.objects.get(pk='a' * 40)
+        self.assertEqual(filediff_data.compression, None)
+        self.assertEqual(filediff_data.content, self.diff)
+
+    def test_compress(self):
+        """Testing FileDiffData.compress"""
+        filediff_data = self._create_uncompressed(self.diff)
+
+        self.assertTrue(filediff_data.compress())
+        self.assertEqual(filediff_data.content, self.diff)
+        filediff_data.save()
+
+        filediff_data = FileDiffData.objects.get(pk=filediff_data.pk)
+        self.assertEqual(filediff_data.compression,
+                         FileDiffData.COMPRESSION_ZLIB)
+        self.assertEqual(filediff_data.content, self.diff)
+
+        # Compressing again should do nothing.
+        self.assertFalse(filediff_data.compress())
+
+    def test_compress_all(self):
+        """Testing FileDiffData.objects.compress_all"""
+        for i in range(5):
+            FileDiffData.objects.create(
+                binary_hash='%040d' % i,
+                binary=Base64DecodedValue(self.diff))
+
+        progress = []
+
+        info = FileDiffData.objects.compress_all(
+            batch_size=2,
+            start_after='%040d' % 0,
+            progress_func=lambda *args: progress.append(args))
+
+        self.assertEqual(progress, [
+            (2, '%040d' % 2),
+            (4, '%040d' % 4),
+        ])
+        self.assertEqual(info['processed'], 4)
+        self.assertEqual(info['compressed'], 4)
+        self.assertTrue(info['new_size'] < info['old_size'])
+
+        for filediff_data in FileDiffData.objects.all():
+            if filediff_data.pk == '%040d' % 0:
+                self.assertEqual(filediff_data.compression, None)
+            else:
+                self.assertEqual(filediff_data.compression,
+                                 FileDiffData.COMPRESSION_ZLIB)
+
+            self.assertEqual(filediff_data.content, self.diff)
+
+    def test_compressdiffs_command(self):
+        """Testing the compressdiffs management command"""
+        self._create_uncompressed(self.diff)
+
+        stdout = six.StringIO()
+        call_command('compressdiffs', stdout=stdout)
+
+        self.assertIn('Compressed 1 of 1 stored diffs', stdout.getvalue())
+
+        filediff_data = FileDiffData.objects.get(pk='a' * 40)
+        self.assertEqual(filediff_data.compression,
+                         FileDiffData.COMPRESSION_ZLIB)
+        self.assertEqual(filediff_data.content, self.diff)
+
+
 class HighlightRegionTest(TestCase):
     def setUp(self):
         siteconfig = SiteConfiguration.objects.get_current()
@@ -721,6 +1182,99 @@ class DiffSetManagerTests(SpyAgency, TestCase):
             repository, 'diff', diff, None, None, None, '/', None)
 
         self.assertEqual(diffset.files.count(), 1)
+        self.assertEqual(diffset.diffcompat, DiffCompatVersion.DEFAULT)
+
+    def test_creating_with_diff_compat_version(self):
+        """Testing creating a DiffSet with a configured diff algorithm"""
+        diff = (
+            b'diff --git a/README b/README\n'
+            b'index d6613f5..5b50866 100644\n'
+            b'--- README\n'
+            b'+++ README\n'
+            b'@ -1,1 +1,1 @@\n'
+            b'-blah..\n'
+            b'+blah blah\n'
+        )
+
+        repository = self.create_repository(tool_name='Test')
+
+        self.spy_on(repository.get_file_exists,
+                    call_fake=lambda *args, **kwargs: True)
+
+        siteconfig = SiteConfiguration.objects.get_current()
+        siteconfig.set('diffviewer_diff_compat_version',
+                       DiffCompatVersion.PATIENCE)
+        siteconfig.save()
+
+        try:
+            diffset = DiffSet.objects.create_from_data(
+                repository, 'diff', diff, None, None, None, '/', None)
+            self.assertEqual(diffset.diffcompat, DiffCompatVersion.PATIENCE)
+
+            # The repository's setting overrides the site's.
+            repository.extra_data['diff_compat_version'] = \
+                DiffCompatVersion.MYERS_SMS_COST_BAIL
+
+            diffset = DiffSet.objects.create_from_data(
+                repository, 'diff', diff, None, None, None, '/', None)
+            self.assertEqual(diffset.diffcompat,
+                             DiffCompatVersion.MYERS_SMS_COST_BAIL)
+        finally:
+            siteconfig.set('diffviewer_diff_compat_version',
+                           DiffCompatVersion.DEFAULT)
+            siteconfig.save()
+
+    def test_creating_with_missing_files(self):
+        """Testing creating a DiffSet with files missing from the repository"""
+        diff = (
+            b'diff --git a/README b/README\n'
+            b'index d6613f5..5b50866 100644\n'
+            b'--- README\n'
+            b'+++ README\n'
+            b'@ -1,1 +1,1 @@\n'
+            b'-blah..\n'
+            b'+blah blah\n'
+            b'diff --git a/UNUSED b/UNUSED\n'
+            b'index 1234567..5b50866 100644\n'
+            b'--- UNUSED\n'
+            b'+++ UNUSED\n'
+            b'@ -1,1 +1,1 @@\n'
+            b'-blah..\n'
+            b'+blah blah\n'
+            b'diff --git a/MISSING b/MISSING\n'
+            b'index 7654321..5b50866 100644\n'
+            b'--- MISSING\n'
+            b'+++ MISSING\n'
+            b'@ -1,1 +1,1 @@\n'
+            b'-blah..\n'
+            b'+blah blah\n'
+        )
+
+        repository = self.create_repository(tool_name='Test')
+        checked_files = []
+
+        def get_file_exists_many(repository, files, *args, **kwargs):
+            checked_files.append(files)
+
+            return [path == '/README' for path, revision in files]
+
+        self.spy_on(repository.get_file_exists_many,
+                    call_fake=get_file_exists_many)
+
+        with self.assertRaises(FileNotFoundError) as cm:
+            DiffSet.objects.create_from_data(
+                repository, 'diff', diff, None, None, None, '/', None)
+
+        # All files are checked at once, and the first missing file is
+        # reported.
+        self.assertEqual(checked_files, [[
+            ('/README', 'd6613f5'),
+            ('/UNUSED', '1234567'),
+            ('/MISSING', '7654321'),
+        ]])
+        self.assertEqual(cm.exception.path, '/UNUSED')
+        self.assertEqual(cm.exception.revision, '1234567')
+        self.assertEqual(DiffSet.objects.count(), 0)
 
 
 class UploadDiffFormTests(SpyAgency, TestCase):
@@ -767,9 +1321,11 @@ class UploadDiffFormTests(SpyAgency, TestCase):
         """Testing UploadDiffForm and filtering parent diff files"""
         saw_file_exists = {}
 
-        def get_file_exists(repository, filename, revision, *args, **kwargs):
-            saw_file_exists[(filename, revision)] = True
-            return True
+        def get_file_exists_many(repository, files, *args, **kwargs):
+            for filename, revision in files:
+                saw_file_exists[(filename, revision)] = True
+
+            return [True] * len(files)
 
         diff = (
             b'diff --git a/README b/README\n'
@@ -806,7 +1362,8 @@ class UploadDiffFormTests(SpyAgency, TestCase):
                                               content_type='text/x-patch')
 
         repository = self.create_repository(tool_name='Test')
-        self.spy_on(repository.get_file_exists, call_fake=get_file_exists)
+        self.spy_on(repository.get_file_exists_many,
+                    call_fake=get_file_exists_many)
 
         form = UploadDiffForm(
             repository=repository,
@@ -1058,6 +1615,475 @@ class DiffChunkGeneratorTests(TestCase):
         regions = generator._get_line_changed_regions(old, new)
         deep_equal(regions, (None, None))
 
+    def test_diff_line_with_meta(self):
+        """Testing DiffChunkGenerator._diff_line with whitespace and move
+        information
+        """
+        filediff = FileDiff(source_file='foo', diffset=DiffSet())
+        generator = DiffChunkGenerator(None, filediff)
+        meta = {
+            'whitespace_chunk': False,
+            'whitespace_lines': [(1, 1), (3, 3)],
+            'moved-to': {2: 10},
+            'moved-from': {3: 20},
+        }
+
+        generator._set_cur_meta(meta)
+        lines = [
+            generator._diff_line(i, i, i, 'line', ' line', 'line', ' line')
+            for i in range(1, 4)
+        ]
+        generator._set_cur_meta(None)
+
+        self.assertEqual([line[7] for line in lines], [True, False, True])
+        self.assertEqual(len(lines[0]), 8)
+        self.assertEqual(lines[1][8], {'to': 10})
+        self.assertEqual(lines[2][8], {'from': 20})
+
+        # The metadata stored in the chunks must be left as-is.
+        self.assertEqual(meta['whitespace_lines'], [(1, 1), (3, 3)])
+
+
+class DiffChunkGeneratorCacheKeyTests(TestCase):
+    """Unit tests for DiffChunkGenerator.make_cache_key."""
+    fixtures = ['test_scmtools']
+
+    def setUp(self):
+        super(DiffChunkGeneratorCacheKeyTests, self).setUp()
+
+        self.repository = self.create_repository(tool_name='Test')
+
+    def test_make_cache_key_with_same_content(self):
+        """Testing DiffChunkGenerator.make_cache_key with identical diffs"""
+        diffset1 = self.create_diffset(repository=self.repository)
+        diffset2 = self.create_diffset(repository=self.repository,
+                                       revision=2)
+        filediff1 = self.create_filediff(diffset1, diff=b'diff1')
+        filediff2 = self.create_filediff(diffset2, diff=b'diff1')
+
+        self.assertNotEqual(filediff1.pk, filediff2.pk)
+        self.assertEqual(DiffChunkGenerator(None, filediff1).make_cache_key(),
+                         DiffChunkGenerator(None, filediff2).make_cache_key())
+
+    def test_make_cache_key_with_different_content(self):
+        """Testing DiffChunkGenerator.make_cache_key with different diffs or
+        source files
+        """
+        diffset = self.create_diffset(repository=self.repository)
+        filediff = self.create_filediff(diffset, diff=b'diff1')
+        key = DiffChunkGenerator(None, filediff).make_cache_key()
+
+        for filediff_kwargs in ({'diff': b'diff2'},
+                                {'diff': b'diff1', 'source_revision': '456'},
+                                {'diff': b'diff1', 'source_file': '/foo'}):
+            other_filediff = self.create_filediff(diffset, **filediff_kwargs)
+
+            self.assertNotEqual(
+                DiffChunkGenerator(None, other_filediff).make_cache_key(),
+                key)
+
+        other_diffset = self.create_diffset(repository=self.repository)
+        other_diffset.base_commit_id = 'abc123'
+        other_filediff = self.create_filediff(other_diffset, diff=b'diff1')
+
+        self.assertNotEqual(
+            DiffChunkGenerator(None, other_filediff).make_cache_key(), key)
+
+    def test_make_cache_key_with_interdiff(self):
+        """Testing DiffChunkGenerator.make_cache_key with interdiffs"""
+        diffset1 = self.create_diffset(repository=self.repository)
+        diffset2 = self.create_diffset(repository=self.repository,
+                                       revision=2)
+        filediff1 = self.create_filediff(diffset1, diff=b'diff1')
+        filediff2 = self.create_filediff(diffset2, diff=b'diff2')
+        filediff3 = self.create_filediff(diffset2, diff=b'diff1')
+
+        interdiff_key = DiffChunkGenerator(
+            None, filediff1, filediff2, True).make_cache_key()
+        self.assertNotEqual(
+            interdiff_key,
+            DiffChunkGenerator(None, filediff1).make_cache_key())
+        self.assertNotEqual(
+            interdiff_key,
+            DiffChunkGenerator(None, filediff1, None, True).make_cache_key())
+        self.assertEqual(
+            interdiff_key,
+            DiffChunkGenerator(None, filediff3, filediff2,
+                               True).make_cache_key())
+
+
+class ChunkSerializerTests(SpyAgency, TestCase):
+    """Unit tests for the serialized form of cached diff chunks."""
+    fixtures = ['test_scmtools']
+
+    def setUp(self):
+        super(ChunkSerializerTests, self).setUp()
+
+        cache.clear()
+
+        self.repository = self.create_repository(tool_name='Test')
+        diffset = self.create_diffset(repository=self.repository)
+        diffset.diffcompat = DiffCompatVersion.DEFAULT
+        diffset.save()
+
+        self.filediff = self.create_filediff(
+            diffset,
+            source_file='/file.c',
+            dest_file='/file.c',
+            diff=(b'--- /file.c\n'
+                  b'+++ /file.c\n'
+                  b'@@ -1,3 +1,3 @@\n'
+                  b' int main() {\n'
+                  b'-    return 0;\n'
+                  b'+    return 1;\n'
+                  b' }\n'))
+
+        self.spy_on(
+            self.repository.get_file,
+            call_fake=lambda *args, **kwargs: (b'int main() {\n'
+                                               b'    return 0;\n'
+                                               b'}\n'))
+
+    def test_round_trip(self):
+        """Testing serialize_chunks and deserialize_chunks"""
+        chunks = DiffChunkGenerator(None, self.filediff)._get_chunks_uncached()
+        chunks = list(chunks)
+        chunks[0]['lines'][0].append({'to': 10})
+
+        data = serialize_chunks(chunks)
+        self.assertEqual(data[0], CHUNKS_FORMAT_ID)
+        self.assertEqual(data[1], CHUNKS_FORMAT_VERSION)
+
+        result = deserialize_chunks(data)
+        self.assertEqual(result, chunks)
+
+        for chunk in result:
+            for line in chunk['lines']:
+                self.assertTrue(isinstance(line[2], SafeText))
+                self.assertTrue(isinstance(line[5], SafeText))
+
+    def test_round_trip_with_irregular_lines(self):
+        """Testing serialize_chunks and deserialize_chunks with
+        non-consecutive line numbers and markup containing newlines
+        """
+        chunks = [{
+            'index': 0,
+            'lines': [
+                [1, 5, mark_safe('a\nb'), None, '', mark_safe(''), [], False],
+                [2, 7, mark_safe('c'), [(0, 1)], 3, mark_safe('c'),
+                 [(0, 2)], True, {'from': 1}],
+            ],
+            'numlines': 2,
+            'change': 'replace',
+            'collapsable': False,
+            'meta': {},
+        }]
+
+        self.assertEqual(deserialize_chunks(serialize_chunks(chunks)),
+                         chunks)
+
+    def test_deserialize_with_legacy_chunks(self):
+        """Testing deserialize_chunks with chunks in the legacy format"""
+        chunks = list(
+            DiffChunkGenerator(None, self.filediff)._get_chunks_uncached())
+
+        self.assertTrue(deserialize_chunks(chunks) is chunks)
+
+    def test_deserialize_with_unknown_version(self):
+        """Testing deserialize_chunks with an unknown format version"""
+        data = serialize_chunks([])
+
+        self.assertRaises(
+            ChunkFormatError,
+            lambda: deserialize_chunks((data[0], 999) + data[2:]))
+
+    def test_get_chunks_cached(self):
+        """Testing DiffChunkGenerator.get_chunks with cached chunks"""
+        chunks = DiffChunkGenerator(None, self.filediff).get_chunks()
+
+        self.spy_on(deserialize_chunks)
+        cached_chunks = DiffChunkGenerator(None, self.filediff).get_chunks()
+
+        self.assertEqual(cached_chunks, chunks)
+        self.assertTrue(deserialize_chunks.spy.called)
+        self.assertEqual(len(self.repository.get_file.spy.calls), 1)
+
+    def test_get_chunks_with_unknown_version_cached(self):
+        """Testing DiffChunkGenerator.get_chunks with cached chunks in an
+        unknown format
+        """
+        generator = DiffChunkGenerator(None, self.filediff)
+        chunks = generator.get_chunks()
+
+        cache_memoize(generator.make_cache_key(),
+                      lambda: (CHUNKS_FORMAT_ID, 999, [], []),
+                      large_data=True, force_overwrite=True)
+
+        self.assertEqual(
+            DiffChunkGenerator(None, self.filediff).get_chunks(), chunks)
+        self.assertEqual(len(self.repository.get_file.spy.calls), 2)
+
+        # The cache should now contain the regenerated chunks.
+        self.assertEqual(
+            DiffChunkGenerator(None, self.filediff).get_chunks(), chunks)
+        self.assertEqual(len(self.repository.get_file.spy.calls), 2)
+
+
+class PopulateDiffChunksTests(SpyAgency, TestCase):
+    """Unit tests for populate_diff_chunks."""
+    fixtures = ['test_scmtools']
+
+    def setUp(self):
+        super(PopulateDiffChunksTests, self).setUp()
+
+        self.siteconfig = SiteConfiguration.objects.get_current()
+        self.siteconfig.set('diffviewer_chunk_generator_threads', 1)
+
+    def tearDown(self):
+        super(PopulateDiffChunksTests, self).tearDown()
+
+        self.siteconfig.set('diffviewer_chunk_generator_threads', 1)
+
+    def test_with_threads(self):
+        """Testing populate_diff_chunks with multiple threads"""
+        repository = self.create_repository(tool_name='Test')
+        diffset = self.create_diffset(repository=repository)
+        diffset.diffcompat = DiffCompatVersion.DEFAULT
+        diffset.save()
+
+        for i in range(4):
+            self.create_filediff(
+                diffset,
+                source_file='/file%s' % i,
+                dest_file='/file%s' % i,
+                diff=(b'--- /file%s\n'
+                      b'+++ /file%s\n'
+                      b'@@ -1,2 +1,2 @@\n'
+                      b' line 1\n'
+                      b'-line 2\n'
+                      b'+line %s changed\n'
+                      % (i, i, i)))
+
+        self.spy_on(repository.get_file,
+                    call_fake=lambda *args, **kwargs: b'line 1\nline 2\n')
+
+        files = diffutils.get_diff_files(diffset)
+        diffutils.populate_diff_chunks(files, False)
+        expected_chunks = [f['chunks'] for f in files]
+
+        cache.clear()
+        self.siteconfig.set('diffviewer_chunk_generator_threads', 3)
+        self.spy_on(diffutils._get_chunks_concurrently)
+
+        files = diffutils.get_diff_files(diffset)
+        diffutils.populate_diff_chunks(files, False)
+
+        self.assertTrue(diffutils._get_chunks_concurrently.spy.called)
+        self.assertEqual([f['chunks'] for f in files], expected_chunks)
+        self.assertEqual([f['filediff'].source_file for f in files],
+                         ['/file0', '/file1', '/file2', '/file3'])
+
+        for f in files:
+            self.assertTrue(f['chunks_loaded'])
+            self.assertEqual(f['num_changes'], 1)
+
+
+class ChunkCacheWarmerTests(SpyAgency, TestCase):
+    """Unit tests for diff chunk pre-generation."""
+    fixtures = ['test_scmtools']
+
+    def test_warm_diffset_chunks(self):
+        """Testing warm_diffset_chunks with max_files"""
+        repository = self.create_repository(tool_name='Test')
+        diffset = self.create_diffset(repository=repository)
+        diffset.diffcompat = DiffCompatVersion.DEFAULT
+        diffset.save()
+
+        for i in range(3):
+            self.create_filediff(
+                diffset,
+                source_file='/file%s' % i,
+                dest_file='/file%s' % i,
+                diff=(b'--- /file%s\n'
+                      b'+++ /file%s\n'
+                      b'@@ -1,1 +1,1 @@\n'
+                      b'-line 1\n'
+                      b'+line %s\n'
+                      % (i, i, i)))
+
+        self.spy_on(repository.get_file,
+                    call_fake=lambda *args, **kwargs: b'line 1\n')
+
+        self.assertEqual(
+            cache_warmer.warm_diffset_chunks(diffset, max_files=2), 2)
+        self.assertEqual(len(repository.get_file.spy.calls), 2)
+
+        # Only the file that wasn't pre-generated should need to be fetched.
+        files = diffutils.get_diff_files(diffset)
+        diffutils.populate_diff_chunks(
+            files, cache_warmer.get_default_enable_highlighting())
+
+        self.assertEqual(len(repository.get_file.spy.calls), 3)
+        self.assertEqual(repository.get_file.spy.last_call.args[0], '/file2')
+
+
+class PrefetchOriginalFilesTests(SpyAgency, TestCase):
+    """Unit tests for prefetch_original_files."""
+    fixtures = ['test_scmtools']
+
+    def test_prefetch_original_files(self):
+        """Testing prefetch_original_files"""
+        repository = self.create_repository(tool_name='Test')
+        diffset = self.create_diffset(repository=repository)
+
+        self.create_filediff(diffset, source_file='/file1',
+                             dest_file='/file1', source_revision='123')
+        self.create_filediff(diffset, source_file='/file2',
+                             dest_file='/file2', source_revision='456')
+        self.create_filediff(diffset, source_file='/file3',
+                             dest_file='/file3',
+                             source_revision=PRE_CREATION)
+
+        self.spy_on(repository.prefetch_files,
+                    call_fake=lambda *args, **kwargs: None)
+
+        diffutils.prefetch_original_files(diffutils.get_diff_files(diffset))
+
+        self.assertEqual(len(repository.prefetch_files.spy.calls), 1)
+        self.assertEqual(repository.prefetch_files.spy.last_call.args[0],
+                         [('/file1', '123'), ('/file2', '456')])
+
+    def test_prefetch_original_files_with_cached_chunks(self):
+        """Testing prefetch_original_files skips files with cached chunks"""
+        repository = self.create_repository(tool_name='Test')
+        diffset = self.create_diffset(repository=repository)
+
+        filediff = self.create_filediff(diffset, source_file='/file1',
+                                        dest_file='/file1',
+                                        source_revision='123')
+        self.create_filediff(diffset, source_file='/file2',
+                             dest_file='/file2', source_revision='456')
+
+        generator = get_diff_chunk_generator(None, filediff, None, False,
+                                             True)
+        cache.set(make_cache_key(generator.make_cache_key()), '1')
+
+        self.spy_on(repository.prefetch_files,
+                    call_fake=lambda *args, **kwargs: None)
+
+        diffutils.prefetch_original_files(diffutils.get_diff_files(diffset))
+
+        self.assertEqual(len(repository.prefetch_files.spy.calls), 1)
+        self.assertEqual(repository.prefetch_files.spy.last_call.args[0],
+                         [('/file2', '456')])
+
+    def test_prefetch_original_files_with_errors(self):
+        """Testing prefetch_original_files ignores errors"""
+        def _prefetch_files(*args, **kwargs):
+            raise SCMError('Oh no')
+
+        repository = self.create_repository(tool_name='Test')
+        diffset = self.create_diffset(repository=repository)
+        self.create_filediff(diffset)
+
+        self.spy_on(repository.prefetch_files, call_fake=_prefetch_files)
+
+        diffutils.prefetch_original_files(diffutils.get_diff_files(diffset))
+
+        self.assertTrue(repository.prefetch_files.called)
+
+
+class OriginalFileCacheTests(SpyAgency, TestCase):
+    """Unit tests for the original file cache."""
+    fixtures = ['test_scmtools']
+
+    def setUp(self):
+        super(OriginalFileCacheTests, self).setUp()
+
+        self.siteconfig = SiteConfiguration.objects.get_current()
+        self.siteconfig.set('diffviewer_original_file_cache_size', 1024)
+        self.siteconfig.save()
+
+        get_original_file_cache().clear()
+
+    def tearDown(self):
+        super(OriginalFileCacheTests, self).tearDown()
+
+        self.siteconfig.set('diffviewer_original_file_cache_size', 0)
+        self.siteconfig.save()
+
+        get_original_file_cache().clear()
+
+    def test_lru_eviction(self):
+        """Testing OriginalFileCache evicts least recently used files"""
+        file_cache = OriginalFileCache(10)
+        file_cache.set('a', b'1234')
+        file_cache.set('b', b'1234')
+        self.assertEqual(file_cache.get('a'), b'1234')
+
+        file_cache.set('c', b'1234')
+        self.assertEqual(file_cache.get('a'), b'1234')
+        self.assertEqual(file_cache.get('b'), None)
+        self.assertEqual(file_cache.get('c'), b'1234')
+        self.assertEqual(file_cache.size, 8)
+
+        # Files larger than the cache are never stored.
+        file_cache.set('d', b'12345678901')
+        self.assertEqual(file_cache.get('d'), None)
+        self.assertEqual(len(file_cache), 2)
+
+    def test_get_original_file(self):
+        """Testing get_original_file with the original file cache"""
+        repository = self.create_repository(tool_name='Test')
+        diffset = self.create_diffset(repository=repository)
+        filediff = self.create_filediff(diffset)
+        filediff.parent_diff = (b'--- /test-file\n'
+                                b'+++ /test-file\n'
+                                b'@@ -1,1 +1,1 @@\n'
+                                b'-line 1\r\n'
+                                b'+line 2\r\n')
+        filediff.save()
+
+        self.spy_on(repository.get_file,
+                    call_fake=lambda *args, **kwargs: b'line 1\r\n')
+        self.spy_on(diffutils.patch)
+
+        for i in range(2):
+            self.assertEqual(
+                diffutils.get_original_file(filediff, None, ['ascii']),
+                b'line 2\n')
+
+        self.assertEqual(len(repository.get_file.spy.calls), 1)
+        self.assertEqual(len(diffutils.patch.spy.calls), 1)
+
+        # A different parent diff must not share the cached file.
+        filediff.parent_diff = (b'--- /test-file\n'
+                                b'+++ /test-file\n'
+                                b'@@ -1,1 +1,1 @@\n'
+                                b'-line 1\n'
+                                b'+line 3\n')
+        filediff.save()
+
+        self.assertEqual(
+            diffutils.get_original_file(filediff, None, ['ascii']),
+            b'line 3\n')
+        self.assertEqual(len(repository.get_file.spy.calls), 2)
+
+    def test_get_original_file_with_head(self):
+        """Testing get_original_file doesn't cache HEAD revisions"""
+        repository = self.create_repository(tool_name='Test')
+        diffset = self.create_diffset(repository=repository)
+        filediff = self.create_filediff(diffset, source_revision=HEAD)
+
+        self.spy_on(repository.get_file,
+                    call_fake=lambda *args, **kwargs: b'line 1\n')
+
+        for i in range(2):
+            diffutils.get_original_file(filediff, None, ['ascii'])
+
+        self.assertEqual(len(repository.get_file.spy.calls), 2)
+        self.assertEqual(len(get_original_file_cache()), 0)
+
 
 class DiffRendererTests(SpyAgency, TestCase):
     """Unit tests for DiffRenderer."""
@@ -14,6 +14,7 @@ from djblets.siteconfig.models import SiteConfiguration
 
 from reviewboard.diffviewer.diffutils import (get_diff_files,
                                               populate_diff_chunks,
+                                              prefetch_original_files,
                                               get_enable_highlighting)
 from reviewboard.diffviewer.errors import UserVisibleError
 from reviewboard.diffviewer.models import DiffSet, FileDiff
@@ -153,6 +154,14 @@ class DiffViewerView(TemplateView):
 
         page = paginator.page(page_num)
 
+        # Each file on the page is rendered through a separate request.
+        # Fetch the original files for any whose chunks aren't cached
+        # up-front, so those requests don't each have to go to the
+        # repository.
+        prefetch_original_files(page.object_list,
+                                get_enable_highlighting(self.request.user),
+                                request=self.request)
+
         diff_context = {
             'revision': {
                 'revision': diffset.revision,
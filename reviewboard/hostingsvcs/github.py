@@ -160,6 +160,7 @@ class GitHub(HostingService):
     supports_repositories = True
     supports_two_factor_auth = True
     supported_scmtools = ['Git']
+    max_concurrent_file_requests = 4
 
     # This should be the prefix for every field on the plan forms.
     plan_field_prefix = 'github'
@@ -327,7 +328,7 @@ class GitHub(HostingService):
                                   'git/refs/heads')
 
         try:
-            rsp = self._api_get(url)
+            rsp = self._api_get(url, revalidate=True)
         except Exception as e:
             logging.warning('Failed to fetch commits from %s: %s',
                             url, e)
@@ -355,7 +356,7 @@ class GitHub(HostingService):
             url += '&sha=%s' % start
 
         try:
-            rsp = self._api_get(url)
+            rsp = self._api_get(url, revalidate=True)
         except Exception as e:
             logging.warning('Failed to fetch commits from %s: %s',
                             url, e)
@@ -533,9 +534,13 @@ class GitHub(HostingService):
         return self._api_get(self._build_api_url(
             self._get_repo_api_url_raw(owner, repo_name)))
 
-    def _api_get(self, url):
+    def _api_get(self, url, revalidate=False):
         try:
-            data, headers = self._http_get(url)
+            if revalidate:
+                data, headers = self._http_get_revalidated(url)
+            else:
+                data, headers = self._http_get(url)
+
             return json.loads(data)
         except (URLError, HTTPError) as e:
             data = e.read()
@@ -53,6 +53,7 @@ class GitLab(HostingService):
     supports_bug_trackers = True
     supports_repositories = True
     supported_scmtools = ['Git']
+    max_concurrent_file_requests = 4
 
     plans = [
         ('personal', {
@@ -1,19 +1,26 @@
 from __future__ import unicode_literals
 
 import base64
+import hashlib
 import json
 import logging
 import mimetools
 
+from django.core.cache import cache
 from django.utils.translation import ugettext_lazy as _
+from djblets.cache.backend import make_cache_key
 from djblets.util.compat import six
+from djblets.util.compat.six.moves.urllib.error import HTTPError
 from djblets.util.compat.six.moves.urllib.parse import urlparse
 from djblets.util.compat.six.moves.urllib.request import (
     Request as URLRequest,
-    HTTPBasicAuthHandler,
-    urlopen)
+    HTTPBasicAuthHandler)
 from pkg_resources import iter_entry_points
 
+from reviewboard.scmtools.concurrency import run_concurrently
+from reviewboard.scmtools.errors import FileNotFoundError
+from reviewboard.scmtools.http_pool import urlopen
+
 
 class HostingService(object):
     """An interface to a hosting service for repositories and bug trackers.
@@ -48,6 +55,16 @@ class HostingService(object):
     repository_fields = {}
     bug_tracker_field = None
 
+    # The default maximum number of files fetched at once by get_files and
+    # get_file_exists_many, if not set for the repository. Services that
+    # fetch each file through a separate API request can raise this to make
+    # requests in parallel.
+    max_concurrent_file_requests = 1
+
+    # How long, in seconds, responses fetched through _http_get_revalidated
+    # are kept for revalidation.
+    HTTP_REVALIDATION_CACHE_PERIOD = 24 * 60 * 60
+
     def __init__(self, account):
         assert account
         self.account = account
@@ -124,6 +141,72 @@ class HostingService(object):
 
         return repository.get_scmtool().file_exists(path, revision)
 
+    def get_files(self, repository, files, base_commit_id=None):
+        """Returns the contents of several files.
+
+        files is a list of (path, revision) tuples. This returns a list of
+        the contents of each file, in the same order. Files that don't exist
+        are returned as None.
+
+        By default, this calls get_file for each file, making as many calls
+        at once as the repository's get_max_concurrent_file_requests allows.
+        Services that access the repository through its SCMTool use the
+        SCMTool's get_files.
+        """
+        if not self.supports_repositories:
+            raise NotImplementedError
+
+        if self._uses_scmtool_files():
+            return repository.get_scmtool().get_files(files)
+
+        def _get_file(path, revision):
+            try:
+                return self.get_file(repository, path, revision,
+                                     base_commit_id=base_commit_id)
+            except FileNotFoundError:
+                return None
+
+        return run_concurrently(
+            _get_file,
+            files,
+            repository.get_max_concurrent_file_requests())
+
+    def get_file_exists_many(self, repository, files, base_commit_id=None):
+        """Returns whether each of several files exists.
+
+        files is a list of (path, revision) tuples. This returns a list of
+        booleans, in the same order.
+
+        By default, this calls get_file_exists for each file, making as many
+        calls at once as the repository's get_max_concurrent_file_requests
+        allows. Services that access the repository through its SCMTool use
+        the SCMTool's file_exists_many.
+        """
+        if not self.supports_repositories:
+            raise NotImplementedError
+
+        if self._uses_scmtool_files():
+            return repository.get_scmtool().file_exists_many(files)
+
+        return run_concurrently(
+            lambda path, revision: self.get_file_exists(
+                repository, path, revision, base_commit_id=base_commit_id),
+            files,
+            repository.get_max_concurrent_file_requests())
+
+    def _uses_scmtool_files(self):
+        """Returns whether files are accessed through the SCMTool.
+
+        This is the case unless the service overrides get_file or
+        get_file_exists.
+        """
+        cls = type(self)
+
+        return (six.get_unbound_function(cls.get_file) is
+                six.get_unbound_function(HostingService.get_file) and
+                six.get_unbound_function(cls.get_file_exists) is
+                six.get_unbound_function(HostingService.get_file_exists))
+
     def get_branches(self, repository):
         """Get a list of all branches in the repositories.
 
@@ -253,6 +336,43 @@ class HostingService(object):
     def _http_get(self, url, *args, **kwargs):
         return self._http_request(url, **kwargs)
 
+    def _http_get_revalidated(self, url, *args, **kwargs):
+        """Performs an HTTP GET, revalidating any earlier response.
+
+        The response is stored in the cache along with its ETag. The next
+        request for the same URL sends the ETag in an If-None-Match header,
+        and if the server responds with 304 Not Modified, the stored
+        response is returned. Many APIs (such as GitHub's) don't count
+        these requests against their rate limits.
+        """
+        key = make_cache_key('hosting-service-http-get:%s' % hashlib.sha1(
+            ('%s:%s' % (self.account.pk, url)).encode('utf-8')).hexdigest())
+        cached = cache.get(key)
+        headers = kwargs.pop('headers', {}).copy()
+
+        if cached:
+            headers['If-None-Match'] = cached['etag']
+
+        try:
+            data, rsp_headers = self._http_get(url, headers=headers, *args,
+                                               **kwargs)
+        except HTTPError as e:
+            if cached and e.code == 304:
+                return cached['data'], cached['headers']
+
+            raise
+
+        etag = rsp_headers and rsp_headers.get('ETag')
+
+        if etag:
+            cache.set(key, {
+                'etag': etag,
+                'data': data,
+                'headers': dict(rsp_headers.items()),
+            }, self.HTTP_REVALIDATION_CACHE_PERIOD)
+
+        return data, rsp_headers
+
     def _http_post(self, url, body=None, fields={}, files={},
                    content_type=None, headers={}, *args, **kwargs):
         headers = headers.copy()
@@ -283,6 +403,11 @@ class HostingService(object):
         return r
 
     def _http_request(self, url, body=None, headers={}, **kwargs):
+        """Performs an HTTP request, returning the data and headers.
+
+        Requests are made over pooled connections, which are kept open for
+        later requests to the same host.
+        """
         r = self._build_request(url, body, headers, **kwargs)
         u = urlopen(r)
 
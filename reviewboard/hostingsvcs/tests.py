@@ -4,6 +4,7 @@ import json
 from hashlib import md5
 from textwrap import dedent
 
+from django.core.cache import cache
 from djblets.util.compat import six
 from djblets.util.compat.six.moves import cStringIO as StringIO
 from djblets.util.compat.six.moves.urllib.error import HTTPError
@@ -982,6 +983,65 @@ class GitHubTests(ServiceTests):
         self.assertEqual(body['client_id'], client_id)
         self.assertEqual(body['client_secret'], client_secret)
 
+    def test_get_files(self):
+        """Testing GitHub get_files implementation"""
+        def _http_get(service, url, *args, **kwargs):
+            self.assertTrue(url.startswith(
+                'https://api.github.com/repos/myuser/myrepo/git/blobs/'))
+            sha = url.split('/')[-1].split('?')[0]
+
+            if sha == 'missing':
+                raise HTTPError(url, 404, '', {}, StringIO())
+
+            return 'data for %s' % sha, {}
+
+        repository = self._get_github_repository()
+        service = repository.hosting_account.service
+        self.spy_on(service._http_get, call_fake=_http_get)
+
+        files = [('path%d' % i, 'sha%d' % i) for i in range(10)]
+        files.insert(3, ('missing-path', 'missing'))
+
+        results = service.get_files(repository, files)
+
+        self.assertEqual(len(service._http_get.spy.calls), 11)
+        self.assertEqual(len(results), 11)
+        self.assertEqual(results[3], None)
+        self.assertEqual(results[:3] + results[4:],
+                         ['data for sha%d' % i for i in range(10)])
+
+    def test_get_file_exists_many(self):
+        """Testing GitHub get_file_exists_many implementation"""
+        def _http_get(service, url, *args, **kwargs):
+            if url.split('/')[-1].startswith('missing'):
+                raise HTTPError(url, 404, '', {}, StringIO())
+
+            return 'data', {}
+
+        repository = self._get_github_repository()
+        service = repository.hosting_account.service
+        self.spy_on(service._http_get, call_fake=_http_get)
+
+        results = service.get_file_exists_many(repository, [
+            ('path1', 'sha1'),
+            ('path2', 'missing'),
+            ('path3', 'sha3'),
+        ])
+
+        self.assertEqual(results, [True, False, True])
+
+    def _get_github_repository(self):
+        account = self._get_hosting_account()
+        account.data['authorization'] = {'token': 'abc123'}
+
+        repository = Repository(hosting_account=account)
+        repository.extra_data = {
+            'repository_plan': 'public',
+            'github_public_repo_name': 'myrepo',
+        }
+
+        return repository
+
     def test_get_branches(self):
         """Testing GitHub get_branches implementation"""
         branches_api_response = json.dumps([
@@ -1034,6 +1094,55 @@ class GitHubTests(ServiceTests):
                        False),
             ])
 
+    def test_get_branches_revalidated(self):
+        """Testing GitHub get_branches revalidates the previous response"""
+        branches_api_response = json.dumps([
+            {
+                'ref': 'refs/heads/master',
+                'object': {
+                    'sha': '859d4e148ce3ce60bbda6622cdbe5c2c2f8d9817',
+                }
+            },
+        ])
+
+        def _http_get(service, url, headers={}, *args, **kwargs):
+            sent_headers.append(headers)
+
+            if headers.get('If-None-Match') == '"abc123"':
+                raise HTTPError(url, 304, 'Not Modified', {}, None)
+
+            return branches_api_response, {'ETag': '"abc123"'}
+
+        sent_headers = []
+
+        account = self._get_hosting_account()
+        account.data['authorization'] = {'token': 'abc123'}
+
+        repository = Repository(hosting_account=account)
+        repository.extra_data = {
+            'repository_plan': 'public',
+            'github_public_repo_name': 'myrepo',
+        }
+
+        service = account.service
+        self.spy_on(service._http_get, call_fake=_http_get)
+
+        try:
+            branches1 = service.get_branches(repository)
+            branches2 = service.get_branches(repository)
+        finally:
+            cache.clear()
+
+        self.assertEqual(branches1, [
+            Branch('master', '859d4e148ce3ce60bbda6622cdbe5c2c2f8d9817',
+                   True),
+        ])
+        self.assertEqual(branches2, branches1)
+        self.assertEqual(sent_headers, [
+            {},
+            {'If-None-Match': '"abc123"'},
+        ])
+
     def test_get_commits(self):
         """Testing GitHub get_commits implementation"""
         commits_api_response = json.dumps([
@@ -0,0 +1,210 @@
+from __future__ import unicode_literals
+
+from djblets.siteconfig.models import SiteConfiguration
+
+from reviewboard.signals import initializing
+
+
+def _on_review_request_published(sender, review_request, changedesc,
+                                 **kwargs):
+    """Queues up pre-generation of diff chunks for a published diff.
+
+    This is only done if the ``diffviewer_prewarm_chunks`` setting is
+    enabled, and if the publish included a new diff.
+    """
+    from reviewboard.diffviewer.cache_warmer import get_chunk_cache_warmer
+
+    siteconfig = SiteConfiguration.objects.get_current()
+
+    if (siteconfig.get('diffviewer_prewarm_chunks') and
+        review_request.diffset_history_id and
+        (changedesc is None or 'diff' in changedesc.fields_changed)):
+        get_chunk_cache_warmer().queue_diffset_history(
+            review_request.diffset_history)
+
+
+def _on_review_request_changed(sender, review_request, **kwargs):
+    """Invalidates the cached data for the review request page.
+
+    This is called when a review request is published, closed or reopened.
+    """
+    from reviewboard.reviews.detail import invalidate_review_detail_data
+
+    invalidate_review_detail_data(review_request.pk)
+
+
+def _on_review_changed(sender, **kwargs):
+    """Invalidates the cached data for the review request page.
+
+    This is called when a review or reply is published or deleted.
+    """
+    from reviewboard.reviews.detail import invalidate_review_detail_data
+
+    review = kwargs.get('review') or kwargs.get('reply') or kwargs['instance']
+    invalidate_review_detail_data(review.review_request_id)
+
+
+# The fields of each model that affect who can see review requests, mapped
+# to the ReviewRequestAccessManager method that updates the affected review
+# requests. Populated when signals are connected.
+_access_fields = {}
+
+# The many-to-many relations that affect who can see review requests, keyed
+# by their through model. Populated when signals are connected.
+_access_relations = {}
+
+
+def _get_access_state(instance):
+    fields, update_func_name = _access_fields[type(instance)]
+
+    # This reads from __dict__, so that deferred fields aren't loaded.
+    return tuple(instance.__dict__.get(field) for field in fields)
+
+
+def _on_access_object_initialized(sender, instance, **kwargs):
+    """Stores the fields of an object that affect access to review requests.
+    """
+    instance._access_state = _get_access_state(instance)
+
+
+def _on_access_object_saved(sender, instance, created, **kwargs):
+    """Updates access to review requests when an object's fields change.
+
+    New review requests are always updated. New groups and repositories
+    don't affect any review requests yet.
+    """
+    from reviewboard.reviews.models import ReviewRequest, ReviewRequestAccess
+
+    state = _get_access_state(instance)
+
+    if ((created and sender is ReviewRequest) or
+        (not created and state != getattr(instance, '_access_state', None))):
+        manager = ReviewRequestAccess.objects
+
+        if manager.is_maintained():
+            fields, update_func_name = _access_fields[sender]
+            getattr(manager, update_func_name)([instance.pk])
+
+    instance._access_state = state
+
+
+def _on_group_pre_delete(sender, instance, **kwargs):
+    """Records the review requests affected by a group being deleted."""
+    from reviewboard.reviews.models import ReviewRequestAccess
+
+    manager = ReviewRequestAccess.objects
+
+    if manager.is_maintained():
+        instance._access_review_request_ids = \
+            manager.get_review_request_ids_for_groups([instance.pk])
+
+
+def _on_group_deleted(sender, instance, **kwargs):
+    """Updates access to the review requests affected by a deleted group."""
+    from reviewboard.reviews.models import ReviewRequestAccess
+
+    review_request_ids = getattr(instance, '_access_review_request_ids', None)
+
+    if review_request_ids:
+        ReviewRequestAccess.objects.update_for_review_requests(
+            review_request_ids)
+
+
+def _on_access_relation_changed(sender, instance, action, reverse, pk_set,
+                                **kwargs):
+    """Updates access to review requests when a relation changes.
+
+    This handles changes to review request targets, group members and
+    repository users and groups, from either side of the relation.
+    """
+    from reviewboard.reviews.models import ReviewRequestAccess
+
+    if action not in ('pre_clear', 'post_add', 'post_remove', 'post_clear'):
+        return
+
+    manager = ReviewRequestAccess.objects
+
+    if not manager.is_maintained():
+        return
+
+    field, update_func_name = _access_relations[sender]
+
+    if action == 'pre_clear':
+        if reverse:
+            # The objects being removed from this side of the relation
+            # won't be known after they're cleared, so record them now.
+            instance._access_cleared_pks = list(
+                sender.objects.filter(**{
+                    field.m2m_reverse_field_name(): instance,
+                }).values_list(field.m2m_field_name(), flat=True))
+
+        return
+
+    if not reverse:
+        pks = [instance.pk]
+    elif action == 'post_clear':
+        pks = getattr(instance, '_access_cleared_pks', [])
+    else:
+        pks = pk_set
+
+    if pks:
+        getattr(manager, update_func_name)(pks)
+
+
+def _connect_access_signals():
+    from django.db.models.signals import (m2m_changed, post_delete,
+                                          post_init, post_save, pre_delete)
+
+    from reviewboard.reviews.models import Group, ReviewRequest
+    from reviewboard.scmtools.models import Repository
+
+    _access_fields.update({
+        Group: (('invite_only',), 'update_for_groups'),
+        Repository: (('public',), 'update_for_repositories'),
+        ReviewRequest: (('submitter_id', 'repository_id'),
+                        'update_for_review_requests'),
+    })
+
+    for model in _access_fields:
+        post_init.connect(_on_access_object_initialized, sender=model)
+        post_save.connect(_on_access_object_saved, sender=model)
+
+    pre_delete.connect(_on_group_pre_delete, sender=Group)
+    post_delete.connect(_on_group_deleted, sender=Group)
+
+    for model, field_name, update_func_name in (
+            (ReviewRequest, 'target_groups', 'update_for_review_requests'),
+            (ReviewRequest, 'target_people', 'update_for_review_requests'),
+            (Group, 'users', 'update_for_groups'),
+            (Repository, 'users', 'update_for_repositories'),
+            (Repository, 'review_groups', 'update_for_repositories')):
+        field = model._meta.get_field(field_name)
+        _access_relations[field.rel.through] = (field, update_func_name)
+        m2m_changed.connect(_on_access_relation_changed,
+                            sender=field.rel.through)
+
+
+def _connect_signals(**kwargs):
+    from django.db.models.signals import post_delete
+
+    from reviewboard.reviews.models import Review, ReviewRequest
+    from reviewboard.reviews.signals import (reply_published,
+                                             review_published,
+                                             review_request_closed,
+                                             review_request_published,
+                                             review_request_reopened)
+
+    review_request_published.connect(_on_review_request_published,
+                                     sender=ReviewRequest)
+
+    for signal in (review_request_published, review_request_closed,
+                   review_request_reopened):
+        signal.connect(_on_review_request_changed, sender=ReviewRequest)
+
+    for signal in (review_published, reply_published, post_delete):
+        signal.connect(_on_review_changed, sender=Review)
+
+    _connect_access_signals()
+
+
+initializing.connect(_connect_signals)
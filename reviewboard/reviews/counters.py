@@ -0,0 +1,167 @@
+from __future__ import unicode_literals
+
+import threading
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.utils import six
+from djblets.db.fields import CounterField
+
+
+class CounterJournal(object):
+    """Collects changes to counter fields, to apply them in bulk.
+
+    Changes are recorded as deltas to each counter on each object, and
+    applied together at the end. Objects of a model with the same deltas
+    are updated in a single UPDATE statement, filtered only by ID, rather
+    than in one statement per counter that joins across group memberships,
+    stars and reviewers. Since the objects are looked up when the changes
+    are recorded, rows are only locked for the short, final updates.
+
+    Changes to the counters of a user's LocalSiteProfile can be recorded
+    without looking up the profile. If the profile doesn't exist when the
+    changes are applied, it's created instead, which initializes its
+    counters from the current state of the database.
+    """
+    # The maximum number of IDs to update in one query.
+    BATCH_SIZE = 500
+
+    def __init__(self):
+        self._deltas = {}
+        self._site_profile_deltas = {}
+
+    def add(self, queryset, attname, delta=1):
+        """Records a change to a counter on every object in a queryset."""
+        model_deltas = self._deltas.setdefault(queryset.model, {})
+
+        for pk in set(queryset.values_list('pk', flat=True)):
+            self._add_delta(model_deltas.setdefault(pk, {}), attname, delta)
+
+    def add_for_site_profile(self, user_id, local_site_id, attname,
+                             delta=1):
+        """Records a change to a counter on a user's LocalSiteProfile."""
+        self._add_delta(
+            self._site_profile_deltas.setdefault((user_id, local_site_id),
+                                                 {}),
+            attname, delta)
+
+    def apply(self):
+        """Applies all recorded changes, and clears the journal."""
+        from reviewboard.accounts.models import LocalSiteProfile, Profile
+
+        for model, model_deltas in six.iteritems(self._deltas):
+            pks_by_deltas = {}
+
+            for pk, deltas in six.iteritems(model_deltas):
+                key = self._make_deltas_key(deltas)
+
+                if key:
+                    pks_by_deltas.setdefault(key, []).append(pk)
+
+            for key, pks in six.iteritems(pks_by_deltas):
+                pks.sort()
+                values = self._make_update_values(key)
+
+                for i in range(0, len(pks), self.BATCH_SIZE):
+                    model.objects.filter(
+                        pk__in=pks[i:i + self.BATCH_SIZE]).update(**values)
+
+        for (user_id, local_site_id), deltas in \
+                six.iteritems(self._site_profile_deltas):
+            key = self._make_deltas_key(deltas)
+
+            if not key:
+                continue
+
+            updated = LocalSiteProfile.objects.filter(
+                user=user_id,
+                local_site=local_site_id).update(
+                    **self._make_update_values(key))
+
+            if not updated:
+                user = User.objects.get(pk=user_id)
+                profile, is_new = Profile.objects.get_or_create(user=user)
+                LocalSiteProfile.objects.get_or_create(
+                    user=user,
+                    profile=profile,
+                    local_site_id=local_site_id)
+
+        self._deltas = {}
+        self._site_profile_deltas = {}
+
+    def _add_delta(self, deltas, attname, delta):
+        deltas[attname] = deltas.get(attname, 0) + delta
+
+    def _make_deltas_key(self, deltas):
+        return tuple(sorted(
+            (attname, delta)
+            for attname, delta in six.iteritems(deltas)
+            if delta != 0
+        ))
+
+    def _make_update_values(self, key):
+        return dict(
+            (attname, F(attname) + delta)
+            for attname, delta in key
+        )
+
+
+_local = threading.local()
+
+
+@contextmanager
+def deferred_counter_updates():
+    """Defers changes to counters until the end of a block.
+
+    This yields a CounterJournal for recording changes. When the block
+    finishes, the changes are applied. Nested blocks share the outermost
+    block's journal, so wrapping several operations (such as updates to
+    many review requests) in a block will apply all their changes at once.
+
+    If the block raises an exception, the changes are discarded.
+    """
+    journal = getattr(_local, 'journal', None)
+
+    if journal is not None:
+        yield journal
+        return
+
+    journal = CounterJournal()
+    _local.journal = journal
+
+    try:
+        yield journal
+    finally:
+        _local.journal = None
+
+    journal.apply()
+
+
+def find_counter_drift(queryset):
+    """Finds counter fields that don't match their initialized values.
+
+    Each counter field on each object in the queryset is compared with the
+    value its initializer computes from the current state of the database.
+    Counters that haven't been initialized yet are skipped.
+
+    This yields a tuple of the object, the name of the field, the stored
+    value and the expected value for each counter that differs.
+    """
+    fields = [
+        field
+        for field in queryset.model._meta.fields
+        if isinstance(field, CounterField) and field._initializer
+    ]
+
+    for obj in queryset.iterator():
+        for field in fields:
+            stored = field.value_from_object(obj)
+
+            if stored is None:
+                continue
+
+            expected = field._initializer(obj)
+
+            if expected is not None and stored != expected:
+                yield obj, field.name, stored, expected
@@ -0,0 +1,195 @@
+from __future__ import unicode_literals
+
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from djblets.cache.backend import cache_memoize, make_cache_key
+
+from reviewboard.reviews.models import (BaseComment, Comment,
+                                        FileAttachmentComment,
+                                        ScreenshotComment)
+
+
+# The comment models shown on the review request page, along with the key
+# used for them in each review entry, and the order to show them in.
+COMMENT_TYPES = (
+    (Comment, 'diff_comments',
+     ('comment__filediff', 'comment__first_line', 'comment__timestamp')),
+    (ScreenshotComment, 'screenshot_comments', None),
+    (FileAttachmentComment, 'file_attachment_comments', None),
+)
+
+
+def fetch_review_comments(review_ids):
+    """Yields the comments for a list of reviews.
+
+    This yields tuples of the comment's key in COMMENT_TYPES, the ID of the
+    review it belongs to, and the comment.
+
+    Due to how we initially made the schema, we have a ManyToManyField
+    inbetween comments and reviews, instead of comments having a ForeignKey
+    to the review. This makes it difficult to easily go from a comment to a
+    review ID. Instead, this queries the through table, which lets us grab
+    the review and comment in one go, using select_related.
+    """
+    for model, key, ordering in COMMENT_TYPES:
+        related_field = model.review.related.field
+        comment_field_name = related_field.m2m_reverse_field_name()
+        through = related_field.rel.through
+        q = through.objects.filter(review__in=review_ids).select_related()
+
+        if ordering:
+            q = q.order_by(*ordering)
+
+        for obj in q:
+            yield key, obj.review_id, getattr(obj, comment_field_name)
+
+
+def get_review_detail_data(review_request):
+    """Returns the public reviews, comments and changes for a review request.
+
+    This is the data shown to every user on the review request page, which
+    is expensive to build for review requests with many reviews and
+    comments. It's stored in the cache until a review, reply or change is
+    published, or the review request is closed or reopened (see
+    invalidate_review_detail_data), or an issue's status changes.
+
+    The result is a dictionary with the following keys:
+
+    ``reviews``:
+        The public reviews and replies, with their public body replies
+        linked up.
+
+    ``comments``:
+        A list of (key, comment) tuples for all comments on the public
+        reviews and replies, where key is the comment's key in
+        COMMENT_TYPES. Each comment has its review and public replies
+        linked up.
+
+    ``changedescs``:
+        The public change descriptions, newest first.
+
+    ``issues``:
+        The number of issues in total and in each state.
+
+    ``issue_open_counts``:
+        A mapping of review IDs to the number of open issues on the review.
+
+    The data is loaded from the cache on each call, so callers can attach
+    their own state to the objects.
+    """
+    key = 'review-detail-data:%d:%s:%s:%s' % (
+        review_request.pk,
+        _get_generation(review_request.pk),
+        _format_timestamp(review_request.last_updated),
+        _format_timestamp(review_request.last_review_activity_timestamp))
+
+    return cache_memoize(key,
+                         lambda: _build_review_detail_data(review_request),
+                         large_data=True)
+
+
+def invalidate_review_detail_data(review_request_id):
+    """Invalidates the cached data from get_review_detail_data."""
+    cache.delete(_make_generation_cache_key(review_request_id))
+
+
+def _build_review_detail_data(review_request):
+    reviews = list(review_request.reviews.filter(public=True)
+                   .select_related('user'))
+    reviews_id_map = {}
+
+    for review in reviews:
+        review._body_top_replies = []
+        review._body_bottom_replies = []
+        reviews_id_map[review.pk] = review
+
+    # Link up all the review body replies.
+    for review in reviews:
+        for reply_id, key in ((review.body_top_reply_to_id,
+                               '_body_top_replies'),
+                              (review.body_bottom_reply_to_id,
+                               '_body_bottom_replies')):
+            if reply_id in reviews_id_map:
+                getattr(reviews_id_map[reply_id], key).append(review)
+
+    comments = []
+    comment_maps = {}
+
+    for key, review_id, comment in fetch_review_comments(
+            list(reviews_id_map.keys())):
+        comment._review = reviews_id_map[review_id]
+        comment._replies = []
+        comments.append((key, comment))
+        comment_maps.setdefault(key, {})[comment.pk] = comment
+
+    issues = {
+        'total': 0,
+        'open': 0,
+        'resolved': 0,
+        'dropped': 0,
+    }
+    issue_open_counts = {}
+
+    for key, comment in comments:
+        review = comment._review
+
+        if review.is_reply():
+            # This is a reply to a comment. Add it to the list of replies.
+            # If it isn't a reply to a comment, then it's orphaned. Ignore
+            # it.
+            if comment.is_reply():
+                replied_comment = \
+                    comment_maps[key].get(comment.reply_to_id)
+
+                if replied_comment is not None:
+                    replied_comment._replies.append(comment)
+        elif comment.issue_opened:
+            status_key = comment.issue_status_to_string(comment.issue_status)
+            issues[status_key] += 1
+            issues['total'] += 1
+
+            if comment.issue_status == BaseComment.OPEN:
+                issue_open_counts[review.pk] = \
+                    issue_open_counts.get(review.pk, 0) + 1
+
+    return {
+        'reviews': reviews,
+        'comments': comments,
+        'changedescs': list(review_request.changedescs.filter(public=True)),
+        'issues': issues,
+        'issue_open_counts': issue_open_counts,
+    }
+
+
+def _get_generation(review_request_id):
+    """Returns the cache generation for a review request's detail data.
+
+    The generation is part of the cache key for the data. Invalidating the
+    data removes the generation, and a new, random one is used from then
+    on. Since it's random, data cached before the generation was removed
+    (or evicted from the cache) will never be used.
+    """
+    key = _make_generation_cache_key(review_request_id)
+    generation = cache.get(key)
+
+    if generation is None:
+        generation = uuid.uuid4().hex
+
+        if not cache.add(key, generation, settings.CACHE_EXPIRATION_TIME):
+            # Another process set a generation first. Use theirs.
+            generation = cache.get(key, generation)
+
+    return generation
+
+
+def _make_generation_cache_key(review_request_id):
+    return make_cache_key('review-detail-generation:%d' % review_request_id)
+
+
+def _format_timestamp(timestamp):
+    if timestamp:
+        return timestamp.isoformat()
+    else:
+        return ''
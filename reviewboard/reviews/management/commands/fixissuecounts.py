@@ -0,0 +1,15 @@
+from __future__ import unicode_literals
+
+from django.core.management.base import NoArgsCommand
+
+from reviewboard.reviews.models import ReviewRequest
+
+
+class Command(NoArgsCommand):
+    help = 'Recalculates the issue counts for all review requests.'
+
+    def handle_noargs(self, **options):
+        count = ReviewRequest.objects.recalculate_issue_counts()
+
+        self.stdout.write('Recalculated issue counts. %d review requests '
+                          'have issues.\n' % count)
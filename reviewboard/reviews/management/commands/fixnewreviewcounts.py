@@ -0,0 +1,26 @@
+from __future__ import unicode_literals
+
+import optparse
+
+from django.core.management.base import BaseCommand
+
+from reviewboard.accounts.models import ReviewRequestVisit
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        optparse.make_option('--batch-size', type='int', dest='batch_size',
+                             default=1000,
+                             help='The number of visits to update at a time '
+                                  '(default 1000)'),
+    )
+    help = ('Populates the number of new reviews on each review request '
+            'since each user last visited it, shown in the dashboard.')
+    requires_model_validation = True
+
+    def handle(self, *args, **options):
+        count = ReviewRequestVisit.objects.recalculate_new_review_counts(
+            batch_size=options['batch_size'])
+
+        self.stdout.write('Updated the new review counts for %d review '
+                          'request visits.\n' % count)
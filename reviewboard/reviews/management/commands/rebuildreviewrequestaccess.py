@@ -0,0 +1,94 @@
+from __future__ import unicode_literals
+
+import optparse
+
+from django.core.management.base import BaseCommand
+
+from reviewboard.reviews.models import ReviewRequestAccess
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        optparse.make_option('--batch-size', type='int', dest='batch_size',
+                             default=500,
+                             help='The number of review requests to process '
+                                  'at a time (default 500)'),
+        optparse.make_option('--check', action='store_true', dest='check',
+                             default=False,
+                             help='Report review requests with incorrect '
+                                  'access entries, without changing them'),
+        optparse.make_option('--disable', action='store_true',
+                             dest='disable', default=False,
+                             help='Stop using and maintaining the table, '
+                                  'and remove its entries'),
+    )
+    help = ('Builds the table of who can see each review request, and '
+            'enables its use for lists of review requests')
+    requires_model_validation = True
+
+    def handle(self, *args, **options):
+        manager = ReviewRequestAccess.objects
+
+        if options['disable']:
+            manager.set_table_state(ReviewRequestAccess.TABLE_DISABLED)
+            manager.all().delete()
+            self.stdout.write('Disabled the review request access table.\n')
+        elif options['check']:
+            self._check(manager, options['batch_size'])
+        else:
+            self._rebuild(manager, options['batch_size'])
+
+    def _check(self, manager, batch_size):
+        num_incorrect = 0
+
+        for review_request_id, missing, extra in \
+                manager.find_inconsistencies(batch_size=batch_size):
+            self.stdout.write('Review request %d: missing %s; extra %s\n'
+                              % (review_request_id,
+                                 self._format_user_ids(missing),
+                                 self._format_user_ids(extra)))
+            num_incorrect += 1
+
+        if not manager.is_maintained():
+            self.stdout.write('The review request access table is '
+                              'disabled.\n')
+        elif not num_incorrect:
+            self.stdout.write('All review request access entries are '
+                              'correct.\n')
+        else:
+            self.stdout.write('Found %d review requests with incorrect '
+                              'access entries. Run without --check to fix '
+                              'them.\n' % num_incorrect)
+
+    def _rebuild(self, manager, batch_size):
+        # Changes are tracked from here on, so that the table is up to date
+        # once it's built and enabled.
+        if not manager.is_maintained():
+            manager.set_table_state(ReviewRequestAccess.TABLE_BUILDING)
+
+        self.stdout.write(
+            'Building the review request access table...\n'
+            '\n'
+            'This may take a while. It is safe to continue using Review '
+            'Board while this is\n'
+            'processing.\n'
+            '\n')
+
+        num_changed = manager.rebuild(batch_size=batch_size,
+                                      progress_func=self._report_progress)
+        manager.set_table_state(ReviewRequestAccess.TABLE_ENABLED)
+
+        self.stdout.write('\n'
+                          'Updated the access entries for %d review '
+                          'requests. The table is now enabled.\n'
+                          % num_changed)
+
+    def _format_user_ids(self, user_ids):
+        return ', '.join(sorted(
+            'public' if user_id is None else 'user %d' % user_id
+            for user_id in user_ids
+        )) or 'none'
+
+    def _report_progress(self, last_id):
+        self.stdout.write('Processed review requests up to ID %d\n'
+                          % last_id)
@@ -0,0 +1,49 @@
+from __future__ import unicode_literals
+
+import optparse
+
+from django.core.management.base import BaseCommand
+
+from reviewboard.accounts.models import LocalSiteProfile
+from reviewboard.reviews.counters import find_counter_drift
+from reviewboard.reviews.models import Group
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        optparse.make_option('--fix', action='store_true', dest='fix',
+                             default=False,
+                             help='Reset the incorrect counters, so that '
+                                  'they are recalculated when next used'),
+    )
+    help = ('Checks the review request counters for users and groups '
+            'against the review requests in the database, and reports any '
+            'that are incorrect')
+    requires_model_validation = True
+
+    def handle(self, *args, **options):
+        num_incorrect = 0
+
+        for queryset in (LocalSiteProfile.objects.select_related('user',
+                                                                 'profile',
+                                                                 'local_site'),
+                         Group.objects.select_related('local_site')):
+            for obj, field_name, stored, expected in \
+                    find_counter_drift(queryset):
+                self.stdout.write('%s %s: %s is %d, but should be %d\n'
+                                  % (obj.__class__.__name__, obj, field_name,
+                                     stored, expected))
+                num_incorrect += 1
+
+                if options['fix']:
+                    queryset.model.objects.filter(pk=obj.pk).update(
+                        **{field_name: None})
+
+        if not num_incorrect:
+            self.stdout.write('All counters are correct.\n')
+        elif options['fix']:
+            self.stdout.write('Reset %d incorrect counters.\n'
+                              % num_incorrect)
+        else:
+            self.stdout.write('Found %d incorrect counters. Run with --fix '
+                              'to reset them.\n' % num_incorrect)
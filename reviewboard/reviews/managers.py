@@ -8,6 +8,7 @@ from django.db import connections, router, transaction
 from django.db.models import Manager, Q
 from django.db.models.query import QuerySet
 from djblets.db.managers import ConcurrencyManager
+from djblets.siteconfig.models import SiteConfiguration
 from djblets.util.compat import six
 
 from reviewboard.diffviewer.models import DiffSetHistory
@@ -65,18 +66,16 @@ class ReviewRequestQuerySet(QuerySet):
         if user and user.is_authenticated():
             select_dict = {}
 
+            # The count is maintained on the user's visit to each review
+            # request, so this is a lookup on the visit's unique index.
             select_dict['new_review_count'] = """
-                SELECT COUNT(*)
-                  FROM reviews_review, accounts_reviewrequestvisit
-                  WHERE reviews_review.public
-                    AND reviews_review.review_request_id =
-                        reviews_reviewrequest.id
-                    AND accounts_reviewrequestvisit.review_request_id =
-                        reviews_reviewrequest.id
-                    AND accounts_reviewrequestvisit.user_id = %(user_id)s
-                    AND reviews_review.timestamp >
-                        accounts_reviewrequestvisit.timestamp
-                    AND reviews_review.user_id != %(user_id)s
+                COALESCE((
+                  SELECT accounts_reviewrequestvisit.new_review_count
+                    FROM accounts_reviewrequestvisit
+                    WHERE accounts_reviewrequestvisit.review_request_id =
+                          reviews_reviewrequest.id
+                      AND accounts_reviewrequestvisit.user_id = %(user_id)s
+                ), 0)
             """ % {
                 'user_id': six.text_type(user.id)
             }
@@ -161,6 +160,44 @@ class ReviewRequestManager(ConcurrencyManager):
 
         return review_request
 
+    def recalculate_issue_counts(self, batch_size=500):
+        """Recalculates the issue counters for all review requests.
+
+        The counts are fetched with one grouped query per type of comment,
+        and review requests with the same counts are updated together, so
+        the number of queries doesn't depend on the number of review
+        requests. The updates are made in a single transaction.
+
+        Returns the number of review requests that have issues.
+        """
+        from reviewboard.reviews.models.base_comment import BaseComment
+        from reviewboard.reviews.models.review_request import \
+            fetch_all_issue_counts
+
+        ids_by_counts = {}
+
+        for review_request_id, issue_counts in \
+                six.iteritems(fetch_all_issue_counts()):
+            key = (issue_counts[BaseComment.OPEN],
+                   issue_counts[BaseComment.RESOLVED],
+                   issue_counts[BaseComment.DROPPED])
+            ids_by_counts.setdefault(key, []).append(review_request_id)
+
+        with transaction.commit_on_success():
+            self.update(issue_open_count=0,
+                        issue_resolved_count=0,
+                        issue_dropped_count=0)
+
+            for (open_count, resolved_count, dropped_count), ids in \
+                    six.iteritems(ids_by_counts):
+                for i in range(0, len(ids), batch_size):
+                    self.filter(pk__in=ids[i:i + batch_size]).update(
+                        issue_open_count=open_count,
+                        issue_resolved_count=resolved_count,
+                        issue_dropped_count=dropped_count)
+
+        return sum(len(ids) for ids in six.itervalues(ids_by_counts))
+
     def get_to_group_query(self, group_name, local_site):
         """Returns the query targetting a group.
 
@@ -285,31 +322,57 @@ class ReviewRequestManager(ConcurrencyManager):
         if extra_query:
             query = query & extra_query
 
+        needs_distinct = True
+
         if filter_private and (not user or not user.is_superuser):
-            repo_query = (Q(repository=None) |
-                          Q(repository__public=True))
-            group_query = (Q(target_groups=None) |
-                           Q(target_groups__invite_only=False))
-
-            if is_authenticated:
-                repo_query = repo_query | (
-                    Q(repository__users=user) |
-                    Q(repository__review_groups__users=user))
-                group_query = group_query | Q(target_groups__users=user)
-
-                query = query & (Q(submitter=user) |
-                                 (repo_query &
-                                  (Q(target_people=user) | group_query)))
+            if self._use_access_table():
+                # Each review request has either a public entry or entries
+                # for the users who can see it, so this matches at most one
+                # entry per review request.
+                access_query = Q(access_entries__public=True)
+
+                if is_authenticated:
+                    access_query = (access_query |
+                                    Q(access_entries__user=user))
+
+                query = query & access_query
+                needs_distinct = bool(extra_query)
             else:
-                query = query & repo_query & group_query
+                repo_query = (Q(repository=None) |
+                              Q(repository__public=True))
+                group_query = (Q(target_groups=None) |
+                               Q(target_groups__invite_only=False))
+
+                if is_authenticated:
+                    repo_query = repo_query | (
+                        Q(repository__users=user) |
+                        Q(repository__review_groups__users=user))
+                    group_query = group_query | Q(target_groups__users=user)
+
+                    query = query & (Q(submitter=user) |
+                                     (repo_query &
+                                      (Q(target_people=user) | group_query)))
+                else:
+                    query = query & repo_query & group_query
+
+        query = self.filter(query)
 
-        query = self.filter(query).distinct()
+        if needs_distinct:
+            query = query.distinct()
 
         if with_counts:
             query = query.with_counts(user)
 
         return query
 
+    def _use_access_table(self):
+        """Returns whether to filter private review requests through the
+        ReviewRequestAccess table.
+        """
+        from reviewboard.reviews.models import ReviewRequestAccess
+
+        return ReviewRequestAccess.objects.is_enabled()
+
     def _get_query_user(self, user_or_username):
         """Returns a User object, given a possible User or username."""
         if isinstance(user_or_username, User):
@@ -330,6 +393,305 @@ class ReviewRequestManager(ConcurrencyManager):
                                           Q(local_site=local_site))
 
 
+class ReviewRequestAccessManager(Manager):
+    """A manager for ReviewRequestAccess models.
+
+    The table's state is kept in the ``review_request_access_table``
+    setting. While it's being built or is enabled, the entries are kept up
+    to date by signal handlers (see reviewboard.reviews), which call
+    update_for_review_requests, update_for_groups or update_for_repositories
+    when review requests, groups, repositories or their memberships change.
+    ReviewRequest.objects.public() only uses the table once it's enabled.
+    """
+    def get_table_state(self):
+        """Returns the state of the table, from the site configuration."""
+        siteconfig = SiteConfiguration.objects.get_current()
+
+        return siteconfig.get('review_request_access_table')
+
+    def set_table_state(self, state):
+        """Sets the state of the table in the site configuration."""
+        siteconfig = SiteConfiguration.objects.get_current()
+        siteconfig.set('review_request_access_table', state)
+        siteconfig.save()
+
+    def is_enabled(self):
+        """Returns whether lists of review requests use the table."""
+        return self.get_table_state() == self.model.TABLE_ENABLED
+
+    def is_maintained(self):
+        """Returns whether the table is being kept up to date."""
+        return self.get_table_state() in (self.model.TABLE_BUILDING,
+                                          self.model.TABLE_ENABLED)
+
+    def update_for_review_requests(self, review_request_ids,
+                                   batch_size=500):
+        """Updates the entries for the given review requests.
+
+        Returns the number of review requests whose entries changed.
+        """
+        review_request_ids = sorted(set(review_request_ids))
+        num_changed = 0
+
+        for i in range(0, len(review_request_ids), batch_size):
+            num_changed += len(self._sync(
+                review_request_ids[i:i + batch_size], fix=True))
+
+        return num_changed
+
+    def update_for_groups(self, group_ids):
+        """Updates the entries for review requests affected by groups.
+
+        This covers review requests targeting the groups, and review
+        requests on repositories that grant access to the groups.
+        """
+        return self.update_for_review_requests(
+            self.get_review_request_ids_for_groups(group_ids))
+
+    def update_for_repositories(self, repository_ids):
+        """Updates the entries for review requests on repositories."""
+        from reviewboard.reviews.models import ReviewRequest
+
+        return self.update_for_review_requests(
+            ReviewRequest.objects.filter(repository__in=repository_ids)
+            .values_list('pk', flat=True))
+
+    def get_review_request_ids_for_groups(self, group_ids):
+        """Returns the IDs of review requests whose access depends on groups.
+        """
+        from reviewboard.reviews.models import ReviewRequest
+
+        group_ids = list(group_ids)
+        through = ReviewRequest.target_groups.through
+        ids = set(through.objects.filter(group__in=group_ids)
+                  .values_list('reviewrequest', flat=True))
+        ids.update(ReviewRequest.objects
+                   .filter(repository__review_groups__in=group_ids)
+                   .values_list('pk', flat=True))
+
+        return ids
+
+    def rebuild(self, batch_size=500, progress_func=None):
+        """Rebuilds the entries for all review requests.
+
+        Review requests are processed in batches of IDs, and each batch is
+        committed separately. If provided, progress_func is called with the
+        last ID of each batch.
+
+        Returns the number of review requests whose entries changed.
+        """
+        num_changed = 0
+
+        for review_request_ids in self._iter_review_request_ids(batch_size):
+            with transaction.commit_on_success():
+                num_changed += len(self._sync(review_request_ids, fix=True))
+
+            if progress_func:
+                progress_func(review_request_ids[-1])
+
+        return num_changed
+
+    def find_inconsistencies(self, batch_size=500):
+        """Finds review requests whose entries are out of date.
+
+        This yields a tuple of the review request ID, the user IDs missing
+        from its entries and the user IDs in its entries that shouldn't be.
+        None in either set stands for the public entry.
+        """
+        for review_request_ids in self._iter_review_request_ids(batch_size):
+            for result in self._sync(review_request_ids, fix=False):
+                yield result
+
+    def _iter_review_request_ids(self, batch_size):
+        from reviewboard.reviews.models import ReviewRequest
+
+        last_id = 0
+
+        while True:
+            review_request_ids = list(
+                ReviewRequest.objects.filter(pk__gt=last_id).order_by('pk')
+                .values_list('pk', flat=True)[:batch_size])
+
+            if not review_request_ids:
+                break
+
+            yield review_request_ids
+            last_id = review_request_ids[-1]
+
+    def _sync(self, review_request_ids, fix):
+        """Compares and optionally fixes the entries for review requests.
+
+        Returns a list of (review_request_id, missing, extra) tuples for
+        the review requests whose entries differ from the computed ones.
+        """
+        expected = self._compute_user_ids(review_request_ids)
+        stored = {}
+        stored_pks = {}
+
+        for pk, review_request_id, user_id, public in \
+                self.filter(review_request__in=review_request_ids) \
+                    .values_list('pk', 'review_request', 'user', 'public'):
+            if public:
+                user_id = None
+
+            stored.setdefault(review_request_id, set()).add(user_id)
+            stored_pks[(review_request_id, user_id)] = pk
+
+        results = []
+        extra_pks = []
+        new_entries = []
+
+        for review_request_id in review_request_ids:
+            expected_ids = expected.get(review_request_id, set())
+            stored_ids = stored.get(review_request_id, set())
+            missing = expected_ids - stored_ids
+            extra = stored_ids - expected_ids
+
+            if not missing and not extra:
+                continue
+
+            results.append((review_request_id, missing, extra))
+            extra_pks += [
+                stored_pks[(review_request_id, user_id)]
+                for user_id in extra
+            ]
+            new_entries += [
+                self.model(review_request_id=review_request_id,
+                           user_id=user_id,
+                           public=(user_id is None))
+                for user_id in missing
+            ]
+
+        if fix:
+            if extra_pks:
+                self.filter(pk__in=extra_pks).delete()
+
+            if new_entries:
+                self.bulk_create(new_entries)
+
+        return results
+
+    def _compute_user_ids(self, review_request_ids):
+        """Computes who can see each of the given review requests.
+
+        This follows the same rules as ReviewRequest.objects.public(), with
+        one query per relation for the whole list of review requests.
+
+        Returns a dictionary mapping review request IDs to sets of user IDs,
+        or to a set containing only None if anyone can see the review
+        request.
+        """
+        from reviewboard.reviews.models import Group, ReviewRequest
+        from reviewboard.scmtools.models import Repository
+
+        review_requests = list(
+            ReviewRequest.objects.filter(pk__in=review_request_ids)
+            .values_list('pk', 'submitter', 'repository',
+                         'repository__public'))
+
+        target_people = {}
+        target_groups = {}
+
+        for review_request_id, user_id in \
+                ReviewRequest.target_people.through.objects \
+                    .filter(reviewrequest__in=review_request_ids) \
+                    .values_list('reviewrequest', 'user'):
+            target_people.setdefault(review_request_id, set()).add(user_id)
+
+        for review_request_id, group_id, invite_only in \
+                ReviewRequest.target_groups.through.objects \
+                    .filter(reviewrequest__in=review_request_ids) \
+                    .values_list('reviewrequest', 'group',
+                                 'group__invite_only'):
+            target_groups.setdefault(review_request_id, []).append(
+                (group_id, invite_only))
+
+        private_repository_ids = set(
+            repository_id
+            for pk, submitter_id, repository_id, repository_public
+            in review_requests
+            if repository_id is not None and not repository_public
+        )
+        repository_users = {}
+        repository_groups = {}
+
+        if private_repository_ids:
+            for repository_id, user_id in \
+                    Repository.users.through.objects \
+                        .filter(repository__in=private_repository_ids) \
+                        .values_list('repository', 'user'):
+                repository_users.setdefault(repository_id, set()).add(
+                    user_id)
+
+            for repository_id, group_id in \
+                    Repository.review_groups.through.objects \
+                        .filter(repository__in=private_repository_ids) \
+                        .values_list('repository', 'group'):
+                repository_groups.setdefault(repository_id, set()).add(
+                    group_id)
+
+        group_ids = set()
+
+        for group_ids_for_repository in six.itervalues(repository_groups):
+            group_ids.update(group_ids_for_repository)
+
+        for groups in six.itervalues(target_groups):
+            group_ids.update(group_id for group_id, invite_only in groups)
+
+        group_users = {}
+
+        if group_ids:
+            for group_id, user_id in \
+                    Group.users.through.objects \
+                        .filter(group__in=group_ids) \
+                        .values_list('group', 'user'):
+                group_users.setdefault(group_id, set()).add(user_id)
+
+        # Users with access to each private repository, either directly or
+        # through a group.
+        for repository_id in private_repository_ids:
+            user_ids = repository_users.setdefault(repository_id, set())
+
+            for group_id in repository_groups.get(repository_id, []):
+                user_ids.update(group_users.get(group_id, []))
+
+        result = {}
+
+        for review_request_id, submitter_id, repository_id, \
+                repository_public in review_requests:
+            groups = target_groups.get(review_request_id, [])
+            repository_is_public = (repository_id is None or
+                                    repository_public)
+            groups_are_public = (not groups or
+                                 any(not invite_only
+                                     for group_id, invite_only in groups))
+
+            if repository_is_public and groups_are_public:
+                result[review_request_id] = set([None])
+                continue
+
+            if groups_are_public:
+                # Only the repository limits who can see this.
+                user_ids = set(repository_users[repository_id])
+            else:
+                # Only the target people and members of the (invite-only)
+                # target groups can see this, if they can see the
+                # repository.
+                user_ids = set(target_people.get(review_request_id, []))
+
+                for group_id, invite_only in groups:
+                    user_ids.update(group_users.get(group_id, []))
+
+                if not repository_is_public:
+                    user_ids &= repository_users[repository_id]
+
+            # Users can always see their own review requests.
+            user_ids.add(submitter_id)
+            result[review_request_id] = user_ids
+
+        return result
+
+
 class ReviewManager(ConcurrencyManager):
     """A manager for Review models.
 
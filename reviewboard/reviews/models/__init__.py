@@ -8,6 +8,8 @@ from reviewboard.reviews.models.file_attachment_comment import \
 from reviewboard.reviews.models.group import Group
 from reviewboard.reviews.models.review import Review
 from reviewboard.reviews.models.review_request import ReviewRequest
+from reviewboard.reviews.models.review_request_access import \
+    ReviewRequestAccess
 from reviewboard.reviews.models.review_request_draft import ReviewRequestDraft
 from reviewboard.reviews.models.screenshot import Screenshot
 from reviewboard.reviews.models.screenshot_comment import ScreenshotComment
@@ -21,6 +23,7 @@ __all__ = [
     'Group',
     'Review',
     'ReviewRequest',
+    'ReviewRequestAccess',
     'ReviewRequestDraft',
     'Screenshot',
     'ScreenshotComment',
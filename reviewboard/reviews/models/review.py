@@ -3,7 +3,7 @@ from __future__ import unicode_literals
 from django.contrib.auth.models import User
 from django.db import models
 from django.db.models import Q
-from django.utils import timezone
+from django.utils import six, timezone
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
 from djblets.db.fields import CounterField, JSONField
@@ -181,6 +181,8 @@ class Review(models.Model):
         This will make the review public and update the timestamps of all
         contained comments.
         """
+        from reviewboard.accounts.models import ReviewRequestVisit
+
         if not user:
             user = self.user
 
@@ -197,6 +199,10 @@ class Review(models.Model):
         self.review_request.save(
             update_fields=['last_review_activity_timestamp'])
 
+        # Count this as a new review for everyone who has visited the
+        # review request.
+        ReviewRequestVisit.objects.add_new_review(self)
+
         issue_counts = fetch_issue_counts(self.review_request, Q(pk=self.pk))
 
         # Since we're publishing the review, all filed issues should be
@@ -230,7 +236,24 @@ class Review(models.Model):
         """Deletes this review.
 
         This will enforce that all contained comments are also deleted.
+        If the review is public, its issues are removed from the review
+        request's issue counts, and it's no longer counted as a new review.
         """
+        from reviewboard.accounts.models import ReviewRequestVisit
+
+        if self.public:
+            ReviewRequestVisit.objects.remove_new_review(self)
+
+            issue_counts = fetch_issue_counts(self.review_request,
+                                              Q(pk=self.pk))
+
+            CounterField.increment_many(
+                self.review_request,
+                dict(
+                    (ReviewRequest.ISSUE_COUNTER_FIELDS[issue_status], -count)
+                    for issue_status, count in six.iteritems(issue_counts)
+                ))
+
         self.comments.all().delete()
         self.screenshot_comments.all().delete()
         self.file_attachment_comments.all().delete()
@@ -3,7 +3,7 @@ from __future__ import unicode_literals
 from django.contrib.auth.models import User
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
-from django.db.models import Q
+from django.db.models import Count, Q
 from django.utils import six, timezone
 from django.utils.translation import ugettext_lazy as _
 from djblets.db.fields import CounterField, ModificationTimestampField
@@ -12,13 +12,18 @@ from djblets.db.query import get_object_or_none
 from reviewboard.attachments.models import FileAttachment
 from reviewboard.changedescs.models import ChangeDescription
 from reviewboard.diffviewer.models import DiffSet, DiffSetHistory, FileDiff
+from reviewboard.reviews.counters import deferred_counter_updates
 from reviewboard.reviews.errors import PermissionError
 from reviewboard.reviews.managers import ReviewRequestManager
 from reviewboard.reviews.models.base_comment import BaseComment
 from reviewboard.reviews.models.base_review_request_details import \
     BaseReviewRequestDetails
+from reviewboard.reviews.models.diff_comment import Comment
+from reviewboard.reviews.models.file_attachment_comment import \
+    FileAttachmentComment
 from reviewboard.reviews.models.group import Group
 from reviewboard.reviews.models.screenshot import Screenshot
+from reviewboard.reviews.models.screenshot_comment import ScreenshotComment
 from reviewboard.reviews.signals import (review_request_published,
                                          review_request_reopened,
                                          review_request_closed)
@@ -27,36 +32,79 @@ from reviewboard.site.models import LocalSite
 from reviewboard.site.urlresolvers import local_site_reverse
 
 
+# The types of comments that can have issues.
+ISSUE_COMMENT_MODELS = (Comment, FileAttachmentComment, ScreenshotComment)
+
+ISSUE_STATUSES = (BaseComment.OPEN, BaseComment.RESOLVED, BaseComment.DROPPED)
+
+
+def _fetch_grouped_issue_counts(query, group_by=()):
+    """Yields the number of issues in each status for each type of comment.
+
+    This runs one grouped aggregate query per type of comment. Querying
+    across all the comment relations at once would instead return the
+    product of each type of comment on each review.
+
+    Each result is a dictionary containing the fields in group_by, the
+    issue_status, and the number of issues as num_issues.
+    """
+    for model in ISSUE_COMMENT_MODELS:
+        rows = (
+            model.objects
+            .filter(query, issue_status__in=ISSUE_STATUSES)
+            .values(*(tuple(group_by) + ('issue_status',)))
+            .annotate(num_issues=Count('pk'))
+            .order_by()
+        )
+
+        for row in rows:
+            yield row
+
+
 def fetch_issue_counts(review_request, extra_query=None):
     """Fetches all issue counts for a review request.
 
     This queries all opened issues across all public comments on a
     review request and returns them.
     """
-    issue_counts = {
-        BaseComment.OPEN: 0,
-        BaseComment.RESOLVED: 0,
-        BaseComment.DROPPED: 0
-    }
+    issue_counts = dict.fromkeys(ISSUE_STATUSES, 0)
 
     q = Q(public=True)
 
     if extra_query:
         q = q & extra_query
 
-    issue_statuses = review_request.reviews.filter(q).values(
-        'comments__issue_status',
-        'file_attachment_comments__issue_status',
-        'screenshot_comments__issue_status')
-
-    for issue_fields in issue_statuses:
-        for issue_status in issue_fields.itervalues():
-            if issue_status:
-                issue_counts[issue_status] += 1
+    for row in _fetch_grouped_issue_counts(
+            Q(review__in=review_request.reviews.filter(q))):
+        issue_counts[row['issue_status']] += row['num_issues']
 
     return issue_counts
 
 
+def fetch_all_issue_counts():
+    """Fetches the issue counts for all review requests.
+
+    This returns a dictionary mapping the IDs of review requests with
+    issues on public comments to their issue counts. Review requests
+    without any issues aren't included.
+    """
+    all_issue_counts = {}
+
+    for row in _fetch_grouped_issue_counts(
+            Q(review__public=True),
+            group_by=('review__review_request',)):
+        review_request_id = row['review__review_request']
+
+        if review_request_id not in all_issue_counts:
+            all_issue_counts[review_request_id] = \
+                dict.fromkeys(ISSUE_STATUSES, 0)
+
+        all_issue_counts[review_request_id][row['issue_status']] += \
+            row['num_issues']
+
+    return all_issue_counts
+
+
 def _initialize_issue_counts(review_request):
     """Initializes the issue counter fields for a review request.
 
@@ -480,55 +528,35 @@ class ReviewRequest(BaseReviewRequestDetails):
         return self._blocks
 
     def save(self, update_counts=False, **kwargs):
-        if update_counts or self.id is None:
-            self._update_counts()
+        # Changes to counters are applied once the review request has been
+        # saved, or at the end of an enclosing deferred_counter_updates()
+        # block.
+        with deferred_counter_updates() as counters:
+            if update_counts or self.id is None:
+                self._update_counts(counters)
 
-        if self.status != self.PENDING_REVIEW:
-            # If this is not a pending review request now, delete any
-            # and all ReviewRequestVisit objects.
-            self.visits.all().delete()
+            if self.status != self.PENDING_REVIEW:
+                # If this is not a pending review request now, delete any
+                # and all ReviewRequestVisit objects.
+                self.visits.all().delete()
 
-        super(ReviewRequest, self).save(**kwargs)
+            super(ReviewRequest, self).save(**kwargs)
 
     def delete(self, **kwargs):
-        from reviewboard.accounts.models import Profile, LocalSiteProfile
+        with deferred_counter_updates() as counters:
+            counters.add_for_site_profile(self.submitter_id,
+                                          self.local_site_id,
+                                          'total_outgoing_request_count', -1)
 
-        profile, profile_is_new = \
-            Profile.objects.get_or_create(user=self.submitter)
+            if self.status == self.PENDING_REVIEW:
+                counters.add_for_site_profile(
+                    self.submitter_id, self.local_site_id,
+                    'pending_outgoing_request_count', -1)
 
-        if profile_is_new:
-            profile.save()
+            if self.public:
+                self._add_incoming_counts(counters, -1)
 
-        local_site = self.local_site
-        site_profile, site_profile_is_new = \
-            LocalSiteProfile.objects.get_or_create(user=self.submitter,
-                                                   profile=profile,
-                                                   local_site=local_site)
-
-        site_profile.decrement_total_outgoing_request_count()
-
-        if self.status == self.PENDING_REVIEW:
-            site_profile.decrement_pending_outgoing_request_count()
-
-        if self.public:
-            people = self.target_people.all()
-            groups = self.target_groups.all()
-
-            Group.incoming_request_count.decrement(groups)
-            LocalSiteProfile.direct_incoming_request_count.decrement(
-                LocalSiteProfile.objects.filter(user__in=people,
-                                                local_site=local_site))
-            LocalSiteProfile.total_incoming_request_count.decrement(
-                LocalSiteProfile.objects.filter(
-                    Q(local_site=local_site) &
-                    Q(Q(user__review_groups__in=groups) |
-                      Q(user__in=people))))
-            LocalSiteProfile.starred_public_request_count.decrement(
-                LocalSiteProfile.objects.filter(
-                    profile__starred_review_requests=self,
-                    local_site=local_site))
-
-        super(ReviewRequest, self).delete(**kwargs)
+            super(ReviewRequest, self).delete(**kwargs)
 
     def can_publish(self):
         return not self.public or get_object_or_none(self.draft) is not None
@@ -672,80 +700,61 @@ class ReviewRequest(BaseReviewRequestDetails):
                                       review_request=self,
                                       changedesc=changes)
 
-    def _update_counts(self):
-        from reviewboard.accounts.models import Profile, LocalSiteProfile
-
-        profile, profile_is_new = \
-            Profile.objects.get_or_create(user=self.submitter)
-
-        if profile_is_new:
-            profile.save()
-
-        local_site = self.local_site
-        site_profile, site_profile_is_new = \
-            LocalSiteProfile.objects.get_or_create(
-                user=self.submitter,
-                profile=profile,
-                local_site=local_site)
-
-        if site_profile_is_new:
-            site_profile.save()
+    def _update_counts(self, counters):
+        """Records changes to the counters affected by saving this.
 
+        The changes are recorded in the CounterJournal provided.
+        """
         if self.id is None:
             # This hasn't been created yet. Bump up the outgoing request
             # count for the user.
-            site_profile.increment_total_outgoing_request_count()
+            counters.add_for_site_profile(self.submitter_id,
+                                          self.local_site_id,
+                                          'total_outgoing_request_count')
             old_status = None
             old_public = False
         else:
             # We need to see if the status has changed, so that means
             # finding out what's in the database.
-            r = ReviewRequest.objects.get(pk=self.id)
-            old_status = r.status
-            old_public = r.public
+            old_status, old_public = \
+                ReviewRequest.objects.values_list('status', 'public').get(
+                    pk=self.id)
 
         if self.status == self.PENDING_REVIEW:
             if old_status != self.status:
-                site_profile.increment_pending_outgoing_request_count()
+                counters.add_for_site_profile(
+                    self.submitter_id, self.local_site_id,
+                    'pending_outgoing_request_count')
 
             if self.public and self.id is not None:
-                groups = self.target_groups.all()
-                people = self.target_people.all()
-
-                Group.incoming_request_count.increment(groups)
-                LocalSiteProfile.direct_incoming_request_count.increment(
-                    LocalSiteProfile.objects.filter(user__in=people,
-                                                    local_site=local_site))
-                LocalSiteProfile.total_incoming_request_count.increment(
-                    LocalSiteProfile.objects.filter(
-                        Q(local_site=local_site) &
-                        Q(Q(user__review_groups__in=groups) |
-                          Q(user__in=people))))
-                LocalSiteProfile.starred_public_request_count.increment(
-                    LocalSiteProfile.objects.filter(
-                        profile__starred_review_requests=self,
-                        local_site=local_site))
+                self._add_incoming_counts(counters, 1)
         else:
             if old_status != self.status:
-                site_profile.decrement_pending_outgoing_request_count()
+                counters.add_for_site_profile(
+                    self.submitter_id, self.local_site_id,
+                    'pending_outgoing_request_count', -1)
 
             if old_public:
-                groups = self.target_groups.all()
-                people = self.target_people.all()
-
-                Group.incoming_request_count.decrement(groups)
-                LocalSiteProfile.direct_incoming_request_count.decrement(
-                    LocalSiteProfile.objects.filter(user__in=people,
-                                                    local_site=local_site))
-                LocalSiteProfile.total_incoming_request_count.decrement(
-                    LocalSiteProfile.objects.filter(
-                        Q(local_site=local_site) &
-                        Q(Q(user__review_groups__in=groups) |
-                          Q(user__in=people))))
-                LocalSiteProfile.starred_public_request_count.decrement(
-                    LocalSiteProfile.objects.filter(
-                        profile__starred_review_requests=self,
-                        local_site=local_site))
+                self._add_incoming_counts(counters, -1)
+
+    def _add_incoming_counts(self, counters, delta):
+        """Records changes to the incoming counts for the reviewers."""
+        from reviewboard.accounts.models import LocalSiteProfile
+
+        groups = self.target_groups.all()
+        people = self.target_people.all()
+        site_profiles = LocalSiteProfile.objects.filter(
+            local_site=self.local_site_id)
+
+        counters.add(groups, 'incoming_request_count', delta)
+        counters.add(site_profiles.filter(user__in=people),
+                     'direct_incoming_request_count', delta)
+        counters.add(site_profiles.filter(Q(user__review_groups__in=groups) |
+                                          Q(user__in=people)),
+                     'total_incoming_request_count', delta)
+        counters.add(site_profiles.filter(
+                         profile__starred_review_requests=self),
+                     'starred_public_request_count', delta)
 
     def get_review_request(self):
         """Returns this review request.
@@ -0,0 +1,51 @@
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import User
+from django.db import models
+from django.utils.encoding import python_2_unicode_compatible
+from django.utils.translation import ugettext_lazy as _
+
+from reviewboard.reviews.managers import ReviewRequestAccessManager
+from reviewboard.reviews.models.review_request import ReviewRequest
+
+
+@python_2_unicode_compatible
+class ReviewRequestAccess(models.Model):
+    """Records who can see a review request in lists of review requests.
+
+    This is a precomputed form of the access checks that
+    ReviewRequest.objects.public() performs, based on the review request's
+    submitter, repository and target groups and people. Lists of review
+    requests can then be filtered with a single join on this table, rather
+    than joins across all of those.
+
+    A review request that anyone can see has a single entry with ``public``
+    set. Otherwise, it has an entry for each user who can see it, including
+    the submitter.
+
+    This is only used when the ``review_request_access_table`` setting is
+    ``enabled``. See ReviewRequestAccessManager for how it's kept up to
+    date.
+    """
+    # Values for the review_request_access_table setting.
+    TABLE_DISABLED = 'disabled'
+    TABLE_BUILDING = 'building'
+    TABLE_ENABLED = 'enabled'
+
+    review_request = models.ForeignKey(ReviewRequest,
+                                       related_name='access_entries')
+    user = models.ForeignKey(User, blank=True, null=True,
+                             related_name='+')
+    public = models.BooleanField(_('public'), default=False)
+
+    objects = ReviewRequestAccessManager()
+
+    def __str__(self):
+        if self.public:
+            return '%s: public' % self.review_request_id
+        else:
+            return '%s: %s' % (self.review_request_id, self.user_id)
+
+    class Meta:
+        app_label = 'reviews'
+        unique_together = (('review_request', 'user'),)
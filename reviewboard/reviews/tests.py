@@ -7,6 +7,7 @@ import os
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser, User
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
 from django.template import Context, Template
 from django.utils import six
@@ -14,15 +15,22 @@ from djblets.siteconfig.models import SiteConfiguration
 from djblets.testing.decorators import add_fixtures
 from kgb import SpyAgency
 
+from reviewboard import initialize
 from reviewboard.accounts.models import Profile, LocalSiteProfile
 from reviewboard.attachments.models import FileAttachment
+from reviewboard.diffviewer.cache_warmer import get_chunk_cache_warmer
+from reviewboard.reviews.counters import (CounterJournal,
+                                          deferred_counter_updates)
+from reviewboard.reviews.detail import get_review_detail_data
 from reviewboard.reviews.forms import DefaultReviewerForm, GroupForm
 from reviewboard.reviews.markdown_utils import (markdown_escape,
                                                 markdown_unescape)
-from reviewboard.reviews.models import (Comment,
+from reviewboard.reviews.models import (BaseComment,
+                                        Comment,
                                         DefaultReviewer,
                                         Group,
                                         ReviewRequest,
+                                        ReviewRequestAccess,
                                         ReviewRequestDraft,
                                         Review,
                                         Screenshot)
@@ -527,6 +535,168 @@ class ReviewRequestManagerTests(TestCase):
                             % summary)
 
 
+class ReviewRequestAccessTests(ReviewRequestManagerTests):
+    """Tests ReviewRequestManager functions with the ReviewRequestAccess
+    table enabled.
+
+    This runs all of ReviewRequestManagerTests with the table in use, and
+    checks that the table is consistent after each test.
+    """
+    def setUp(self):
+        super(ReviewRequestAccessTests, self).setUp()
+
+        initialize()
+
+        ReviewRequestAccess.objects.set_table_state(
+            ReviewRequestAccess.TABLE_ENABLED)
+
+    def tearDown(self):
+        self.assertEqual(
+            list(ReviewRequestAccess.objects.find_inconsistencies()), [])
+
+        ReviewRequestAccess.objects.set_table_state(
+            ReviewRequestAccess.TABLE_DISABLED)
+
+        super(ReviewRequestAccessTests, self).tearDown()
+
+    def test_public_without_distinct(self):
+        """Testing ReviewRequest.objects.public filters through the access
+        table without DISTINCT
+        """
+        user = User.objects.get(username='grumpy')
+        review_requests = ReviewRequest.objects.public(user=user)
+
+        self.assertFalse(review_requests.query.distinct)
+        self.assertIn('reviews_reviewrequestaccess',
+                      six.text_type(review_requests.query))
+        self.assertNotIn('reviews_reviewrequest_target_groups',
+                         six.text_type(review_requests.query))
+
+    def test_group_membership_changes(self):
+        """Testing ReviewRequestAccess updates when group members change"""
+        user = User.objects.get(username='grumpy')
+        group = self.create_review_group(invite_only=True)
+
+        review_request = self.create_review_request(publish=True)
+        review_request.target_groups.add(group)
+        self.assertEqual(ReviewRequest.objects.public(user=user).count(), 0)
+
+        group.users.add(user)
+        self.assertEqual(ReviewRequest.objects.public(user=user).count(), 1)
+
+        user.review_groups.clear()
+        self.assertEqual(ReviewRequest.objects.public(user=user).count(), 0)
+
+        user.review_groups.add(group)
+        self.assertEqual(ReviewRequest.objects.public(user=user).count(), 1)
+
+        group.users.remove(user)
+        self.assertEqual(ReviewRequest.objects.public(user=user).count(), 0)
+
+    def test_group_invite_only_changes(self):
+        """Testing ReviewRequestAccess updates when a group's invite_only
+        changes
+        """
+        group = self.create_review_group(invite_only=True)
+
+        review_request = self.create_review_request(publish=True)
+        review_request.target_groups.add(group)
+        self.assertEqual(ReviewRequest.objects.public().count(), 0)
+
+        group.invite_only = False
+        group.save()
+        self.assertEqual(ReviewRequest.objects.public().count(), 1)
+
+    def test_group_deleted(self):
+        """Testing ReviewRequestAccess updates when a group is deleted"""
+        group = self.create_review_group(invite_only=True)
+
+        review_request = self.create_review_request(publish=True)
+        review_request.target_groups.add(group)
+        self.assertEqual(ReviewRequest.objects.public().count(), 0)
+
+        group.delete()
+        self.assertEqual(ReviewRequest.objects.public().count(), 1)
+
+    @add_fixtures(['test_scmtools'])
+    def test_repository_changes(self):
+        """Testing ReviewRequestAccess updates when a repository's access
+        changes
+        """
+        user = User.objects.get(username='grumpy')
+        group = self.create_review_group(invite_only=True)
+        group.users.add(user)
+
+        repository = self.create_repository(public=False)
+        self.create_review_request(repository=repository, publish=True)
+        self.assertEqual(ReviewRequest.objects.public(user=user).count(), 0)
+
+        repository.review_groups.add(group)
+        self.assertEqual(ReviewRequest.objects.public(user=user).count(), 1)
+
+        group.repositories.clear()
+        self.assertEqual(ReviewRequest.objects.public(user=user).count(), 0)
+
+        repository.public = True
+        repository.save()
+        self.assertEqual(ReviewRequest.objects.public().count(), 1)
+
+    @add_fixtures(['test_scmtools'])
+    def test_rebuild(self):
+        """Testing ReviewRequestAccess.objects.rebuild"""
+        ReviewRequestAccess.objects.set_table_state(
+            ReviewRequestAccess.TABLE_DISABLED)
+
+        user = User.objects.get(username='grumpy')
+        repository = self.create_repository(public=False)
+        repository.users.add(user)
+        review_request1 = self.create_review_request(repository=repository,
+                                                     publish=True)
+        review_request2 = self.create_review_request(publish=True)
+        self.assertEqual(ReviewRequestAccess.objects.count(), 0)
+
+        self.assertEqual(ReviewRequestAccess.objects.rebuild(batch_size=1),
+                         2)
+        self.assertEqual(
+            set(ReviewRequestAccess.objects.values_list('review_request',
+                                                        'user', 'public')),
+            set([
+                (review_request1.pk, review_request1.submitter_id, False),
+                (review_request1.pk, user.pk, False),
+                (review_request2.pk, None, True),
+            ]))
+
+        self.assertEqual(ReviewRequestAccess.objects.rebuild(), 0)
+
+    def test_command(self):
+        """Testing the rebuildreviewrequestaccess management command"""
+        group = self.create_review_group(invite_only=True)
+        review_request = self.create_review_request(publish=True)
+        review_request.target_groups.add(group)
+
+        ReviewRequestAccess.objects.all().delete()
+
+        stdout = six.StringIO()
+        call_command('rebuildreviewrequestaccess', check=True, stdout=stdout)
+        self.assertIn('Review request %d: missing user %d; extra none'
+                      % (review_request.pk, review_request.submitter_id),
+                      stdout.getvalue())
+        self.assertIn('Found 1 review requests with incorrect access '
+                      'entries.',
+                      stdout.getvalue())
+
+        stdout = six.StringIO()
+        call_command('rebuildreviewrequestaccess', stdout=stdout)
+        self.assertIn('Updated the access entries for 1 review requests.',
+                      stdout.getvalue())
+        self.assertTrue(ReviewRequestAccess.objects.is_enabled())
+
+        stdout = six.StringIO()
+        call_command('rebuildreviewrequestaccess', check=True, stdout=stdout)
+        self.assertEqual(stdout.getvalue(),
+                         'All review request access entries are correct.\n')
+
+
 class ReviewRequestTests(TestCase):
     """Tests for ReviewRequest."""
     fixtures = ['test_users']
@@ -1615,6 +1785,175 @@ class PostCommitTests(SpyAgency, TestCase):
                           lambda: review_request.update_from_commit_id('4'))
 
 
+class DiffCacheWarmingTests(SpyAgency, TestCase):
+    fixtures = ['test_users', 'test_scmtools']
+
+    def setUp(self):
+        super(DiffCacheWarmingTests, self).setUp()
+
+        initialize()
+
+        self.siteconfig = SiteConfiguration.objects.get_current()
+        self.siteconfig.set('diffviewer_prewarm_chunks', True)
+
+        self.warmer = get_chunk_cache_warmer()
+        self.spy_on(self.warmer.queue_diffset,
+                    call_fake=lambda *args, **kwargs: True)
+
+    def tearDown(self):
+        super(DiffCacheWarmingTests, self).tearDown()
+
+        self.siteconfig.set('diffviewer_prewarm_chunks', False)
+
+    def test_publish_with_diffs(self):
+        """Testing diff chunk pre-generation when publishing new diffs"""
+        review_request = self.create_review_request(create_repository=True)
+        diffset1 = self.create_diffset(review_request, revision=1)
+        diffset2 = self.create_diffset(review_request, revision=2)
+
+        review_request.publish(review_request.submitter)
+
+        calls = self.warmer.queue_diffset.spy.calls
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(calls[0].called_with(diffset2))
+        self.assertTrue(calls[1].called_with(diffset1, interdiffset=diffset2))
+
+    def test_publish_with_prewarm_disabled(self):
+        """Testing diff chunk pre-generation when disabled"""
+        self.siteconfig.set('diffviewer_prewarm_chunks', False)
+
+        review_request = self.create_review_request(create_repository=True)
+        self.create_diffset(review_request)
+
+        review_request.publish(review_request.submitter)
+
+        self.assertFalse(self.warmer.queue_diffset.spy.called)
+
+
+class ReviewDetailDataTests(TestCase):
+    """Unit tests for the cached data for the review request page."""
+    fixtures = ['test_users', 'test_scmtools']
+
+    def setUp(self):
+        super(ReviewDetailDataTests, self).setUp()
+
+        initialize()
+
+        self.siteconfig = SiteConfiguration.objects.get_current()
+        self.siteconfig.set('auth_require_sitewide_login', False)
+        self.siteconfig.save()
+
+        self.review_request = self.create_review_request(
+            create_repository=True, publish=True)
+        diffset = self.create_diffset(self.review_request)
+        self.filediff = self.create_filediff(diffset)
+
+        self.review = self.create_review(self.review_request, user='doc')
+        self.comment = self.create_diff_comment(self.review, self.filediff,
+                                                issue_opened=True)
+        self.review.publish()
+
+    def _get_review_request(self):
+        return ReviewRequest.objects.get(pk=self.review_request.pk)
+
+    def test_get_review_detail_data(self):
+        """Testing get_review_detail_data"""
+        data = get_review_detail_data(self._get_review_request())
+
+        self.assertEqual(data['reviews'], [self.review])
+        self.assertEqual(data['comments'], [('diff_comments', self.comment)])
+        self.assertEqual(data['issues'], {
+            'total': 1,
+            'open': 1,
+            'resolved': 0,
+            'dropped': 0,
+        })
+        self.assertEqual(data['issue_open_counts'], {self.review.pk: 1})
+
+    def test_get_review_detail_data_cached(self):
+        """Testing get_review_detail_data uses the cache"""
+        review_request = self._get_review_request()
+        get_review_detail_data(review_request)
+
+        with self.assertNumQueries(0):
+            data = get_review_detail_data(review_request)
+
+        self.assertEqual(data['comments'], [('diff_comments', self.comment)])
+        self.assertEqual(data['comments'][0][1]._review, self.review)
+
+    def test_invalidated_on_reply_published(self):
+        """Testing get_review_detail_data after publishing a reply"""
+        review_request = self._get_review_request()
+        get_review_detail_data(review_request)
+
+        reply = self.create_reply(self.review)
+        reply_comment = self.create_diff_comment(reply, self.filediff,
+                                                 reply_to=self.comment)
+
+        # Simulate the same timestamps as before, so that only the signal
+        # invalidates the data.
+        timestamp = review_request.last_review_activity_timestamp
+        reply.publish()
+        ReviewRequest.objects.filter(pk=review_request.pk).update(
+            last_review_activity_timestamp=timestamp)
+
+        data = get_review_detail_data(self._get_review_request())
+
+        self.assertEqual(data['reviews'], [self.review, reply])
+
+        comment = data['comments'][0][1]
+        self.assertEqual(comment, self.comment)
+        self.assertEqual(comment.public_replies(), [reply_comment])
+
+    def test_issue_status_changed(self):
+        """Testing get_review_detail_data after changing an issue's status"""
+        get_review_detail_data(self._get_review_request())
+
+        comment = Comment.objects.get(pk=self.comment.pk)
+        comment.issue_status = BaseComment.RESOLVED
+        comment.save()
+
+        data = get_review_detail_data(self._get_review_request())
+
+        self.assertEqual(data['issues'], {
+            'total': 1,
+            'open': 0,
+            'resolved': 1,
+            'dropped': 0,
+        })
+        self.assertEqual(data['issue_open_counts'], {})
+
+    def test_review_detail_draft_reply(self):
+        """Testing review_detail view shows draft replies only to their
+        owner
+        """
+        reply = self.create_reply(self.review, user='grumpy')
+        reply_comment = self.create_diff_comment(reply, self.filediff,
+                                                 reply_to=self.comment)
+
+        self.client.login(username='grumpy', password='grumpy')
+        response = self.client.get(self.review_request.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+
+        entries = response.context['entries']
+        self.assertEqual(len(entries), 1)
+        comments = entries[0]['comments']['diff_comments']
+        self.assertEqual(comments, [self.comment])
+        self.assertEqual(comments[0].public_replies(), [reply_comment])
+
+        self.client.logout()
+        self.client.login(username='doc', password='doc')
+        response = self.client.get(self.review_request.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+
+        entries = response.context['entries']
+        self.assertEqual(len(entries), 1)
+        comments = entries[0]['comments']['diff_comments']
+        self.assertEqual(comments, [self.comment])
+        self.assertEqual(comments[0].public_replies(), [])
+        self.assertEqual(entries[0]['issue_open_count'], 1)
+
+
 class ConcurrencyTests(TestCase):
     fixtures = ['test_users', 'test_scmtools']
 
@@ -2394,6 +2733,71 @@ class ReviewRequestCounterTests(TestCase):
         self.assertEqual(self.site_profile2.starred_public_request_count, 0)
         self.assertEqual(self.group.incoming_request_count, 1)
 
+    def test_deferred_counter_updates(self):
+        """Testing counters with deferred_counter_updates"""
+        ReviewRequestDraft.create(self.review_request)
+        self.review_request.publish(self.user)
+
+        with deferred_counter_updates():
+            self.review_request.close(ReviewRequest.SUBMITTED)
+
+            self._reload_objects()
+            self.assertEqual(
+                self.site_profile.pending_outgoing_request_count, 1)
+            self.assertEqual(
+                self.site_profile.starred_public_request_count, 1)
+
+            self.review_request.reopen()
+
+        self._reload_objects()
+        self.assertEqual(self.site_profile.total_outgoing_request_count, 1)
+        self.assertEqual(self.site_profile.pending_outgoing_request_count, 1)
+        self.assertEqual(self.site_profile.starred_public_request_count, 1)
+
+    def test_counter_journal_bulk_updates(self):
+        """Testing CounterJournal applies matching changes together"""
+        journal = CounterJournal()
+        site_profiles = LocalSiteProfile.objects.filter(user=self.user)
+        journal.add(site_profiles, 'total_incoming_request_count')
+        journal.add(site_profiles, 'direct_incoming_request_count')
+        journal.add(Group.objects.filter(pk=self.group.pk),
+                    'incoming_request_count', 2)
+
+        # One query for each model.
+        with self.assertNumQueries(2):
+            journal.apply()
+
+        self._reload_objects()
+        self.assertEqual(self.site_profile.total_incoming_request_count, 1)
+        self.assertEqual(self.site_profile.direct_incoming_request_count, 1)
+        self.assertEqual(self.site_profile2.total_incoming_request_count, 1)
+        self.assertEqual(self.site_profile2.direct_incoming_request_count, 1)
+        self.assertEqual(self.group.incoming_request_count, 2)
+
+    def test_reconcilereviewcounts(self):
+        """Testing the reconcilereviewcounts management command"""
+        LocalSiteProfile.objects.filter(pk=self.site_profile.pk).update(
+            pending_outgoing_request_count=5)
+
+        stdout = six.StringIO()
+        call_command('reconcilereviewcounts', stdout=stdout)
+        self.assertIn('pending_outgoing_request_count is 5, but should be 1',
+                      stdout.getvalue())
+
+        self._reload_objects()
+        self.assertEqual(self.site_profile.pending_outgoing_request_count, 5)
+
+        stdout = six.StringIO()
+        call_command('reconcilereviewcounts', fix=True, stdout=stdout)
+        self.assertIn('Reset 1 incorrect counters.', stdout.getvalue())
+
+        self._reload_objects()
+        self.assertEqual(self.site_profile.pending_outgoing_request_count, 1)
+
+        stdout = six.StringIO()
+        call_command('reconcilereviewcounts', stdout=stdout)
+        self.assertEqual(stdout.getvalue(), 'All counters are correct.\n')
+
     def _reload_objects(self):
         self.test_site = LocalSite.objects.get(pk=self.test_site.pk)
         self.site_profile = \
@@ -2448,6 +2852,97 @@ class IssueCounterTests(TestCase):
             lambda review, issue_opened: self.create_screenshot_comment(
                 review, screenshot, issue_opened=issue_opened))
 
+    @add_fixtures(['test_scmtools'])
+    def test_init_with_mixed_comments(self):
+        """Testing ReviewRequest issue counter initialization
+        from several types of comments on one review
+        """
+        self.review_request.repository = self.create_repository()
+
+        diffset = self.create_diffset(self.review_request)
+        filediff = self.create_filediff(diffset)
+        screenshot = self.create_screenshot(self.review_request)
+        file_attachment = self.create_file_attachment(self.review_request)
+
+        review = self.create_review(self.review_request)
+
+        for i in range(3):
+            self.create_diff_comment(review, filediff, issue_opened=True)
+            self.create_screenshot_comment(review, screenshot,
+                                           issue_opened=True)
+
+        self.create_file_attachment_comment(review, file_attachment)
+        self.create_file_attachment_comment(review, file_attachment)
+        review.publish()
+
+        self._reload_object(clear_counters=True)
+        self.assertEqual(self.review_request.issue_open_count, 6)
+        self.assertEqual(self.review_request.issue_dropped_count, 0)
+        self.assertEqual(self.review_request.issue_resolved_count, 0)
+
+    def test_delete_public_review(self):
+        """Testing ReviewRequest issue counters after deleting a public
+        review
+        """
+        self._reload_object(clear_counters=True)
+        screenshot = self.create_screenshot(self.review_request)
+
+        review1 = self.create_review(self.review_request)
+        self.create_screenshot_comment(review1, screenshot,
+                                       issue_opened=True)
+        review1.publish()
+
+        review2 = self.create_review(self.review_request)
+        comment = self.create_screenshot_comment(review2, screenshot,
+                                                 issue_opened=True)
+        self.create_screenshot_comment(review2, screenshot,
+                                       issue_opened=True)
+        review2.publish()
+
+        comment.issue_status = Comment.DROPPED
+        comment.save()
+
+        self._reload_object()
+        self.assertEqual(self.review_request.issue_open_count, 2)
+        self.assertEqual(self.review_request.issue_dropped_count, 1)
+
+        Review.objects.get(pk=review2.pk).delete()
+
+        self._reload_object()
+        self.assertEqual(self.review_request.issue_open_count, 1)
+        self.assertEqual(self.review_request.issue_dropped_count, 0)
+        self.assertEqual(self.review_request.issue_resolved_count, 0)
+
+    def test_recalculate_issue_counts(self):
+        """Testing ReviewRequest.objects.recalculate_issue_counts"""
+        screenshot = self.create_screenshot(self.review_request)
+        review = self.create_review(self.review_request)
+
+        for i in range(2):
+            self.create_screenshot_comment(review, screenshot,
+                                           issue_opened=True)
+
+        review.publish()
+
+        # This one has no issues.
+        review_request2 = self.create_review_request(publish=True)
+
+        ReviewRequest.objects.update(issue_open_count=5,
+                                     issue_resolved_count=1,
+                                     issue_dropped_count=1)
+
+        self.assertEqual(ReviewRequest.objects.recalculate_issue_counts(), 1)
+
+        self._reload_object()
+        self.assertEqual(self.review_request.issue_open_count, 2)
+        self.assertEqual(self.review_request.issue_dropped_count, 0)
+        self.assertEqual(self.review_request.issue_resolved_count, 0)
+
+        review_request2 = ReviewRequest.objects.get(pk=review_request2.pk)
+        self.assertEqual(review_request2.issue_open_count, 0)
+        self.assertEqual(review_request2.issue_dropped_count, 0)
+        self.assertEqual(review_request2.issue_resolved_count, 0)
+
     def _test_issue_counts(self, create_comment_func):
         review = self.create_review(self.review_request)
 
@@ -2515,9 +3010,10 @@ class IssueCounterTests(TestCase):
 
     def _reload_object(self, clear_counters=False):
         if clear_counters:
-            # 3 queries: One for the review request fetch, one for
-            # the issue status load, and one for updating the issue counts.
-            expected_query_count = 3
+            # 5 queries: One for the review request fetch, one for the
+            # issue status load of each type of comment, and one for
+            # updating the issue counts.
+            expected_query_count = 5
             self._reset_counts()
         else:
             # One query for the review request fetch.
@@ -56,9 +56,10 @@ from reviewboard.reviews.datagrids import (DashboardDataGrid,
                                            SubmitterDataGrid,
                                            WatchedGroupDataGrid,
                                            get_sidebar_counts)
+from reviewboard.reviews.detail import (fetch_review_comments,
+                                       get_review_detail_data)
 from reviewboard.reviews.fields import get_review_request_field
-from reviewboard.reviews.models import (BaseComment, Comment,
-                                        FileAttachmentComment,
+from reviewboard.reviews.models import (Comment, FileAttachmentComment,
                                         Group, ReviewRequest, Review,
                                         Screenshot, ScreenshotComment)
 from reviewboard.scmtools.core import PRE_CREATION
@@ -302,77 +303,57 @@ def review_detail(request,
     # queries. So we'll be optimizing quite a bit by prefetching and
     # re-associating data.
     #
-    # We will start by getting the list of reviews. We'll filter this out into
-    # some other lists, build some ID maps, and later do further processing.
+    # The public reviews, replies, comments and changes are the same for
+    # every user, and are built once and stored in the cache (see
+    # get_review_detail_data). On top of that, we layer the state for the
+    # current user: their draft reviews and replies, whether they've
+    # visited and starred the review request, and the review request draft.
     entries = []
-    public_reviews = []
-    body_top_replies = {}
-    body_bottom_replies = {}
-    replies = {}
     reply_timestamps = {}
     reviews_entry_map = {}
-    reviews_id_map = {}
     review_timestamp = 0
 
-    # Start by going through all reviews that point to this review request.
-    # This includes draft reviews. We'll be separating these into a list of
-    # public reviews and a mapping of replies.
-    #
-    # We'll also compute the latest review timestamp early, for the ETag
-    # generation below.
-    #
-    # The second pass will come after the ETag calculation.
-    all_reviews = list(review_request.reviews.select_related('user'))
+    detail_data = get_review_detail_data(review_request)
+    public_reviews = detail_data['reviews']
+    reviews_id_map = _build_id_map(public_reviews)
+
+    # Figure out the timestamps of the latest reply to each review. Later,
+    # we'll use this to expand reviews with new replies.
+    for review in public_reviews:
+        parent_id = review.base_reply_to_id
+
+        if parent_id is not None:
+            reply_timestamps[parent_id] = max(
+                reply_timestamps.get(parent_id, review.timestamp),
+                review.timestamp)
+
+    # Get the current user's draft reviews and replies. We'll compute the
+    # latest draft timestamp early, for the ETag generation below.
+    if request.user.is_authenticated():
+        draft_reviews = list(review_request.reviews.filter(
+            public=False, user=request.user).select_related('user'))
+    else:
+        draft_reviews = []
 
-    for review in all_reviews:
+    for review in draft_reviews:
         review._body_top_replies = []
         review._body_bottom_replies = []
+        reviews_id_map[review.pk] = review
 
-        if review.public:
-            # This is a review we'll display on the page. Keep track of it
-            # for later display and filtering.
-            public_reviews.append(review)
-            parent_id = review.base_reply_to_id
-
-            if parent_id is not None:
-                # This is a reply to a review. We'll store the reply data
-                # into a map, which associates a review ID with its list of
-                # replies, and also figures out the timestamps.
-                #
-                # Later, we'll use this to associate reviews and replies for
-                # rendering.
-                if parent_id not in replies:
-                    replies[parent_id] = [review]
-                    reply_timestamps[parent_id] = review.timestamp
-                else:
-                    replies[parent_id].append(review)
-                    reply_timestamps[parent_id] = max(
-                        reply_timestamps[parent_id],
-                        review.timestamp)
-        elif (request.user.is_authenticated() and
-              review.user_id == request.user.pk and
-              (review_timestamp == 0 or review.timestamp > review_timestamp)):
-            # This is the latest draft so far from the current user, so
-            # we'll use this timestamp in the ETag.
+        if review_timestamp == 0 or review.timestamp > review_timestamp:
             review_timestamp = review.timestamp
 
-        if review.public or (request.user.is_authenticated() and
-                             review.user_id == request.user.pk):
-            reviews_id_map[review.pk] = review
-
-            # If this review is replying to another review's body_top or
-            # body_bottom fields, store that data.
-            for reply_id, reply_list in (
-                (review.body_top_reply_to_id, body_top_replies),
-                (review.body_bottom_reply_to_id, body_bottom_replies)):
-                if reply_id is not None:
-                    if reply_id not in reply_list:
-                        reply_list[reply_id] = [review]
-                    else:
-                        reply_list[reply_id].append(review)
+    # If a draft reply is replying to another review's body_top or
+    # body_bottom fields, link it up.
+    for review in draft_reviews:
+        for reply_id, key in ((review.body_top_reply_to_id,
+                               '_body_top_replies'),
+                              (review.body_bottom_reply_to_id,
+                               '_body_bottom_replies')):
+            if reply_id in reviews_id_map:
+                getattr(reviews_id_map[reply_id], key).append(review)
 
     pending_review = review_request.get_pending_review(request.user)
-    review_ids = list(reviews_id_map.keys())
     last_visited = 0
     starred = False
 
@@ -384,6 +365,7 @@ def review_detail(request,
                 user=request.user, review_request=review_request)
             last_visited = visited.timestamp.replace(tzinfo=utc)
             visited.timestamp = timezone.now()
+            visited.new_review_count = 0
             visited.save()
 
         try:
@@ -424,14 +406,11 @@ def review_detail(request,
     if etag_if_none_match(request, etag):
         return HttpResponseNotModified()
 
-    # Get the list of public ChangeDescriptions.
-    #
-    # We want to get the latest ChangeDescription along with this. This is
-    # best done here and not in a separate SQL query.
-    changedescs = list(review_request.changedescs.filter(public=True))
+    # Get the list of public ChangeDescriptions, sorted from newest to
+    # oldest, so the latest one is the first.
+    changedescs = detail_data['changedescs']
 
     if changedescs:
-        # We sort from newest to oldest, so the latest one is the first.
         latest_changedesc = changedescs[0]
         latest_timestamp = latest_changedesc.timestamp
     else:
@@ -443,6 +422,8 @@ def review_detail(request,
     #
     # We do this here and not above because we don't want to build *too* much
     # before the ETag check.
+    issue_open_counts = detail_data['issue_open_counts']
+
     for review in public_reviews:
         if not review.is_reply():
             state = ''
@@ -468,17 +449,11 @@ def review_detail(request,
                 'timestamp': review.timestamp,
                 'class': state,
                 'collapsed': state == 'collapsed',
-                'issue_open_count': 0,
+                'issue_open_count': issue_open_counts.get(review.pk, 0),
             }
             reviews_entry_map[review.pk] = entry
             entries.append(entry)
 
-    # Link up all the review body replies.
-    for key, reply_list in (('_body_top_replies', body_top_replies),
-                            ('_body_bottom_replies', body_bottom_replies)):
-        for reply_id, replies in six.iteritems(reply_list):
-            setattr(reviews_id_map[reply_id], key, replies)
-
     # Get all the file attachments and screenshots and build a couple maps,
     # so we can easily associate those objects in comments.
     file_attachments = []
@@ -502,119 +477,77 @@ def review_detail(request,
     has_inactive_file_attachments = False
     has_inactive_screenshots = False
 
-    issues = {
-        'total': 0,
-        'open': 0,
-        'resolved': 0,
-        'dropped': 0
-    }
+    # Get the comments on the current user's draft reviews and replies, and
+    # link them up to the comments they reply to.
+    comments = list(detail_data['comments'])
 
-    # Get all the comments and attach them to the reviews.
-    for model, key, ordering in (
-        (Comment, 'diff_comments',
-         ('comment__filediff', 'comment__first_line', 'comment__timestamp')),
-        (ScreenshotComment, 'screenshot_comments', None),
-        (FileAttachmentComment, 'file_attachment_comments', None)):
-        # Due to how we initially made the schema, we have a ManyToManyField
-        # inbetween comments and reviews, instead of comments having a
-        # ForeignKey to the review. This makes it difficult to easily go
-        # from a comment to a review ID.
-        #
-        # The solution to this is to not query the comment objects, but rather
-        # the through table. This will let us grab the review and comment in
-        # one go, using select_related.
-        related_field = model.review.related.field
-        comment_field_name = related_field.m2m_reverse_field_name()
-        through = related_field.rel.through
-        q = through.objects.filter(review__in=review_ids).select_related()
-
-        if ordering:
-            q = q.order_by(*ordering)
-
-        objs = list(q)
-
-        # Two passes. One to build a mapping, and one to actually process
-        # comments.
-        comment_map = {}
-
-        for obj in objs:
-            comment = getattr(obj, comment_field_name)
-            comment_map[comment.pk] = comment
+    if draft_reviews:
+        comment_maps = {}
+
+        for key, comment in comments:
+            comment_maps.setdefault(key, {})[comment.pk] = comment
+
+        for key, review_id, comment in fetch_review_comments(
+                [review.pk for review in draft_reviews]):
+            comment._review = reviews_id_map[review_id]
             comment._replies = []
+            comments.append((key, comment))
 
-        for obj in objs:
-            comment = getattr(obj, comment_field_name)
-
-            # Short-circuit some object fetches for the comment by setting
-            # some internal state on them.
-            assert obj.review_id in reviews_id_map
-            parent_review = reviews_id_map[obj.review_id]
-            comment._review = parent_review
-            comment._review_request = review_request
-
-            # If the comment has an associated object that we've already
-            # queried, attach it to prevent a future lookup.
-            if isinstance(comment, ScreenshotComment):
-                if (comment.screenshot_id not in screenshot_id_map and
-                    not has_inactive_screenshots):
-                    inactive_screenshots = \
-                        list(review_request_details.get_inactive_screenshots())
-
-                    for screenshot in inactive_screenshots:
-                        screenshot._comments = []
-
-                    screenshot_id_map.update(
-                        _build_id_map(inactive_screenshots))
-                    has_inactive_screenshots = True
-
-                if comment.screenshot_id in screenshot_id_map:
-                    screenshot = screenshot_id_map[comment.screenshot_id]
-                    comment.screenshot = screenshot
-                    screenshot._comments.append(comment)
-            elif isinstance(comment, FileAttachmentComment):
-                if (comment.file_attachment_id not in file_attachment_id_map
-                    and not has_inactive_file_attachments):
-                    inactive_file_attachments = list(
-                        review_request_details.get_inactive_file_attachments())
-
-                    for file_attachment in inactive_file_attachments:
-                        file_attachment._comments = []
-
-                    file_attachment_id_map.update(
-                        _build_id_map(inactive_file_attachments))
-                    has_inactive_file_attachments = True
-
-                if comment.file_attachment_id in file_attachment_id_map:
-                    file_attachment = \
-                        file_attachment_id_map[comment.file_attachment_id]
-                    comment.file_attachment = file_attachment
-                    file_attachment._comments.append(comment)
-
-            if parent_review.is_reply():
-                # This is a reply to a comment. Add it to the list of replies.
-                assert obj.review_id not in reviews_entry_map
-                assert parent_review.base_reply_to_id in reviews_entry_map
-
-                # If there's an entry that isn't a reply, then it's
-                # orphaned. Ignore it.
-                if comment.is_reply():
-                    replied_comment = comment_map[comment.reply_to_id]
+            if comment.is_reply():
+                replied_comment = \
+                    comment_maps.get(key, {}).get(comment.reply_to_id)
+
+                if replied_comment is not None:
                     replied_comment._replies.append(comment)
-            elif parent_review.public:
-                # This is a comment on a public review we're going to show.
-                # Add it to the list.
-                assert obj.review_id in reviews_entry_map
-                entry = reviews_entry_map[obj.review_id]
-                entry['comments'][key].append(comment)
-
-                if comment.issue_opened:
-                    status_key = \
-                        comment.issue_status_to_string(comment.issue_status)
-                    issues[status_key] += 1
-                    issues['total'] += 1
-
-                    if comment.issue_status == BaseComment.OPEN:
-                        entry['issue_open_count'] += 1
+
+    # Attach the comments to the reviews.
+    for key, comment in comments:
+        parent_review = comment._review
+        comment._review_request = review_request
+
+        # If the comment has an associated object that we've already
+        # queried, attach it to prevent a future lookup.
+        if isinstance(comment, ScreenshotComment):
+            if (comment.screenshot_id not in screenshot_id_map and
+                not has_inactive_screenshots):
+                inactive_screenshots = \
+                    list(review_request_details.get_inactive_screenshots())
+
+                for screenshot in inactive_screenshots:
+                    screenshot._comments = []
+
+                screenshot_id_map.update(
+                    _build_id_map(inactive_screenshots))
+                has_inactive_screenshots = True
+
+            if comment.screenshot_id in screenshot_id_map:
+                screenshot = screenshot_id_map[comment.screenshot_id]
+                comment.screenshot = screenshot
+                screenshot._comments.append(comment)
+        elif isinstance(comment, FileAttachmentComment):
+            if (comment.file_attachment_id not in file_attachment_id_map
+                and not has_inactive_file_attachments):
+                inactive_file_attachments = list(
+                    review_request_details.get_inactive_file_attachments())
+
+                for file_attachment in inactive_file_attachments:
+                    file_attachment._comments = []
+
+                file_attachment_id_map.update(
+                    _build_id_map(inactive_file_attachments))
+                has_inactive_file_attachments = True
+
+            if comment.file_attachment_id in file_attachment_id_map:
+                file_attachment = \
+                    file_attachment_id_map[comment.file_attachment_id]
+                comment.file_attachment = file_attachment
+                file_attachment._comments.append(comment)
+
+        if parent_review.pk in reviews_entry_map:
+            # This is a comment on a public review we're going to show.
+            # Add it to the list.
+            entry = reviews_entry_map[parent_review.pk]
+            entry['comments'][key].append(comment)
 
     # Sort all the reviews and ChangeDescriptions into a single list, for
     # display.
@@ -708,7 +641,7 @@ def review_detail(request,
         'close_description': close_description,
         'close_description_rich_text': close_description_rich_text,
         'PRE_CREATION': PRE_CREATION,
-        'issues': issues,
+        'issues': detail_data['issues'],
         'has_diffs': (draft and draft.diffset) or len(diffsets) > 0,
         'file_attachments': [file_attachment
                              for file_attachment in file_attachments
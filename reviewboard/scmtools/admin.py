@@ -61,7 +61,8 @@ class RepositoryAdmin(admin.ModelAdmin):
             'classes': ('wide',),
         }),
         (_('Advanced Settings'), {
-            'fields': ('encoding',),
+            'fields': ('encoding', 'diff_compat_version',
+                       'max_concurrent_file_requests'),
             'classes': ('wide', 'collapse'),
         }),
         (_('Internal State'), {
@@ -0,0 +1,34 @@
+from __future__ import unicode_literals
+
+from multiprocessing.pool import ThreadPool
+
+from django.db import connection
+
+
+def run_concurrently(func, args_list, max_threads):
+    """Calls a function for each set of arguments, using a thread pool.
+
+    Up to max_threads calls are made at once. This returns a list of the
+    results, in the same order as the arguments. If any call raises an
+    exception, it's raised to the caller.
+    """
+    num_threads = min(max_threads, len(args_list))
+
+    if num_threads <= 1:
+        return [func(*args) for args in args_list]
+
+    def _call(args):
+        try:
+            return func(*args)
+        finally:
+            # Each thread has its own database connection, which would
+            # otherwise be left open.
+            connection.close()
+
+    pool = ThreadPool(num_threads)
+
+    try:
+        return pool.map(_call, args_list)
+    finally:
+        pool.close()
+        pool.join()
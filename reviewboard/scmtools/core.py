@@ -5,20 +5,21 @@ import logging
 import os
 import subprocess
 import sys
+import threading
 
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
 from djblets.util.compat import six
 from djblets.util.compat.six.moves.urllib.error import HTTPError
 from djblets.util.compat.six.moves.urllib.parse import urlparse
-from djblets.util.compat.six.moves.urllib.request import (
-    Request as URLRequest,
-    urlopen)
+from djblets.util.compat.six.moves.urllib.request import Request as URLRequest
 
 import reviewboard.diffviewer.parser as diffparser
+from reviewboard.scmtools.concurrency import run_concurrently
 from reviewboard.scmtools.errors import (AuthenticationError,
                                          FileNotFoundError,
                                          SCMError)
+from reviewboard.scmtools.http_pool import urlopen
 from reviewboard.ssh import utils as sshutils
 from reviewboard.ssh.errors import SSHAuthenticationError
 
@@ -146,6 +147,68 @@ class SCMTool(object):
         except FileNotFoundError:
             return False
 
+    def get_files(self, files):
+        """Returns the contents of several files.
+
+        files is a list of (path, revision) tuples. This returns a list of
+        the contents of each file, in the same order. Files that don't exist
+        are returned as None.
+
+        By default, this calls get_file for each file, making as many calls
+        at once as the repository's get_max_concurrent_file_requests allows.
+        Subclasses can override this to fetch the files with fewer
+        round-trips to the repository.
+        """
+        def _get_file(tool, path, revision):
+            try:
+                return tool.get_file(path, revision)
+            except FileNotFoundError:
+                return None
+
+        return self._run_file_requests(_get_file, files)
+
+    def file_exists_many(self, files):
+        """Returns whether each of several files exists.
+
+        files is a list of (path, revision) tuples. This returns a list of
+        booleans, in the same order.
+
+        By default, this calls file_exists for each file, making as many
+        calls at once as the repository's get_max_concurrent_file_requests
+        allows. Subclasses can override this to check the files with fewer
+        round-trips to the repository.
+        """
+        return self._run_file_requests(
+            lambda tool, path, revision: tool.file_exists(path, revision),
+            files)
+
+    def _run_file_requests(self, func, files):
+        """Calls a function for each of several files.
+
+        The function is passed an SCMTool, path and revision. If several
+        calls can be made at once, each thread uses its own SCMTool for the
+        repository, since they aren't generally safe to share between
+        threads. These come from the repository's tool cache, which keeps
+        separate tools for each thread.
+        """
+        max_threads = self.repository.get_max_concurrent_file_requests()
+
+        if max_threads <= 1 or len(files) <= 1:
+            return [func(self, path, revision) for path, revision in files]
+
+        thread_data = threading.local()
+
+        def _call(path, revision):
+            tool = getattr(thread_data, 'tool', None)
+
+            if tool is None:
+                tool = self.repository.get_scmtool()
+                thread_data.tool = tool
+
+            return func(tool, path, revision)
+
+        return run_concurrently(_call, files, max_threads)
+
     def parse_diff_revision(self, file_str, revision_str, moved=False):
         raise NotImplementedError
 
@@ -214,12 +277,15 @@ class SCMTool(object):
         return patch
 
     @classmethod
-    def popen(cls, command, local_site_name=None):
+    def popen(cls, command, local_site_name=None, stdin=None):
         """Launches an application, capturing output.
 
         This wraps subprocess.Popen to provide some common parameters and
         to pass environment variables that may be needed by rbssh, if
         indirectly invoked.
+
+        stdin can be set to subprocess.PIPE in order to write input to the
+        application.
         """
         env = os.environ.copy()
 
@@ -230,6 +296,7 @@ class SCMTool(object):
 
         return subprocess.Popen(command,
                                 env=env,
+                                stdin=stdin,
                                 stderr=subprocess.PIPE,
                                 stdout=subprocess.PIPE,
                                 close_fds=(os.name != 'nt'))
@@ -0,0 +1,413 @@
+from __future__ import unicode_literals
+
+import errno
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+from django.core.cache import cache
+from djblets.cache.backend import make_cache_key
+from djblets.siteconfig.models import SiteConfiguration
+
+
+class RepositoryFileCache(object):
+    """An on-disk cache of files fetched from repositories.
+
+    This is a second tier under the main cache (normally memcached). Files
+    evicted from memcached can be read back from local disk, rather than
+    being fetched again from the repository, which can be slow for remote
+    repositories.
+
+    The contents of files are stored by their SHA1, so that identical files
+    are only stored once. A small entry is stored for each cache key,
+    pointing to the contents. An entry can also record only that a file
+    exists, for the results of file existence checks.
+
+    The cache directory can be shared by several server processes. Entries
+    and contents are written to temporary files and renamed into place, so
+    readers never see partial files. Reading a file marks it as recently
+    used, and when the contents stored take up more than max_size bytes,
+    the least recently used files are removed. Entries that only record
+    that a file exists take up no space in max_size, so at most MAX_ENTRIES
+    entries are kept as well. Pruning happens in a background thread, so
+    that it doesn't hold up the request that triggered it.
+
+    Errors reading from or writing to the cache are logged, and treated as
+    cache misses.
+    """
+    # The maximum number of entries (for file contents or file existence)
+    # to keep.
+    MAX_ENTRIES = 100000
+
+    # How much to shrink the cache by when it's full, as a fraction of
+    # max_size. This avoids pruning again on every write.
+    PRUNE_TO_RATIO = 0.9
+
+    # How much data to write (as a fraction of max_size), or how many
+    # entries to write (as a fraction of MAX_ENTRIES), before checking
+    # whether the cache needs to be pruned.
+    PRUNE_INTERVAL_RATIO = 0.1
+
+    STATS_KEYS = ('hits', 'misses', 'exists_hits', 'exists_misses',
+                  'evictions')
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+
+        self._blobs_dir = os.path.join(path, 'blobs')
+        self._entries_dir = os.path.join(path, 'entries')
+        self._tmp_dir = os.path.join(path, 'tmp')
+        self._written_since_prune = 0
+        self._entries_since_prune = 0
+        self._prune_lock = threading.Lock()
+        self._prune_thread = None
+        self._prune_thread_lock = threading.Lock()
+
+    def get_file(self, key):
+        """Returns the cached contents of a file, or None if not cached."""
+        try:
+            blob_path = self._get_blob_path_for_key(key)
+
+            if blob_path is not None:
+                data = self._read_blob(blob_path)
+            else:
+                data = None
+        except (IOError, OSError) as e:
+            logging.warning('Unable to read "%s" from the repository file '
+                            'cache in %s: %s', key, self.path, e)
+            data = None
+
+        if data is None:
+            self._incr_stat('misses')
+        else:
+            self._incr_stat('hits')
+
+        return data
+
+    def set_file(self, key, data):
+        """Stores the contents of a file in the cache."""
+        blob_hash = hashlib.sha1(data).hexdigest()
+        blob_path = self._get_blob_path(blob_hash)
+
+        try:
+            if os.path.exists(blob_path):
+                os.utime(blob_path, None)
+            else:
+                self._write_file(blob_path, data)
+                self._written_since_prune += len(data)
+
+            self._write_file(self._get_entry_path(key),
+                             blob_hash.encode('ascii'))
+            self._entries_since_prune += 1
+        except (IOError, OSError) as e:
+            logging.warning('Unable to write "%s" to the repository file '
+                            'cache in %s: %s', key, self.path, e)
+            return
+
+        self._schedule_prune_if_needed()
+
+    def has_file(self, key):
+        """Returns whether a file is known to exist.
+
+        This is the case if either the file's contents or a previous
+        result from set_file_exists is in the cache.
+        """
+        entry_path = self._get_entry_path(key)
+
+        try:
+            os.utime(entry_path, None)
+            exists = True
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                logging.warning('Unable to read "%s" from the repository '
+                                'file cache in %s: %s', key, self.path, e)
+
+            exists = False
+
+        if exists:
+            self._incr_stat('exists_hits')
+        else:
+            self._incr_stat('exists_misses')
+
+        return exists
+
+    def set_file_exists(self, key):
+        """Records that a file exists, without storing its contents."""
+        entry_path = self._get_entry_path(key)
+
+        if not os.path.exists(entry_path):
+            try:
+                self._write_file(entry_path, b'')
+                self._entries_since_prune += 1
+            except (IOError, OSError) as e:
+                logging.warning('Unable to write "%s" to the repository file '
+                                'cache in %s: %s', key, self.path, e)
+                return
+
+            self._schedule_prune_if_needed()
+
+    def prune(self):
+        """Removes the least recently used files if the cache is too large.
+
+        Entries that haven't been used since the last of the removed files
+        are removed as well. If there are more than MAX_ENTRIES entries
+        left, the least recently used entries are removed.
+        """
+        with self._prune_lock:
+            self._written_since_prune = 0
+            self._entries_since_prune = 0
+
+            blobs = []
+            total_size = 0
+
+            for path, stat in self._iter_files(self._blobs_dir):
+                blobs.append((stat.st_mtime, stat.st_size, path))
+                total_size += stat.st_size
+
+            cutoff_mtime = None
+            num_evicted = 0
+
+            if total_size > self.max_size:
+                blobs.sort()
+                target_size = self.max_size * self.PRUNE_TO_RATIO
+
+                for mtime, size, path in blobs:
+                    if total_size <= target_size:
+                        break
+
+                    self._remove_file(path)
+                    total_size -= size
+                    cutoff_mtime = mtime
+                    num_evicted += 1
+
+            entries = []
+
+            for path, stat in self._iter_files(self._entries_dir):
+                if cutoff_mtime is not None and stat.st_mtime <= cutoff_mtime:
+                    self._remove_file(path)
+                else:
+                    entries.append((stat.st_mtime, path))
+
+            if len(entries) > self.MAX_ENTRIES:
+                entries.sort()
+                num_to_remove = \
+                    len(entries) - int(self.MAX_ENTRIES * self.PRUNE_TO_RATIO)
+
+                for mtime, path in entries[:num_to_remove]:
+                    self._remove_file(path)
+
+            if num_evicted:
+                self._incr_stat('evictions', num_evicted)
+
+    def clear(self):
+        """Removes all files and entries from the cache."""
+        with self._prune_lock:
+            for dirname in (self._blobs_dir, self._entries_dir):
+                for path, stat in self._iter_files(dirname):
+                    self._remove_file(path)
+
+    def get_stats(self):
+        """Returns statistics on the cache.
+
+        The hit and miss counts are shared by all server processes using
+        the main cache. The number of files and size are read from disk.
+        """
+        stats = cache.get_many([
+            self._make_stats_cache_key(name)
+            for name in self.STATS_KEYS
+        ])
+        stats = dict(
+            (name, stats.get(self._make_stats_cache_key(name), 0))
+            for name in self.STATS_KEYS
+        )
+
+        num_files = 0
+        size = 0
+
+        for path, stat in self._iter_files(self._blobs_dir):
+            num_files += 1
+            size += stat.st_size
+
+        num_lookups = stats['hits'] + stats['misses']
+
+        if num_lookups:
+            stats['hit_rate'] = 100 * stats['hits'] // num_lookups
+            stats['miss_rate'] = 100 * stats['misses'] // num_lookups
+        else:
+            stats['hit_rate'] = 0
+            stats['miss_rate'] = 0
+
+        stats.update({
+            'path': self.path,
+            'num_files': num_files,
+            'size': size,
+            'max_size': self.max_size,
+        })
+
+        return stats
+
+    def _get_blob_path(self, blob_hash):
+        return os.path.join(self._blobs_dir, blob_hash[:2], blob_hash)
+
+    def _get_entry_path(self, key):
+        key_hash = hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+        return os.path.join(self._entries_dir, key_hash[:2], key_hash)
+
+    def _get_blob_path_for_key(self, key):
+        """Returns the path to the contents of the file for a key.
+
+        None is returned if there's no entry for the key, or the entry only
+        records that the file exists.
+        """
+        entry_path = self._get_entry_path(key)
+
+        try:
+            with open(entry_path, 'rb') as fp:
+                blob_hash = fp.read().decode('ascii')
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return None
+
+            raise
+
+        if not blob_hash:
+            return None
+
+        os.utime(entry_path, None)
+
+        return self._get_blob_path(blob_hash)
+
+    def _read_blob(self, blob_path):
+        """Returns the contents of a stored file.
+
+        None is returned if the file has been removed from the cache.
+        """
+        try:
+            with open(blob_path, 'rb') as fp:
+                data = fp.read()
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return None
+
+            raise
+
+        os.utime(blob_path, None)
+
+        return data
+
+    def _schedule_prune_if_needed(self):
+        """Starts pruning in a background thread, if enough was written.
+
+        Nothing is done if the cache is already being pruned.
+        """
+        if (self._written_since_prune <
+                self.max_size * self.PRUNE_INTERVAL_RATIO and
+            self._entries_since_prune <
+                self.MAX_ENTRIES * self.PRUNE_INTERVAL_RATIO):
+            return
+
+        with self._prune_thread_lock:
+            if (self._prune_thread is not None and
+                self._prune_thread.is_alive()):
+                return
+
+            self._written_since_prune = 0
+            self._entries_since_prune = 0
+            self._prune_thread = threading.Thread(target=self._run_prune)
+            self._prune_thread.daemon = True
+            self._prune_thread.start()
+
+    def _run_prune(self):
+        try:
+            self.prune()
+        except Exception as e:
+            logging.exception('Unable to prune the repository file cache in '
+                              '%s: %s', self.path, e)
+
+    def _write_file(self, path, data):
+        """Atomically writes a file into the cache.
+
+        The data is written to a temporary file and then renamed into place.
+        """
+        self._makedirs(os.path.dirname(path))
+        self._makedirs(self._tmp_dir)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_dir)
+
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(data)
+
+            os.rename(tmp_path, path)
+        except (IOError, OSError):
+            self._remove_file(tmp_path)
+            raise
+
+    def _makedirs(self, path):
+        try:
+            os.makedirs(path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def _remove_file(self, path):
+        try:
+            os.unlink(path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                logging.warning('Unable to remove %s from the repository '
+                                'file cache: %s', path, e)
+
+    def _iter_files(self, path):
+        """Yields the path and stat results of each file in a directory."""
+        for dirpath, dirnames, filenames in os.walk(path):
+            for filename in filenames:
+                file_path = os.path.join(dirpath, filename)
+
+                try:
+                    yield file_path, os.stat(file_path)
+                except OSError:
+                    # The file was removed by another process.
+                    pass
+
+    def _make_stats_cache_key(self, name):
+        return make_cache_key('repository-file-cache-stats:%s' % name)
+
+    def _incr_stat(self, name, delta=1):
+        key = self._make_stats_cache_key(name)
+
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            cache.add(key, delta)
+
+
+_repository_file_cache = None
+
+
+def get_repository_file_cache():
+    """Returns the RepositoryFileCache, if enabled.
+
+    The cache is enabled when the ``repository_file_cache_path`` setting is
+    set, and is kept in sync with it and the ``repository_file_cache_size``
+    setting. None is returned if the cache is disabled.
+    """
+    global _repository_file_cache
+
+    siteconfig = SiteConfiguration.objects.get_current()
+    path = siteconfig.get('repository_file_cache_path')
+    max_size = siteconfig.get('repository_file_cache_size')
+
+    if not path or not max_size:
+        _repository_file_cache = None
+    elif (_repository_file_cache is None or
+          _repository_file_cache.path != path):
+        _repository_file_cache = RepositoryFileCache(path, max_size)
+    else:
+        _repository_file_cache.max_size = max_size
+
+    return _repository_file_cache
@@ -12,6 +12,7 @@ from django.utils.translation import ugettext_lazy as _
 from djblets.util.filesystem import is_exe_in_path
 
 from reviewboard.admin.validation import validate_bug_tracker
+from reviewboard.diffviewer.differ import DiffCompatVersion
 from reviewboard.hostingsvcs.errors import (AuthorizationError,
                                             SSHKeyAssociationError,
                                             TwoFactorAuthCodeRequiredError)
@@ -169,6 +170,28 @@ class RepositoryForm(forms.ModelForm):
         initial=False,
         required=False)
 
+    # Advanced Settings fields
+    diff_compat_version = forms.TypedChoiceField(
+        label=_('Diff algorithm'),
+        required=False,
+        choices=(
+            (('', _('Use the site default')),) +
+            DiffCompatVersion.CHOICES
+        ),
+        coerce=int,
+        empty_value=None,
+        help_text=_('The algorithm used to compare files in newly uploaded '
+                    'diffs for this repository.'))
+
+    max_concurrent_file_requests = forms.IntegerField(
+        label=_('Concurrent file requests'),
+        required=False,
+        min_value=1,
+        help_text=_('The maximum number of requests made to the repository '
+                    'at once when fetching or checking several files, such '
+                    'as when validating an uploaded diff. Leave this blank '
+                    'to use the default.'))
+
     def __init__(self, *args, **kwargs):
         self.local_site_name = kwargs.pop('local_site_name', None)
 
@@ -363,6 +386,10 @@ class RepositoryForm(forms.ModelForm):
         """
         self.fields['use_ticket_auth'].initial = \
             self.instance.extra_data.get('use_ticket_auth', False)
+        self.fields['diff_compat_version'].initial = \
+            self.instance.extra_data.get('diff_compat_version', None)
+        self.fields['max_concurrent_file_requests'].initial = \
+            self.instance.extra_data.get('max_concurrent_file_requests', None)
 
     def _populate_hosting_service_fields(self):
         """Populates all the main hosting service fields in the form.
@@ -1037,6 +1064,18 @@ class RepositoryForm(forms.ModelForm):
         except KeyError:
             pass
 
+        if self.cleaned_data.get('diff_compat_version') is not None:
+            repository.extra_data['diff_compat_version'] = \
+                self.cleaned_data['diff_compat_version']
+        else:
+            repository.extra_data.pop('diff_compat_version', None)
+
+        if self.cleaned_data.get('max_concurrent_file_requests') is not None:
+            repository.extra_data['max_concurrent_file_requests'] = \
+                self.cleaned_data['max_concurrent_file_requests']
+        else:
+            repository.extra_data.pop('max_concurrent_file_requests', None)
+
         if hosting_type in self.repository_forms:
             plan = (self.cleaned_data['repository_plan'] or
                     self.DEFAULT_PLAN_ID)
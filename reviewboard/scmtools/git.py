@@ -3,9 +3,11 @@ from __future__ import unicode_literals
 import logging
 import os
 import re
+import subprocess
 
 from django.utils.translation import ugettext_lazy as _
 from djblets.util.compat import six
+from djblets.util.compat.six.moves import range
 from djblets.util.compat.six.moves.urllib.parse import quote as urlquote
 from djblets.util.filesystem import is_exe_in_path
 
@@ -15,6 +17,8 @@ from reviewboard.scmtools.errors import (FileNotFoundError,
                                          InvalidRevisionFormatError,
                                          RepositoryNotFoundError,
                                          SCMError)
+from reviewboard.scmtools.processes import (PersistentProcess,
+                                            get_persistent_process)
 from reviewboard.ssh import utils as sshutils
 
 
@@ -99,6 +103,42 @@ class GitTool(SCMTool):
         except (FileNotFoundError, InvalidRevisionFormatError):
             return False
 
+    def get_files(self, files):
+        """Returns the contents of several files.
+
+        Files in local repositories are read through a single batch of
+        requests to git cat-file.
+        """
+        if not self.client.can_batch_files:
+            return super(GitTool, self).get_files(files)
+
+        return self._run_batch(files, self.client.get_files, '')
+
+    def file_exists_many(self, files):
+        """Returns whether each of several files exists.
+
+        Files in local repositories are checked through a single batch of
+        requests to git cat-file.
+        """
+        if not self.client.can_batch_files:
+            return super(GitTool, self).file_exists_many(files)
+
+        return self._run_batch(files, self.client.get_file_exists_many,
+                               False)
+
+    def _run_batch(self, files, batch_func, pre_creation_result):
+        results = [pre_creation_result] * len(files)
+        indexes = [
+            i
+            for i, (path, revision) in enumerate(files)
+            if revision != PRE_CREATION
+        ]
+
+        for i, result in zip(indexes, batch_func([files[i] for i in indexes])):
+            results[i] = result
+
+        return results
+
     def parse_diff_revision(self, file_str, revision_str, moved=False,
                             *args, **kwargs):
         revision = revision_str
@@ -339,6 +379,119 @@ class GitDiffParser(DiffParser):
                 setattr(file_info, attr, '')
 
 
+class GitCatFileProcess(PersistentProcess):
+    """A long-running git cat-file process for a local repository.
+
+    Running git cat-file for every file and existence check means a fork
+    and exec each time, which adds up quickly for large diffs. Instead,
+    this keeps a ``git cat-file --batch`` (or ``--batch-check``, if only
+    the object types are needed) process running, and sends each request
+    over its pipes.
+
+    Use get_git_cat_file_process to get the process for a repository.
+    """
+    def __init__(self, git_dir, local_site_name=None, check_only=False):
+        super(GitCatFileProcess, self).__init__(local_site_name)
+
+        self.git_dir = git_dir
+        self.check_only = check_only
+
+    def __str__(self):
+        return 'git cat-file for %s' % self.git_dir
+
+    # The maximum number of objects requested at once by get_objects.
+    # All the object names in a batch are written before any results are
+    # read, so this must be kept small enough that the names fit in the
+    # pipe's buffer.
+    MAX_BATCH_SIZE = 100
+
+    def get_object(self, object_name):
+        """Returns information on an object in the repository.
+
+        The result is a tuple of (type, contents), with the contents being
+        None if this is a check-only process. If the object doesn't exist,
+        None is returned.
+        """
+        return self.run_request([object_name])[0]
+
+    def get_objects(self, object_names):
+        """Returns information on several objects in the repository.
+
+        This returns a list of results in the same form as get_object, in
+        the same order. The objects are requested in batches, saving a
+        round-trip to the process for each object.
+        """
+        results = []
+
+        for i in range(0, len(object_names), self.MAX_BATCH_SIZE):
+            results += self.run_request(
+                object_names[i:i + self.MAX_BATCH_SIZE])
+
+        return results
+
+    def start_process(self):
+        if self.check_only:
+            option = '--batch-check'
+        else:
+            option = '--batch'
+
+        return SCMTool.popen(
+            ['git', '--git-dir=%s' % self.git_dir, 'cat-file', option],
+            local_site_name=self.local_site_name,
+            stdin=subprocess.PIPE)
+
+    def handle_request(self, p, object_names):
+        p.stdin.write(b''.join(
+            object_name.encode('utf-8') + b'\n'
+            for object_name in object_names
+        ))
+        p.stdin.flush()
+
+        return [
+            self._read_object(p)
+            for object_name in object_names
+        ]
+
+    def _read_object(self, p):
+        header = p.stdout.readline()
+
+        if not header.endswith(b'\n'):
+            raise IOError('git cat-file exited unexpectedly: %s'
+                          % p.stderr.read().strip())
+
+        header = header.rstrip(b'\n')
+
+        if header.endswith((b' missing', b' ambiguous')):
+            return None
+
+        parts = header.split(b' ')
+
+        if len(parts) != 3:
+            raise ValueError('Unexpected output from git cat-file: %r'
+                             % header)
+
+        obj_type = parts[1].decode('utf-8')
+
+        if self.check_only:
+            return obj_type, None
+
+        size = int(parts[2])
+        contents = p.stdout.read(size + 1)
+
+        if len(contents) != size + 1:
+            raise IOError('git cat-file exited unexpectedly: %s'
+                          % p.stderr.read().strip())
+
+        return obj_type, contents[:-1]
+
+
+def get_git_cat_file_process(git_dir, local_site_name=None,
+                             check_only=False):
+    """Returns the shared GitCatFileProcess for a local repository."""
+    return get_persistent_process(GitCatFileProcess, git_dir,
+                                  local_site_name, check_only)
+
+
 class GitClient(SCMClient):
     FULL_SHA1_LENGTH = 40
 
@@ -418,6 +571,56 @@ class GitClient(SCMClient):
             contents = self._cat_file(path, revision, "-t")
             return contents and contents.strip() == "blob"
 
+    @property
+    def can_batch_files(self):
+        """Whether get_files and get_file_exists_many can be used.
+
+        These are only available for local repositories.
+        """
+        return self.git_dir is not None and not self.raw_file_url
+
+    def get_files(self, files):
+        """Returns the contents of several files in a local repository.
+
+        files is a list of (path, revision) tuples. This returns a list of
+        the contents of each file, with None for files that don't exist.
+        """
+        process = get_git_cat_file_process(self.git_dir, self.local_site_name)
+        objects = process.get_objects([
+            self._resolve_head(revision, path)
+            for path, revision in files
+        ])
+        results = []
+
+        for (path, revision), result in zip(files, objects):
+            if result is None:
+                results.append(None)
+            elif result[0] == 'blob':
+                results.append(result[1])
+            else:
+                # Let _cat_file peel tags or report the error.
+                results.append(self._cat_file(path, revision, 'blob'))
+
+        return results
+
+    def get_file_exists_many(self, files):
+        """Returns whether several files exist in a local repository.
+
+        files is a list of (path, revision) tuples. This returns a list of
+        booleans, in the same order.
+        """
+        process = get_git_cat_file_process(self.git_dir, self.local_site_name,
+                                           check_only=True)
+        objects = process.get_objects([
+            self._resolve_head(revision, path)
+            for path, revision in files
+        ])
+
+        return [
+            result is not None and result[0] == 'blob'
+            for result in objects
+        ]
+
     def validate_sha1_format(self, path, sha1):
         """Validates that a SHA1 is of the right length for this repository."""
         if self.raw_file_url and len(sha1) != self.FULL_SHA1_LENGTH:
@@ -447,6 +650,27 @@ class GitClient(SCMClient):
         """
         commit = self._resolve_head(revision, path)
 
+        if self.git_dir and option in ('blob', '-t'):
+            # Look up the object through the shared git cat-file process,
+            # rather than starting a new one.
+            process = get_git_cat_file_process(self.git_dir,
+                                               self.local_site_name,
+                                               check_only=(option == '-t'))
+            result = process.get_object(commit)
+
+            if result is None:
+                raise FileNotFoundError(commit)
+
+            obj_type, contents = result
+
+            if option == '-t':
+                return obj_type.encode('utf-8')
+            elif obj_type == 'blob':
+                return contents
+
+            # This isn't a blob. Fall back on running git cat-file below,
+            # which will handle peeling tags or report the error.
+
         p = self._run_git(['--git-dir=%s' % self.git_dir, 'cat-file',
                            option, commit])
         contents = p.stdout.read()
@@ -2,7 +2,11 @@ from __future__ import unicode_literals
 
 import logging
 import re
+import struct
+import subprocess
+import time
 
+from django.conf import settings
 from djblets.util.compat import six
 from djblets.util.compat.six.moves.urllib.parse import quote as urllib_quote
 
@@ -10,6 +14,9 @@ from reviewboard.diffviewer.parser import DiffParser, DiffParserError
 from reviewboard.scmtools.git import GitDiffParser
 from reviewboard.scmtools.core import \
     FileNotFoundError, SCMClient, SCMTool, HEAD, PRE_CREATION, UNKNOWN
+from reviewboard.scmtools.errors import SCMError
+from reviewboard.scmtools.processes import (PersistentProcess,
+                                            get_persistent_process)
 
 
 class HgTool(SCMTool):
@@ -222,10 +229,141 @@ class HgWebClient(SCMClient):
         raise FileNotFoundError(path, rev)
 
 
+class HgCommandServer(PersistentProcess):
+    """A Mercurial command server for a local repository.
+
+    Mercurial takes a while to start up, which adds up when running hg
+    for every file in a diff. This keeps an ``hg serve --cmdserver pipe``
+    process running for the repository, and runs commands through it
+    using the command server protocol.
+
+    Use get_persistent_process to get the server for a repository.
+
+    If the server fails, it's marked as unavailable, and hg is run directly
+    instead. The server is tried again after RETRY_INTERVAL seconds, so that
+    a transient failure doesn't disable it for the life of the process.
+    """
+    # How long to wait, in seconds, before trying the server again after a
+    # failure.
+    RETRY_INTERVAL = 60
+
+    def __init__(self, path, local_site_name=None):
+        super(HgCommandServer, self).__init__(local_site_name)
+
+        self.path = path
+
+        # The time at which the server last failed, if it can't be used.
+        self.failed_at = None
+
+    def is_available(self):
+        """Returns whether the server should be used.
+
+        This is the case unless it failed less than RETRY_INTERVAL seconds
+        ago.
+        """
+        return (self.failed_at is None or
+                time.time() - self.failed_at >= self.RETRY_INTERVAL)
+
+    def mark_unavailable(self):
+        """Marks the server as failed, so it isn't used for a while."""
+        self.failed_at = time.time()
+
+    def __str__(self):
+        return 'hg command server for %s' % self.path
+
+    def run_command(self, args):
+        """Runs a Mercurial command, returning its exit code and output."""
+        return self.run_request(args)
+
+    def start_process(self):
+        p = SCMTool.popen(
+            ['hg', 'serve', '--cmdserver', 'pipe',
+             '--config', 'ui.interactive=False',
+             '--repository', self.path,
+             '--cwd', self.path],
+            local_site_name=self.local_site_name,
+            stdin=subprocess.PIPE)
+
+        # The server starts by sending a hello message, listing its
+        # capabilities.
+        try:
+            channel, data = self._read_channel(p)
+
+            if channel != b'o':
+                raise ValueError('Unexpected hello message from hg command '
+                                 'server: %r' % data)
+
+            capabilities = []
+
+            for line in data.splitlines():
+                if line.startswith(b'capabilities:'):
+                    capabilities = line.split()[1:]
+
+            if b'runcommand' not in capabilities:
+                raise ValueError('hg command server does not support '
+                                 'runcommand')
+        except:
+            self.stop_process(p)
+            raise
+
+        return p
+
+    def handle_request(self, p, args):
+        data = b'\0'.join(arg.encode('utf-8') for arg in args)
+        p.stdin.write(b'runcommand\n' + struct.pack(str('>I'), len(data)) +
+                      data)
+        p.stdin.flush()
+
+        output = []
+
+        while True:
+            channel, data = self._read_channel(p)
+
+            if channel == b'o':
+                output.append(data)
+            elif channel == b'r':
+                return struct.unpack(str('>i'), data)[0], b''.join(output)
+            elif channel in (b'I', b'L'):
+                # The command is asking for input. We never have any, so
+                # send an empty response.
+                p.stdin.write(struct.pack(str('>I'), 0))
+                p.stdin.flush()
+            elif channel.isupper():
+                raise ValueError('Unsupported channel %r requested by hg '
+                                 'command server' % channel)
+
+            # Anything else, such as errors or debug output, is ignored.
+
+    def _read_channel(self, p):
+        header = p.stdout.read(5)
+
+        if len(header) != 5:
+            raise IOError('hg command server exited unexpectedly: %s'
+                          % p.stderr.read().strip())
+
+        channel, length = struct.unpack(str('>cI'), header)
+
+        if channel in (b'I', b'L'):
+            # Input requests contain the maximum length of the input,
+            # rather than any data.
+            return channel, length
+
+        data = p.stdout.read(length)
+
+        if len(data) != length:
+            raise IOError('hg command server exited unexpectedly: %s'
+                          % p.stderr.read().strip())
+
+        return channel, data
+
+
 class HgClient(SCMClient):
     def __init__(self, path, local_site):
         super(HgClient, self).__init__(path)
         self.default_args = None
+        self.config_args = []
+        self.use_command_server = getattr(settings, 'HG_USE_COMMAND_SERVER',
+                                          False)
 
         if local_site:
             self.local_site_name = local_site.name
@@ -239,9 +377,8 @@ class HgClient(SCMClient):
             rev = ""
 
         if path:
-            p = self._run_hg(['cat', '--rev', rev, path])
-            contents = p.stdout.read()
-            failure = p.wait()
+            failure, contents = self._run_hg_command(['cat', '--rev', rev,
+                                                      path])
 
             if not failure:
                 return contents
@@ -270,16 +407,13 @@ class HgClient(SCMClient):
             else:
                 hg_ssh = 'rbssh'
 
-            self.default_args.extend([
-                '--config', 'ui.ssh=%s' % hg_ssh,
-            ])
+            self.config_args = ['--config', 'ui.ssh=%s' % hg_ssh]
+            self.default_args.extend(self.config_args)
         else:
             logging.debug('Found configured ssh for mercurial: %s' % hg_ssh)
 
     def _get_hg_config(self, config_name):
-        p = self._run_hg(['showconfig', config_name])
-        contents = p.stdout.read()
-        failure = p.wait()
+        failure, contents = self._run_hg_command(['showconfig', config_name])
 
         if failure:
             # Just assume it's empty.
@@ -287,6 +421,40 @@ class HgClient(SCMClient):
 
         return contents.strip()
 
+    def _run_hg_command(self, args):
+        """Runs a Mercurial command, returning its exit code and output.
+
+        If the HG_USE_COMMAND_SERVER setting is enabled, this will run the
+        command through the repository's HgCommandServer. If the command
+        server can't be used, or the setting is disabled, this falls back
+        on running hg directly.
+        """
+        if not self.default_args:
+            self._calculate_default_args()
+
+        if self.use_command_server:
+            server = get_persistent_process(HgCommandServer, self.path,
+                                            self.local_site_name)
+
+            if server.is_available():
+                try:
+                    result = server.run_command(self.config_args + args)
+                    server.failed_at = None
+
+                    return result
+                except SCMError as e:
+                    logging.warning('Unable to use the hg command server '
+                                    'for %s. Falling back on running hg '
+                                    'directly for %d seconds: %s',
+                                    self.path, server.RETRY_INTERVAL, e)
+                    server.mark_unavailable()
+
+        p = self._run_hg(args)
+        contents = p.stdout.read()
+        failure = p.wait()
+
+        return failure, contents
+
     def _run_hg(self, args):
         """Runs the Mercurial command, returning a subprocess.Popen."""
         if not self.default_args:
@@ -0,0 +1,242 @@
+from __future__ import unicode_literals
+
+import atexit
+import logging
+import os
+import socket
+import threading
+import time
+import zlib
+from collections import defaultdict
+
+from djblets.util.compat import six
+from djblets.util.compat.six.moves import http_client
+from djblets.util.compat.six.moves.urllib.error import URLError
+from djblets.util.compat.six.moves.urllib.request import (build_opener,
+                                                          HTTPHandler,
+                                                          HTTPSHandler)
+from djblets.util.compat.six.moves.urllib.response import addinfourl
+
+
+# The default timeout, in seconds, for HTTP requests made through urlopen.
+DEFAULT_TIMEOUT = 60
+
+
+class HTTPConnectionPool(object):
+    """A pool of idle HTTP connections, kept open for reuse.
+
+    Connections are pooled by scheme, host and port. A connection is only
+    used by one request at a time, and is returned to the pool once the
+    response has been read. At most MAX_IDLE_PER_HOST idle connections are
+    kept for each host, and connections idle for longer than IDLE_TIMEOUT
+    seconds are closed rather than reused, since servers will usually have
+    closed their end by then.
+
+    Connections inherited from a parent process (such as when web server
+    workers are forked) are never used, since their sockets would be shared
+    with the parent.
+    """
+    MAX_IDLE_PER_HOST = 4
+    IDLE_TIMEOUT = 30
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        """Returns an idle connection for the key, or None if there isn't one.
+        """
+        self._check_pid()
+        now = time.time()
+        expired = []
+        conn = None
+
+        with self._lock:
+            idle = self._idle[key]
+
+            while idle:
+                conn, last_used = idle.pop()
+
+                if now - last_used < self.IDLE_TIMEOUT:
+                    break
+
+                expired.append(conn)
+                conn = None
+
+        for expired_conn in expired:
+            expired_conn.close()
+
+        return conn
+
+    def release(self, key, conn):
+        """Returns a connection to the pool, once its response is read."""
+        self._check_pid()
+
+        with self._lock:
+            idle = self._idle[key]
+
+            if len(idle) < self.MAX_IDLE_PER_HOST:
+                idle.append((conn, time.time()))
+                conn = None
+
+        if conn is not None:
+            conn.close()
+
+    def close_all(self):
+        """Closes all idle connections."""
+        with self._lock:
+            conns = [
+                conn
+                for idle in six.itervalues(self._idle)
+                for conn, last_used in idle
+            ]
+            self._idle.clear()
+
+        for conn in conns:
+            conn.close()
+
+    def _check_pid(self):
+        if self.pid != os.getpid():
+            with self._lock:
+                # Drop the connections without closing them, so that the
+                # parent's sockets aren't affected.
+                self._idle.clear()
+                self.pid = os.getpid()
+
+
+_connection_pool = HTTPConnectionPool()
+atexit.register(_connection_pool.close_all)
+
+
+class KeepAliveHandlerMixin:
+    """Makes HTTP requests over pooled, persistent connections.
+
+    This replaces urllib2's handling of HTTP requests, which opens a new
+    connection (and for HTTPS, performs a new TLS handshake) for every
+    request. Connections are kept open in a shared HTTPConnectionPool and
+    reused for later requests to the same host.
+
+    Responses are read in full before being returned, so that the
+    connection can go back to the pool, and gzip-encoded responses are
+    requested and decoded. Otherwise, responses work the same way as with
+    urllib2, including raising HTTPError for error responses.
+
+    This is an old-style class, like urllib2's handlers. Otherwise, object
+    would come before them in the method resolution order.
+
+    Only requests with methods in RETRYABLE_METHODS, which are safe to
+    send twice, use pooled connections. If the pooled connection fails,
+    they're sent again on a new connection.
+    """
+    RETRYABLE_METHODS = ('GET', 'HEAD')
+
+    def do_open(self, http_class, req, **http_conn_args):
+        if req._tunnel_host:
+            # Requests through HTTPS proxies are tunneled, which the pool
+            # doesn't support.
+            do_open = six.get_unbound_function(HTTPHandler.do_open)
+
+            return do_open(self, http_class, req, **http_conn_args)
+
+        host = req.get_host()
+
+        if not host:
+            raise URLError('no host given')
+
+        key = (http_class, host, req.timeout)
+        headers = dict(req.unredirected_hdrs)
+        headers.update(dict(
+            (name, value)
+            for name, value in six.iteritems(req.headers)
+            if name not in headers
+        ))
+        headers = dict(
+            (name.title(), value)
+            for name, value in six.iteritems(headers)
+        )
+        headers.setdefault('Accept-Encoding', 'gzip')
+
+        if req.get_method() in self.RETRYABLE_METHODS:
+            conn = _connection_pool.acquire(key)
+        else:
+            # A request that fails on a pooled connection may still have
+            # been handled by the server, so it can't safely be sent again.
+            # Other requests always use a new connection instead.
+            conn = None
+
+        if conn is not None:
+            try:
+                r = self._send_request(conn, req, headers)
+            except (http_client.HTTPException, socket.error) as e:
+                # The server may have closed the connection while it was
+                # idle. Try again with a new connection.
+                logging.debug('Retrying HTTP request to %s after error on '
+                              'pooled connection: %s', host, e)
+                conn.close()
+                conn = None
+
+        if conn is None:
+            conn = http_class(host, timeout=req.timeout, **http_conn_args)
+            conn.set_debuglevel(self._debuglevel)
+
+            try:
+                r = self._send_request(conn, req, headers)
+            except (http_client.HTTPException, socket.error) as e:
+                conn.close()
+                raise URLError(e)
+
+        try:
+            data = r.read()
+        except (http_client.HTTPException, socket.error) as e:
+            conn.close()
+            raise URLError(e)
+
+        if r.will_close:
+            conn.close()
+        else:
+            _connection_pool.release(key, conn)
+
+        msg = r.msg
+
+        if msg.get('Content-Encoding', '').lower() == 'gzip':
+            try:
+                data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+            except zlib.error as e:
+                raise URLError('Unable to decode gzip response: %s' % e)
+
+            del msg['Content-Encoding']
+            del msg['Content-Length']
+            msg['Content-Length'] = '%d' % len(data)
+
+        resp = addinfourl(six.BytesIO(data), msg, req.get_full_url())
+        resp.code = r.status
+        resp.msg = r.reason
+
+        return resp
+
+    def _send_request(self, conn, req, headers):
+        conn.request(req.get_method(), req.get_selector(), req.data, headers)
+
+        return conn.getresponse()
+
+
+class KeepAliveHTTPHandler(KeepAliveHandlerMixin, HTTPHandler):
+    pass
+
+
+class KeepAliveHTTPSHandler(KeepAliveHandlerMixin, HTTPSHandler):
+    pass
+
+
+_opener = build_opener(KeepAliveHTTPHandler, KeepAliveHTTPSHandler)
+
+
+def urlopen(request, timeout=DEFAULT_TIMEOUT):
+    """Opens a URL, reusing pooled connections.
+
+    This works like urllib2.urlopen, but the connection is kept open
+    afterward for later requests to the same host. Requests time out after
+    the given number of seconds.
+    """
+    return _opener.open(request, timeout=timeout)
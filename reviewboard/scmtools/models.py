@@ -4,19 +4,25 @@ from django.contrib.auth.models import User
 from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured, ValidationError
 from django.db import models
+from django.db.models.signals import post_delete, post_save
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.http import urlquote
 from django.utils.translation import ugettext_lazy as _
 from djblets.cache.backend import cache_memoize, make_cache_key
 from djblets.db.fields import JSONField
 from djblets.log import log_timed
+from djblets.siteconfig.models import SiteConfiguration
 from djblets.util.compat import six
 
 from reviewboard.hostingsvcs.models import HostingServiceAccount
+from reviewboard.scmtools.core import HEAD
+from reviewboard.scmtools.errors import FileNotFoundError
+from reviewboard.scmtools.file_cache import get_repository_file_cache
 from reviewboard.scmtools.managers import RepositoryManager, ToolManager
 from reviewboard.scmtools.signals import (checked_file_exists,
                                           checking_file_exists,
                                           fetched_file, fetching_file)
+from reviewboard.scmtools.tool_cache import scmtool_cache
 from reviewboard.site.models import LocalSite
 
 
@@ -151,8 +157,13 @@ class Repository(models.Model):
     COMMITS_CACHE_PERIOD = 60 * 60 * 24  # 1 day
 
     def get_scmtool(self):
-        cls = self.tool.get_scmtool_class()
-        return cls(self)
+        """Returns the SCMTool for this repository.
+
+        Tools are cached for each thread, and reused until the repository's
+        configuration changes.
+        """
+        return scmtool_cache.get_tool(
+            self, lambda: self.tool.get_scmtool_class()(self))
 
     @property
     def hosting_service(self):
@@ -176,6 +187,29 @@ class Repository(models.Model):
         else:
             return self.get_scmtool().supports_post_commit
 
+    def get_max_concurrent_file_requests(self):
+        """Returns the number of file requests that can be made at once.
+
+        This is used when fetching or checking several files at once. It's
+        the value set for the repository if any, or the hosting service's
+        default otherwise. Repositories not on a hosting service make one
+        request at a time by default.
+        """
+        max_requests = None
+
+        if self.extra_data:
+            max_requests = self.extra_data.get('max_concurrent_file_requests')
+
+        if max_requests is None:
+            hosting_service = self.hosting_service
+
+            if hosting_service:
+                max_requests = hosting_service.max_concurrent_file_requests
+            else:
+                max_requests = 1
+
+        return max_requests
+
     def get_credentials(self):
         """Returns the credentials for this repository.
 
@@ -203,6 +237,10 @@ class Repository(models.Model):
         This will attempt to retrieve the file from the repository. If the
         repository is backed by a hosting service, it will go through that.
         Otherwise, it will attempt to directly access the repository.
+
+        If the file doesn't exist, this is remembered for a short time (see
+        _get_missing_file_cache_period), and FileNotFoundError is raised
+        again without checking the repository.
         """
         # We wrap the result of get_file in a list and then return the first
         # element after getting the result from the cache. This prevents the
@@ -214,8 +252,9 @@ class Repository(models.Model):
         # Django unicode changes.
         return cache_memoize(
             self._make_file_cache_key(path, revision, base_commit_id),
-            lambda: [self._get_file_uncached(path, revision, base_commit_id,
-                                             request)],
+            lambda: [self._get_file_from_file_cache(path, revision,
+                                                    base_commit_id,
+                                                    request)],
             large_data=True)[0]
 
     def get_file_exists(self, path, revision, base_commit_id=None,
@@ -227,21 +266,173 @@ class Repository(models.Model):
         repository.
 
         The result of this call will be cached, making future lookups
-        of this path and revision on this repository faster.
+        of this path and revision on this repository faster. Files that
+        don't exist are only remembered for a short time.
         """
         key = self._make_file_exists_cache_key(path, revision, base_commit_id)
 
         if cache.get(make_cache_key(key)) == '1':
             return True
 
-        exists = self._get_file_exists_uncached(path, revision,
-                                                base_commit_id, request)
+        if self._is_file_missing(path, revision, base_commit_id):
+            return False
+
+        file_cache = self._get_file_cache(revision)
+        file_key = self._make_file_cache_key(path, revision, base_commit_id)
+
+        if file_cache and file_cache.has_file(file_key):
+            exists = True
+        else:
+            exists = self._get_file_exists_uncached(path, revision,
+                                                    base_commit_id, request)
+
+            if exists and file_cache:
+                file_cache.set_file_exists(file_key)
 
         if exists:
             cache_memoize(key, lambda: '1')
+        else:
+            self._set_files_missing([(path, revision)], base_commit_id)
 
         return exists
 
+    def get_files(self, files, base_commit_id=None, request=None):
+        """Returns several files from the repository.
+
+        files is a list of (path, revision) tuples. This returns a list of
+        the contents of each file, in the same order. Files that don't exist
+        are returned as None.
+
+        Files already in the cache (or the on-disk file cache, if enabled)
+        are read from there. The rest are fetched together, using as few
+        requests to the repository or hosting service as it allows, and are
+        then stored in the cache for get_file. Files recently found to be
+        missing aren't fetched again.
+        """
+        results, cached = self._fetch_uncached_files(files, base_commit_id,
+                                                     request)
+
+        for i in cached:
+            path, revision = files[i]
+            results[i] = self.get_file(path, revision, base_commit_id,
+                                       request)
+
+        return results
+
+    def prefetch_files(self, files, base_commit_id=None, request=None):
+        """Fetches several files from the repository into the cache.
+
+        This works like get_files, but nothing is returned. Files already
+        in the cache are only checked for, rather than loaded, so this
+        only costs a cache lookup when all the files are cached.
+        """
+        self._fetch_uncached_files(files, base_commit_id, request)
+
+    def get_file_exists_many(self, files, base_commit_id=None, request=None):
+        """Returns whether each of several files exists in the repository.
+
+        files is a list of (path, revision) tuples. This returns a list of
+        booleans, in the same order.
+
+        Like get_file_exists, results are cached, and files that don't exist
+        are remembered for a short time. Other files are checked together,
+        using as few requests to the repository or hosting service as it
+        allows.
+        """
+        exists_keys = [
+            self._make_file_exists_cache_key(path, revision, base_commit_id)
+            for path, revision in files
+        ]
+        file_keys = [
+            make_cache_key(self._make_file_cache_key(
+                path, revision, base_commit_id))
+            for path, revision in files
+        ]
+        missing_keys = [
+            make_cache_key(self._make_missing_file_cache_key(
+                path, revision, base_commit_id))
+            for path, revision in files
+        ]
+        cached = cache.get_many(
+            [make_cache_key(key) for key in exists_keys] + file_keys +
+            missing_keys)
+        results = [False] * len(files)
+        unknown = []
+
+        for i, exists_key in enumerate(exists_keys):
+            if (cached.get(make_cache_key(exists_key)) == '1' or
+                file_keys[i] in cached):
+                results[i] = True
+                continue
+            elif missing_keys[i] in cached:
+                continue
+
+            path, revision = files[i]
+            file_cache = self._get_file_cache(revision)
+
+            if (file_cache and
+                file_cache.has_file(self._make_file_cache_key(
+                    path, revision, base_commit_id))):
+                cache_memoize(exists_key, lambda: '1')
+                results[i] = True
+            else:
+                unknown.append(i)
+
+        if unknown:
+            unknown_files = [files[i] for i in unknown]
+
+            for path, revision in unknown_files:
+                checking_file_exists.send(sender=self,
+                                          path=path,
+                                          revision=revision,
+                                          base_commit_id=base_commit_id,
+                                          request=request)
+
+            log_timer = log_timed("Checking %d files exist in %s"
+                                  % (len(unknown_files), self),
+                                  request=request)
+
+            hosting_service = self.hosting_service
+
+            if hosting_service:
+                exists_list = hosting_service.get_file_exists_many(
+                    self,
+                    unknown_files,
+                    base_commit_id=base_commit_id)
+            else:
+                exists_list = \
+                    self.get_scmtool().file_exists_many(unknown_files)
+
+            log_timer.done()
+            missing_files = []
+
+            for i, exists in zip(unknown, exists_list):
+                path, revision = files[i]
+
+                checked_file_exists.send(sender=self,
+                                         path=path,
+                                         revision=revision,
+                                         base_commit_id=base_commit_id,
+                                         request=request,
+                                         exists=exists)
+
+                if exists:
+                    file_cache = self._get_file_cache(revision)
+
+                    if file_cache:
+                        file_cache.set_file_exists(self._make_file_cache_key(
+                            path, revision, base_commit_id))
+
+                    cache_memoize(exists_keys[i], lambda: '1')
+                else:
+                    missing_files.append((path, revision))
+
+                results[i] = exists
+
+            self._set_files_missing(missing_files, base_commit_id)
+
+        return results
+
     def get_branches(self):
         """Returns a list of branches."""
         hosting_service = self.hosting_service
@@ -336,6 +527,94 @@ class Repository(models.Model):
                                             urlquote(revision),
                                             urlquote(base_commit_id or ''))
 
+    def _make_missing_file_cache_key(self, path, revision, base_commit_id):
+        """Makes a cache key for files known not to exist."""
+        return "file-missing:%s:%s:%s:%s" % (self.pk, urlquote(path),
+                                             urlquote(revision),
+                                             urlquote(base_commit_id or ''))
+
+    def _get_missing_file_cache_period(self, revision):
+        """Returns how long to remember that a file doesn't exist.
+
+        This is the ``repository_missing_file_cache_period`` setting, in
+        seconds. Missing files at HEAD revisions aren't remembered (0 is
+        returned), since they may be added at any time.
+        """
+        if revision == HEAD:
+            return 0
+
+        siteconfig = SiteConfiguration.objects.get_current()
+
+        return siteconfig.get('repository_missing_file_cache_period') or 0
+
+    def _is_file_missing(self, path, revision, base_commit_id):
+        """Returns whether a file was recently found not to exist."""
+        if not self._get_missing_file_cache_period(revision):
+            return False
+
+        return cache.get(make_cache_key(self._make_missing_file_cache_key(
+            path, revision, base_commit_id))) is not None
+
+    def _set_files_missing(self, files, base_commit_id):
+        """Records that files don't exist.
+
+        files is a list of (path, revision) tuples. Each is remembered for
+        the period returned by _get_missing_file_cache_period.
+        """
+        for path, revision in files:
+            period = self._get_missing_file_cache_period(revision)
+
+            if period:
+                cache.set(
+                    make_cache_key(self._make_missing_file_cache_key(
+                        path, revision, base_commit_id)),
+                    '1', period)
+
+    def _get_file_cache(self, revision):
+        """Returns the on-disk file cache to use for a revision.
+
+        None is returned if the cache is disabled. HEAD revisions are never
+        stored on disk, since they can change over time and the disk cache
+        may keep them for a long time.
+        """
+        if revision == HEAD:
+            return None
+
+        return get_repository_file_cache()
+
+    def _get_file_from_file_cache(self, path, revision, base_commit_id,
+                                  request):
+        """Internal function for fetching a file not in the main cache.
+
+        The file is read from the on-disk file cache, if enabled. If it's
+        not there, it's fetched from the repository and stored in the file
+        cache. FileNotFoundError is raised if the file doesn't exist, or
+        was recently found not to exist.
+        """
+        if self._is_file_missing(path, revision, base_commit_id):
+            raise FileNotFoundError(path, revision,
+                                    base_commit_id=base_commit_id)
+
+        file_cache = self._get_file_cache(revision)
+        key = self._make_file_cache_key(path, revision, base_commit_id)
+        data = None
+
+        if file_cache:
+            data = file_cache.get_file(key)
+
+        if data is None:
+            try:
+                data = self._get_file_uncached(path, revision, base_commit_id,
+                                               request)
+            except FileNotFoundError:
+                self._set_files_missing([(path, revision)], base_commit_id)
+                raise
+
+            if file_cache:
+                file_cache.set_file(key, data)
+
+        return data
+
     def _get_file_uncached(self, path, revision, base_commit_id, request):
         """Internal function for fetching an uncached file.
 
@@ -378,6 +657,112 @@ class Repository(models.Model):
 
         return data
 
+    def _fetch_uncached_files(self, files, base_commit_id, request):
+        """Fetches and caches the files that aren't in the cache.
+
+        Files in the on-disk file cache are copied into the cache. The rest
+        are fetched together from the repository.
+
+        This returns a list of the contents of each file fetched (or None),
+        and a list of the indexes of the files that were already cached,
+        which aren't loaded.
+        """
+        keys = [
+            self._make_file_cache_key(path, revision, base_commit_id)
+            for path, revision in files
+        ]
+        missing_keys = [
+            make_cache_key(self._make_missing_file_cache_key(
+                path, revision, base_commit_id))
+            for path, revision in files
+        ]
+        cached_keys = cache.get_many(
+            [make_cache_key(key) for key in keys] + missing_keys)
+        results = [None] * len(files)
+        cached = []
+        uncached = []
+
+        for i, (path, revision) in enumerate(files):
+            if make_cache_key(keys[i]) in cached_keys:
+                cached.append(i)
+                continue
+            elif missing_keys[i] in cached_keys:
+                continue
+
+            file_cache = self._get_file_cache(revision)
+            data = None
+
+            if file_cache:
+                data = file_cache.get_file(keys[i])
+
+            if data is None:
+                uncached.append(i)
+            else:
+                # See get_file for why the data is wrapped in a list.
+                cache_memoize(keys[i], lambda: [data], large_data=True)
+                results[i] = data
+
+        if uncached:
+            uncached_data = self._get_files_uncached(
+                [files[i] for i in uncached], base_commit_id, request)
+            missing_files = []
+
+            for i, data in zip(uncached, uncached_data):
+                if data is None:
+                    missing_files.append(files[i])
+                else:
+                    file_cache = self._get_file_cache(files[i][1])
+
+                    if file_cache:
+                        file_cache.set_file(keys[i], data)
+
+                    cache_memoize(keys[i], lambda: [data], large_data=True)
+
+                results[i] = data
+
+            self._set_files_missing(missing_files, base_commit_id)
+
+        return results, cached
+
+    def _get_files_uncached(self, files, base_commit_id, request):
+        """Internal function for fetching several uncached files.
+
+        This is called by get_files for the files that aren't already in
+        the cache.
+        """
+        for path, revision in files:
+            fetching_file.send(sender=self,
+                               path=path,
+                               revision=revision,
+                               base_commit_id=base_commit_id,
+                               request=request)
+
+        log_timer = log_timed("Fetching %d files from %s" % (len(files), self),
+                              request=request)
+
+        hosting_service = self.hosting_service
+
+        if hosting_service:
+            results = hosting_service.get_files(
+                self,
+                files,
+                base_commit_id=base_commit_id)
+        else:
+            results = self.get_scmtool().get_files(files)
+
+        log_timer.done()
+
+        for (path, revision), data in zip(files, results):
+            if data is not None:
+                fetched_file.send(sender=self,
+                                  path=path,
+                                  revision=revision,
+                                  base_commit_id=base_commit_id,
+                                  request=request,
+                                  data=data)
+
+        return results
+
     def _get_file_exists_uncached(self, path, revision, base_commit_id,
                                   request):
         """Internal function for checking that a file exists.
@@ -457,3 +842,22 @@ class Repository(models.Model):
         # the tables and enforce it in code whenever visible=True
         unique_together = (('name', 'local_site'),
                            ('path', 'local_site'))
+
+
+def _on_repository_changed(instance, **kwargs):
+    """Removes the cached SCMTools for a repository that has changed."""
+    scmtool_cache.invalidate(instance.pk)
+
+
+def _on_hosting_account_saved(instance, **kwargs):
+    """Removes the cached SCMTools for repositories using a hosting account.
+
+    The credentials used by these repositories may have changed.
+    """
+    for repository_id in instance.repositories.values_list('pk', flat=True):
+        scmtool_cache.invalidate(repository_id)
+
+
+post_save.connect(_on_repository_changed, sender=Repository)
+post_delete.connect(_on_repository_changed, sender=Repository)
+post_save.connect(_on_hosting_account_saved, sender=HostingServiceAccount)
@@ -1,5 +1,7 @@
 from __future__ import unicode_literals
 
+import atexit
+import logging
 import os
 import random
 import re
@@ -8,10 +10,12 @@ import signal
 import socket
 import subprocess
 import tempfile
+import threading
 import time
 
 from django.utils.translation import ugettext_lazy as _
 from djblets.util.compat import six
+from djblets.util.compat.six.moves import range
 from djblets.util.filesystem import is_exe_in_path
 try:
     from P4 import P4Exception
@@ -87,7 +91,179 @@ class STunnelProxy(object):
                 pass
 
 
+class PerforceConnection(object):
+    """An authenticated connection to a Perforce server.
+
+    This holds the P4 object used to talk to the server, along with the
+    stunnel proxy it connects through (if any), and tracks when it was
+    created, last used and last logged in.
+    """
+    def __init__(self, p4, proxy=None):
+        self.p4 = p4
+        self.proxy = proxy
+        self.created = time.time()
+        self.last_used = self.created
+        self.last_login = None
+
+    def is_usable(self, max_age, max_idle_time):
+        """Returns whether the connection can be used for another request.
+
+        Connections that are older than max_age, have been idle for longer
+        than max_idle_time, or are no longer connected are not usable.
+        """
+        now = time.time()
+
+        if (now - self.created >= max_age or
+            now - self.last_used >= max_idle_time):
+            return False
+
+        try:
+            return (self.p4.connected() and
+                    not (hasattr(self.p4, 'dropped') and self.p4.dropped()))
+        except Exception:
+            return False
+
+    def close(self):
+        """Disconnects from the server and shuts down the stunnel proxy."""
+        try:
+            if self.p4.connected():
+                self.p4.disconnect()
+        except Exception as e:
+            logging.warning('Error disconnecting from Perforce server %s: %s',
+                            self.p4.port, e)
+
+        if self.proxy:
+            try:
+                self.proxy.shutdown()
+            except Exception as e:
+                logging.warning('Error shutting down stunnel proxy: %s', e)
+
+            self.proxy = None
+
+
+class PerforceConnectionPool(object):
+    """A pool of connections to Perforce servers.
+
+    Connecting and logging in to a Perforce server (and starting an stunnel
+    proxy, for servers that need one) takes far longer than most commands
+    run against it. Rather than connecting for each command, connections
+    are kept open and reused by later commands.
+
+    Connections are pooled separately for each server and set of
+    credentials, given as a key. Each connection is used by only one
+    thread at a time. A connection is closed instead of reused once it's
+    older than MAX_AGE seconds, has been idle for MAX_IDLE_TIME seconds, or
+    has been disconnected. At most MAX_IDLE_CONNECTIONS unused connections
+    are kept for each key.
+
+    Connections inherited from a parent process (such as when web server
+    workers are forked) are never used, since their sockets would be shared
+    with the parent.
+    """
+    MAX_AGE = 30 * 60
+    MAX_IDLE_TIME = 5 * 60
+    MAX_IDLE_CONNECTIONS = 4
+
+    def __init__(self):
+        self.pid = os.getpid()
+
+        self._idle_connections = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key, connect_func):
+        """Returns a connection for the given key.
+
+        An idle connection is reused if there's a usable one. Otherwise,
+        connect_func is called to create a new connection.
+        """
+        stale_connections = []
+        connection = None
+
+        with self._lock:
+            self._check_pid()
+            idle_connections = self._idle_connections.get(key, [])
+
+            while idle_connections:
+                candidate = idle_connections.pop()
+
+                if candidate.is_usable(self.MAX_AGE, self.MAX_IDLE_TIME):
+                    connection = candidate
+                    break
+
+                stale_connections.append(candidate)
+
+        for stale_connection in stale_connections:
+            stale_connection.close()
+
+        if connection is None:
+            connection = connect_func()
+
+        return connection
+
+    def release(self, key, connection):
+        """Returns a connection to the pool once a request is finished.
+
+        The connection is closed if it's no longer usable, or if there are
+        already enough idle connections for the key.
+        """
+        connection.last_used = time.time()
+
+        with self._lock:
+            self._check_pid()
+            idle_connections = self._idle_connections.setdefault(key, [])
+
+            if (len(idle_connections) < self.MAX_IDLE_CONNECTIONS and
+                connection.is_usable(self.MAX_AGE, self.MAX_IDLE_TIME)):
+                idle_connections.append(connection)
+                connection = None
+
+        if connection is not None:
+            connection.close()
+
+    def discard(self, connection):
+        """Closes a connection that shouldn't be reused.
+
+        This should be called instead of release if a request failed in a
+        way that may have left the connection in a bad state.
+        """
+        connection.close()
+
+    def close_all(self):
+        """Closes all idle connections in the pool."""
+        with self._lock:
+            if self.pid == os.getpid():
+                connections = [
+                    connection
+                    for idle_connections in six.itervalues(
+                        self._idle_connections)
+                    for connection in idle_connections
+                ]
+            else:
+                connections = []
+
+            self._idle_connections.clear()
+
+        for connection in connections:
+            connection.close()
+
+    def _check_pid(self):
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self._idle_connections = {}
+
+
+_connection_pool = PerforceConnectionPool()
+atexit.register(_connection_pool.close_all)
+
+
 class PerforceClient(object):
+    # How often a ticket-authenticated connection logs in again, to keep its
+    # ticket from expiring while the connection is in the pool.
+    TICKET_REFRESH_INTERVAL = 10 * 60
+
+    # The maximum number of files fetched by a single 'p4 print'.
+    MAX_PRINT_FILES = 100
+
     def __init__(self, p4port, username, password, encoding, use_stunnel=False,
                  use_ticket_auth=False):
         self.p4port = p4port
@@ -96,62 +272,71 @@ class PerforceClient(object):
         self.encoding = encoding
         self.use_stunnel = use_stunnel
         self.use_ticket_auth = use_ticket_auth
-        self.proxy = None
 
+        # Make sure that p4python is available before going any further.
         import P4
-        self.p4 = P4.P4()
 
         if use_stunnel and not is_exe_in_path('stunnel'):
             raise AttributeError('stunnel proxy was requested, but stunnel '
                                  'binary is not in the exec path.')
 
+    @property
+    def _pool_key(self):
+        return (self.p4port, self.username, self.password, self.encoding,
+                self.use_stunnel, self.use_ticket_auth)
+
     def _connect(self):
         """
         Connect to the perforce server.
 
         This connects p4python to the remote server, optionally using a stunnel
-        proxy.
+        proxy, and returns the new PerforceConnection.
         """
-        self.p4.user = self.username.encode('utf-8')
-        self.p4.password = self.password.encode('utf-8')
+        import P4
+        p4 = P4.P4()
+        p4.user = self.username.encode('utf-8')
+        p4.password = self.password.encode('utf-8')
 
         if self.encoding:
-            self.p4.charset = self.encoding.encode('utf-8')
+            p4.charset = self.encoding.encode('utf-8')
 
-        self.p4.exception_level = 1
+        p4.exception_level = 1
 
         if self.use_stunnel:
             # Spin up an stunnel client and then redirect through that
-            self.proxy = STunnelProxy(STUNNEL_CLIENT, self.p4port)
-            self.proxy.start_client()
-            p4_port = '127.0.0.1:%d' % self.proxy.port
+            proxy = STunnelProxy(STUNNEL_CLIENT, self.p4port)
+            proxy.start_client()
+            p4_port = '127.0.0.1:%d' % proxy.port
         else:
+            proxy = None
             p4_port = self.p4port
 
-        self.p4.port = p4_port.encode('utf-8')
+        p4.port = p4_port.encode('utf-8')
+        connection = PerforceConnection(p4, proxy)
 
-        self.p4.connect()
+        try:
+            p4.connect()
 
-        if self.use_ticket_auth:
-            self.p4.run_login()
+            if self.use_ticket_auth:
+                self._login(connection)
+        except:
+            connection.close()
+            raise
 
-    def _disconnect(self):
-        """
-        Disconnect from the perforce server, and also shut down the stunnel
-        proxy (if it exists).
-        """
-        try:
-            if self.p4.connected():
-                self.p4.disconnect()
-        except AttributeError:
-            pass
+        return connection
 
-        if self.proxy:
-            try:
-                self.proxy.shutdown()
-            except:
-                pass
-            self.proxy = None
+    def _login(self, connection):
+        """Logs in to the server, fetching a new ticket."""
+        connection.p4.run_login()
+        connection.last_login = time.time()
+
+    @staticmethod
+    def _is_login_required(e):
+        error = six.text_type(e)
+
+        return ('Your session has expired' in error or
+                'Perforce password' in error or
+                'Password must be set' in error)
 
     @staticmethod
     def _convert_p4exception_to_scmexception(e):
@@ -175,55 +360,81 @@ class PerforceClient(object):
             raise SCMError(error)
 
     def _run_worker(self, worker):
-        result = None
+        """Runs a function using a pooled connection to the server.
+
+        The worker is passed the connection's P4 object. If the server
+        says that the connection's ticket has expired, this logs in again
+        and retries the worker once.
+        """
+        key = self._pool_key
+
+        try:
+            connection = _connection_pool.acquire(key, self._connect)
+        except P4Exception as e:
+            self._convert_p4exception_to_scmexception(e)
 
-        # TODO: Move to using with: when we require a minimum of Python 2.5.
-        #       We should make it auto-disconnect.
         try:
-            self._connect()
-            result = worker()
-            self._disconnect()
+            if (self.use_ticket_auth and
+                time.time() - connection.last_login >=
+                self.TICKET_REFRESH_INTERVAL):
+                self._login(connection)
+
+            try:
+                result = worker(connection.p4)
+            except P4Exception as e:
+                if self.use_ticket_auth and self._is_login_required(e):
+                    self._login(connection)
+                    result = worker(connection.p4)
+                else:
+                    raise
         except P4Exception as e:
-            self._disconnect()
+            _connection_pool.discard(connection)
             self._convert_p4exception_to_scmexception(e)
         except:
-            self._disconnect()
+            _connection_pool.discard(connection)
             raise
 
+        _connection_pool.release(key, connection)
+
         return result
 
-    def _get_changeset(self, changesetid):
-        return self.p4.run_describe('-s', six.text_type(changesetid))
+    def _get_changeset(self, p4, changesetid):
+        return p4.run_describe('-s', six.text_type(changesetid))
 
     def get_changeset(self, changesetid):
         """
         Get the contents of a changeset description.
         """
-        return self._run_worker(lambda: self._get_changeset(changesetid))
+        return self._run_worker(
+            lambda p4: self._get_changeset(p4, changesetid))
 
     def get_info(self):
-        return self._run_worker(self.p4.run_info)
+        return self._run_worker(lambda p4: p4.run_info())
 
-    def _get_pending_changesets(self, userid):
-        changesets = self.p4.run_changes('-s', 'pending', '-u', userid)
-        return map(self._get_changeset, [x.split()[1] for x in changesets])
+    def _get_pending_changesets(self, p4, userid):
+        changesets = p4.run_changes('-s', 'pending', '-u', userid)
+        return [self._get_changeset(p4, x.split()[1]) for x in changesets]
 
     def get_pending_changesets(self, userid):
         """
         Get a list of changeset descriptions for all pending changesets for a
         given user.
         """
-        return self._run_worker(lambda: self._get_pending_changesets(userid))
+        return self._run_worker(
+            lambda p4: self._get_pending_changesets(p4, userid))
+
+    @staticmethod
+    def _get_depot_path(path, revision):
+        if revision == HEAD:
+            return path
+        else:
+            return '%s#%s' % (path, revision)
 
-    def _get_file(self, path, revision):
+    def _get_file(self, p4, path, revision):
         if revision == PRE_CREATION:
             return ''
-        elif revision == HEAD:
-            depot_path = path
-        else:
-            depot_path = '%s#%s' % (path, revision)
 
-        res = self.p4.run_print('-q', depot_path)
+        res = p4.run_print('-q', self._get_depot_path(path, revision))
         if res:
             return res[-1]
 
@@ -231,10 +442,70 @@ class PerforceClient(object):
         """
         Get the contents of a file, at a specific revision.
         """
-        return self._run_worker(lambda: self._get_file(path, revision))
+        return self._run_worker(lambda p4: self._get_file(p4, path, revision))
+
+    @staticmethod
+    def _split_print_results(results):
+        """Splits the results of a 'p4 print' of several files.
+
+        p4python returns a dictionary of information on each file, followed
+        by the file's contents (which may be split across several strings).
+        This returns a list of (depot path, contents) tuples.
+        """
+        files = []
+
+        for item in results:
+            if isinstance(item, dict):
+                files.append((item.get('depotFile'), []))
+            elif files:
+                files[-1][1].append(item)
+
+        return [
+            (depot_path, type(parts[0])().join(parts) if parts else '')
+            for depot_path, parts in files
+        ]
+
+    def _get_files(self, p4, files):
+        contents = [None] * len(files)
+        to_print = []
+
+        for i, (path, revision) in enumerate(files):
+            if revision == PRE_CREATION:
+                contents[i] = ''
+            else:
+                to_print.append(i)
+
+        for batch_start in range(0, len(to_print), self.MAX_PRINT_FILES):
+            batch = to_print[batch_start:batch_start + self.MAX_PRINT_FILES]
+            results = self._split_print_results(p4.run_print(
+                '-q',
+                *[self._get_depot_path(*files[i]) for i in batch]))
+
+            # Files are printed in the order they're requested, but files
+            # that can't be printed are left out of the results. Match the
+            # results up against the requested paths, and fall back on
+            # printing anything left over individually.
+            results.reverse()
+
+            for i in batch:
+                if results and results[-1][0] == files[i][0]:
+                    contents[i] = results.pop()[1]
+                else:
+                    contents[i] = self._get_file(p4, *files[i])
+
+        return contents
+
+    def get_files(self, files):
+        """
+        Get the contents of several files, using as few commands as possible.
+
+        files is a list of (path, revision) tuples. This returns a list of
+        the contents of each file, in the same order.
+        """
+        return self._run_worker(lambda p4: self._get_files(p4, files))
 
-    def _get_files_at_revision(self, revision_str):
-        return self.p4.run_files(revision_str)
+    def _get_files_at_revision(self, p4, revision_str):
+        return p4.run_files(revision_str)
 
     def get_files_at_revision(self, revision_str):
         """
@@ -242,7 +513,7 @@ class PerforceClient(object):
         to 'p4 files'
         """
         return self._run_worker(
-            lambda: self._get_files_at_revision(revision_str))
+            lambda p4: self._get_files_at_revision(p4, revision_str))
 
 
 class PerforceTool(SCMTool):
@@ -335,6 +606,14 @@ class PerforceTool(SCMTool):
     def get_file(self, path, revision=HEAD):
         return self.client.get_file(path, revision)
 
+    def get_files(self, files):
+        """Returns the contents of several files at once.
+
+        files is a list of (path, revision) tuples. The files are fetched
+        in batches over a single connection.
+        """
+        return self.client.get_files(files)
+
     def parse_diff_revision(self, file_str, revision_str, *args, **kwargs):
         # Perforce has this lovely idiosyncracy that diffs show revision #1 both
         # for pre-creation and when there's an actual revision.
@@ -0,0 +1,175 @@
+from __future__ import unicode_literals
+
+import atexit
+import logging
+import os
+import threading
+import time
+
+from djblets.util.compat import six
+
+from reviewboard.scmtools.errors import SCMError
+
+
+class PersistentProcess(object):
+    """A long-running process used to communicate with a repository.
+
+    Starting a new process for every file or command can be expensive,
+    especially for tools written in Python, which take a while to start up.
+    Subclasses of this keep a single process running, sending each request
+    to it over its pipes.
+
+    One process is shared by all threads working with the repository.
+    Requests are serialized, each one being written and its result read
+    before the next is sent. If the process dies or a request fails with
+    an IOError, OSError or ValueError, the process is restarted and the
+    request is tried once more. If that fails, SCMError is raised. The
+    process is shut down after being idle for IDLE_TIMEOUT seconds, and
+    started again on the next request.
+
+    Subclasses must implement start_process and handle_request. Use
+    get_persistent_process to get the shared process for a repository.
+    """
+    IDLE_TIMEOUT = 60
+
+    def __init__(self, local_site_name=None):
+        self.local_site_name = local_site_name
+        self.pid = os.getpid()
+        self.process = None
+
+        self._last_used = 0
+        self._idle_timer = None
+        self._lock = threading.Lock()
+
+    def run_request(self, *args, **kwargs):
+        """Sends a request to the process, returning the result.
+
+        The arguments are passed to handle_request. The process is started
+        if it isn't already running.
+        """
+        with self._lock:
+            try:
+                result = self._run_request(*args, **kwargs)
+            except (IOError, OSError, ValueError) as e:
+                logging.warning('Restarting %s after error: %s', self, e)
+                self._stop()
+
+                try:
+                    result = self._run_request(*args, **kwargs)
+                except (IOError, OSError, ValueError) as e:
+                    self._stop()
+                    raise SCMError('Unable to communicate with %s: %s'
+                                   % (self, e))
+
+            self._last_used = time.time()
+
+            if self._idle_timer is None:
+                self._start_idle_timer(self.IDLE_TIMEOUT)
+
+        return result
+
+    def close(self):
+        """Shuts down the process, if running."""
+        with self._lock:
+            idle_timer = self._idle_timer
+            self._stop()
+
+        if idle_timer is not None:
+            # Wait for the timer's thread to finish, so it isn't left
+            # running while the interpreter shuts down.
+            idle_timer.join()
+
+    def start_process(self):
+        """Starts the process, returning a subprocess.Popen.
+
+        This must be implemented by subclasses.
+        """
+        raise NotImplementedError
+
+    def handle_request(self, process, *args, **kwargs):
+        """Performs a request using the running process.
+
+        This must be implemented by subclasses. It should raise IOError or
+        ValueError if the process doesn't respond as expected.
+        """
+        raise NotImplementedError
+
+    def stop_process(self, process):
+        """Stops the process.
+
+        By default, this closes the process's input and waits for it to
+        exit.
+        """
+        process.stdin.close()
+        process.wait()
+
+    def _run_request(self, *args, **kwargs):
+        if self.process is None or self.process.poll() is not None:
+            self._stop()
+            self.process = self.start_process()
+
+        return self.handle_request(self.process, *args, **kwargs)
+
+    def _stop(self):
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+
+        if self.process is not None:
+            process = self.process
+            self.process = None
+
+            try:
+                self.stop_process(process)
+            except (IOError, OSError) as e:
+                logging.warning('Error stopping %s: %s', self, e)
+
+    def _start_idle_timer(self, timeout):
+        self._idle_timer = threading.Timer(timeout, self._check_idle)
+        self._idle_timer.daemon = True
+        self._idle_timer.start()
+
+    def _check_idle(self):
+        with self._lock:
+            idle_time = time.time() - self._last_used
+
+            if idle_time >= self.IDLE_TIMEOUT:
+                self._idle_timer = None
+                self._stop()
+            else:
+                self._start_idle_timer(self.IDLE_TIMEOUT - idle_time)
+
+
+_persistent_processes = {}
+_persistent_processes_lock = threading.Lock()
+
+
+def get_persistent_process(process_cls, *args, **kwargs):
+    """Returns the shared PersistentProcess for the given arguments.
+
+    One instance of process_cls is created and shared for each set of
+    arguments within a server process. Instances inherited from a parent
+    process (such as when web server workers are forked) are not used,
+    since their pipes would be shared with the parent.
+    """
+    key = (process_cls, args, tuple(sorted(six.iteritems(kwargs))))
+
+    with _persistent_processes_lock:
+        process = _persistent_processes.get(key)
+
+        if process is None or process.pid != os.getpid():
+            process = process_cls(*args, **kwargs)
+            _persistent_processes[key] = process
+
+    return process
+
+
+@atexit.register
+def _close_persistent_processes():
+    """Shuts down all persistent processes when exiting."""
+    with _persistent_processes_lock:
+        for process in six.itervalues(_persistent_processes):
+            if process.pid == os.getpid():
+                process.close()
+
+        _persistent_processes.clear()
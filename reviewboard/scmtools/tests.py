@@ -1,7 +1,12 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import copy
+import gzip
 import os
+import shutil
+import threading
+import time
 from errno import ECONNREFUSED
 from hashlib import md5
 from socket import error as SocketError
@@ -11,11 +16,17 @@ from django import forms
 from django.contrib.auth.models import AnonymousUser, User
 from django.core.cache import cache
 from django.test import TestCase as DjangoTestCase
+from djblets.siteconfig.models import SiteConfiguration
 from djblets.util.compat import six
-from djblets.util.compat.six.moves import zip_longest
+from djblets.util.compat.six.moves import (BaseHTTPServer, socketserver,
+                                           zip_longest)
+from djblets.util.compat.six.moves.urllib.error import HTTPError
+from djblets.util.compat.six.moves.urllib.request import Request as URLRequest
 from djblets.util.filesystem import is_exe_in_path
+from kgb import SpyAgency
 import nose
 
+from reviewboard.diffviewer.differ import DiffCompatVersion
 from reviewboard.diffviewer.diffutils import patch
 from reviewboard.diffviewer.parser import DiffParserError
 from reviewboard.hostingsvcs.forms import HostingServiceForm
@@ -25,17 +36,29 @@ from reviewboard.hostingsvcs.service import (HostingService,
                                              unregister_hosting_service)
 from reviewboard.reviews.models import Group
 from reviewboard.scmtools.core import (Branch, ChangeSet, Commit, Revision,
-                                       HEAD, PRE_CREATION)
+                                       SCMTool, HEAD, PRE_CREATION)
 from reviewboard.scmtools.errors import (SCMError, FileNotFoundError,
                                          RepositoryNotFoundError,
                                          AuthenticationError)
+from reviewboard.scmtools.file_cache import (RepositoryFileCache,
+                                             get_repository_file_cache)
 from reviewboard.scmtools.forms import RepositoryForm
-from reviewboard.scmtools.git import ShortSHA1Error
+from reviewboard.scmtools.git import (GitCatFileProcess, ShortSHA1Error,
+                                      get_git_cat_file_process)
+from reviewboard.scmtools.hg import HgCommandServer
+from reviewboard.scmtools.http_pool import (HTTPConnectionPool,
+                                            _connection_pool,
+                                            urlopen)
 from reviewboard.scmtools.models import Repository, Tool
-from reviewboard.scmtools.perforce import STunnelProxy, STUNNEL_SERVER
+from reviewboard.scmtools.perforce import (PerforceClient,
+                                           PerforceConnection,
+                                           PerforceConnectionPool,
+                                           STunnelProxy, STUNNEL_SERVER)
+from reviewboard.scmtools.processes import get_persistent_process
 from reviewboard.scmtools.signals import (checked_file_exists,
                                           checking_file_exists,
                                           fetched_file, fetching_file)
+from reviewboard.scmtools.tool_cache import SCMToolCache
 from reviewboard.site.models import LocalSite
 from reviewboard.ssh.client import SSHClient
 from reviewboard.ssh.tests import SSHTestCase
@@ -153,7 +176,7 @@ class CoreTests(DjangoTestCase):
         self.assertTrue(len(cs.files) == 0)
 
 
-class RepositoryTests(DjangoTestCase):
+class RepositoryTests(SpyAgency, DjangoTestCase):
     fixtures = ['test_scmtools']
 
     def setUp(self):
@@ -166,13 +189,16 @@ class RepositoryTests(DjangoTestCase):
         self.scmtool_cls = self.repository.get_scmtool().__class__
         self.old_get_file = self.scmtool_cls.get_file
         self.old_file_exists = self.scmtool_cls.file_exists
+        self.old_get_files = self.scmtool_cls.get_files
+        self.old_file_exists_many = self.scmtool_cls.file_exists_many
 
     def tearDown(self):
         cache.clear()
 
         self.scmtool_cls.get_file = self.old_get_file
         self.scmtool_cls.file_exists = self.old_file_exists
-
+        self.scmtool_cls.get_files = self.old_get_files
+        self.scmtool_cls.file_exists_many = self.old_file_exists_many
     def test_get_file_caching(self):
         """Testing Repository.get_file caches result"""
         def get_file(self, path, revision):
@@ -252,6 +278,10 @@ class RepositoryTests(DjangoTestCase):
             num_calls['get_file_exists'] += 1
             return False
 
+        # Missing files are otherwise remembered for a short time. See
+        # test_get_file_exists_with_missing_file.
+        self._set_missing_file_cache_period(0)
+
         num_calls = {
             'get_file_exists': 0,
         }
@@ -331,6 +361,650 @@ class RepositoryTests(DjangoTestCase):
         self.assertEqual(found_signals[1],
                          ('checked_file_exists', path, revision, request))
 
+    def test_get_files_caching(self):
+        """Testing Repository.get_files caches results"""
+        def get_files(self, files):
+            fetched.append(files)
+            return [b'data for %s' % revision for path, revision in files]
+
+        fetched = []
+        self.scmtool_cls.get_files = get_files
+
+        self.assertEqual(self.repository.get_file('readme', 'e965047'),
+                         b'Hello\n')
+
+        files = [('readme', 'e965047'), ('readme', 'd6613f5')]
+        self.assertEqual(self.repository.get_files(files),
+                         [b'Hello\n', b'data for d6613f5'])
+        self.assertEqual(self.repository.get_files(files),
+                         [b'Hello\n', b'data for d6613f5'])
+        self.assertEqual(self.repository.get_file('readme', 'd6613f5'),
+                         b'data for d6613f5')
+
+        self.assertEqual(fetched, [[('readme', 'd6613f5')]])
+
+    def test_prefetch_files(self):
+        """Testing Repository.prefetch_files doesn't load cached files"""
+        def get_files(self, files):
+            fetched.append(files)
+            return [b'data for %s' % revision for path, revision in files]
+
+        fetched = []
+        self.scmtool_cls.get_files = get_files
+
+        self.assertEqual(self.repository.get_file('readme', 'e965047'),
+                         b'Hello\n')
+
+        self.spy_on(self.repository.get_file)
+
+        files = [('readme', 'e965047'), ('readme', 'd6613f5')]
+        self.repository.prefetch_files(files)
+        self.repository.prefetch_files(files)
+
+        self.assertFalse(self.repository.get_file.called)
+        self.assertEqual(fetched, [[('readme', 'd6613f5')]])
+        self.assertEqual(self.repository.get_file('readme', 'd6613f5'),
+                         b'data for d6613f5')
+
+    def test_get_files_with_missing_files(self):
+        """Testing Repository.get_files with missing files"""
+        self.assertEqual(
+            self.repository.get_files([('readme', '0000000'),
+                                       ('readme', 'e965047')]),
+            [None, b'Hello\n'])
+        self.assertRaises(
+            FileNotFoundError,
+            lambda: self.repository.get_file('readme', '0000000'))
+
+    def test_get_files_signals(self):
+        """Testing Repository.get_files emits signals"""
+        def on_fetching(sender, path, revision, request, **kwargs):
+            found_signals.append(('fetching_file', path, revision, request))
+
+        def on_fetched(sender, path, revision, request, **kwargs):
+            found_signals.append(('fetched_file', path, revision, request))
+
+        found_signals = []
+
+        fetching_file.connect(on_fetching, sender=self.repository)
+        fetched_file.connect(on_fetched, sender=self.repository)
+
+        request = {}
+        self.repository.get_files([('readme', 'e965047'),
+                                   ('readme', '0000000')],
+                                  request=request)
+
+        self.assertEqual(found_signals, [
+            ('fetching_file', 'readme', 'e965047', request),
+            ('fetching_file', 'readme', '0000000', request),
+            ('fetched_file', 'readme', 'e965047', request),
+        ])
+
+    def test_get_file_exists_many_caching(self):
+        """Testing Repository.get_file_exists_many caches results"""
+        def file_exists_many(self, files):
+            checked.append(files)
+            return [revision != 'missing' for path, revision in files]
+
+        checked = []
+        self.scmtool_cls.file_exists_many = file_exists_many
+        self._set_missing_file_cache_period(0)
+
+        self.repository.get_file('readme', 'e965047')
+
+        files = [('readme', 'e965047'), ('readme', 'd6613f5'),
+                 ('readme', 'missing')]
+        self.assertEqual(self.repository.get_file_exists_many(files),
+                         [True, True, False])
+        self.assertEqual(self.repository.get_file_exists_many(files),
+                         [True, True, False])
+        self.assertTrue(self.repository.get_file_exists('readme', 'd6613f5'))
+
+        self.assertEqual(checked, [
+            [('readme', 'd6613f5'), ('readme', 'missing')],
+            [('readme', 'missing')],
+        ])
+
+    def test_get_files_concurrently(self):
+        """Testing Repository.get_files with concurrent file requests"""
+        def get_file(tool, path, revision):
+            with lock:
+                tools.add(tool)
+
+            if revision == 'missing':
+                raise FileNotFoundError(path, revision)
+
+            return ('%s@%s' % (path, revision)).encode('utf-8')
+
+        lock = threading.Lock()
+        tools = set()
+        self.scmtool_cls.get_file = get_file
+        self.scmtool_cls.get_files = \
+            six.get_unbound_function(SCMTool.get_files)
+        self.repository.extra_data['max_concurrent_file_requests'] = 3
+        self.assertEqual(self.repository.get_max_concurrent_file_requests(),
+                         3)
+
+        files = [('readme%d' % i, 'abc123') for i in range(10)]
+        files.append(('readme', 'missing'))
+
+        results = self.repository.get_files(files)
+        self.assertEqual(len(results), 11)
+        self.assertEqual(results[0], b'readme0@abc123')
+        self.assertEqual(results[9], b'readme9@abc123')
+        self.assertEqual(results[10], None)
+
+        # Each thread uses its own tool.
+        self.assertTrue(1 <= len(tools) <= 3)
+        self.assertFalse(self.repository.get_scmtool() in tools)
+
+    def test_get_max_concurrent_file_requests_default(self):
+        """Testing Repository.get_max_concurrent_file_requests default"""
+        self.assertEqual(self.repository.get_max_concurrent_file_requests(),
+                         1)
+
+    def test_get_file_with_file_cache(self):
+        """Testing Repository.get_file with the repository file cache"""
+        def get_file(self, path, revision):
+            num_calls['get_file'] += 1
+            return b'file data'
+
+        num_calls = {
+            'get_file': 0,
+        }
+
+        self.scmtool_cls.get_file = get_file
+        self._enable_file_cache()
+
+        self.assertEqual(self.repository.get_file('readme', 'e965047'),
+                         b'file data')
+
+        # Remove the file from the main cache. It should be read from disk.
+        cache.clear()
+        self.assertEqual(self.repository.get_file('readme', 'e965047'),
+                         b'file data')
+        self.assertEqual(num_calls['get_file'], 1)
+
+        cache.clear()
+        self.assertTrue(self.repository.get_file_exists('readme', 'e965047'))
+        self.assertEqual(
+            self.repository.get_files([('readme', 'e965047')]),
+            [b'file data'])
+        self.assertEqual(num_calls['get_file'], 1)
+
+    def test_get_file_with_file_cache_and_head(self):
+        """Testing Repository.get_file with the repository file cache and
+        HEAD revisions
+        """
+        def get_file(self, path, revision):
+            num_calls['get_file'] += 1
+            return b'file data'
+
+        num_calls = {
+            'get_file': 0,
+        }
+
+        self.scmtool_cls.get_file = get_file
+        file_cache = self._enable_file_cache()
+
+        self.repository.get_file('readme', HEAD)
+        cache.clear()
+        self.repository.get_file('readme', HEAD)
+
+        self.assertEqual(num_calls['get_file'], 2)
+        self.assertEqual(file_cache.get_stats()['num_files'], 0)
+
+    def test_get_file_exists_with_file_cache(self):
+        """Testing Repository.get_file_exists with the repository file cache"""
+        def file_exists(self, path, revision):
+            num_calls['file_exists'] += 1
+            return revision != 'missing'
+
+        num_calls = {
+            'file_exists': 0,
+        }
+
+        self.scmtool_cls.file_exists = file_exists
+        self._enable_file_cache()
+
+        self.assertTrue(self.repository.get_file_exists('readme', 'e965047'))
+        self.assertFalse(self.repository.get_file_exists('readme',
+                                                         'missing'))
+        self.assertEqual(num_calls['file_exists'], 2)
+
+        cache.clear()
+        self.assertTrue(self.repository.get_file_exists('readme', 'e965047'))
+        self.assertEqual(num_calls['file_exists'], 2)
+
+        cache.clear()
+        self.assertEqual(
+            self.repository.get_file_exists_many([('readme', 'e965047')]),
+            [True])
+        self.assertEqual(num_calls['file_exists'], 2)
+
+    def test_get_file_with_missing_file(self):
+        """Testing Repository.get_file remembers missing files"""
+        def get_file(self, path, revision):
+            num_calls['get_file'] += 1
+            raise FileNotFoundError(path, revision)
+
+        num_calls = {
+            'get_file': 0,
+        }
+
+        self.scmtool_cls.get_file = get_file
+        self._set_missing_file_cache_period(60)
+
+        for i in range(2):
+            self.assertRaises(
+                FileNotFoundError,
+                lambda: self.repository.get_file('readme', 'e965047'))
+
+        self.assertFalse(self.repository.get_file_exists('readme',
+                                                         'e965047'))
+        self.assertEqual(self.repository.get_files([('readme', 'e965047')]),
+                         [None])
+        self.assertEqual(
+            self.repository.get_file_exists_many([('readme', 'e965047')]),
+            [False])
+        self.assertEqual(num_calls['get_file'], 1)
+
+    def test_get_file_with_missing_file_and_head(self):
+        """Testing Repository.get_file doesn't remember missing files at
+        HEAD
+        """
+        def get_file(self, path, revision):
+            num_calls['get_file'] += 1
+            raise FileNotFoundError(path, revision)
+
+        num_calls = {
+            'get_file': 0,
+        }
+
+        self.scmtool_cls.get_file = get_file
+        self._set_missing_file_cache_period(60)
+
+        for i in range(2):
+            self.assertRaises(
+                FileNotFoundError,
+                lambda: self.repository.get_file('readme', HEAD))
+
+        self.assertEqual(num_calls['get_file'], 2)
+
+    def test_get_file_with_missing_file_and_no_period(self):
+        """Testing Repository.get_file with missing files and a missing
+        file cache period of 0
+        """
+        def get_file(self, path, revision):
+            num_calls['get_file'] += 1
+            raise FileNotFoundError(path, revision)
+
+        num_calls = {
+            'get_file': 0,
+        }
+
+        self.scmtool_cls.get_file = get_file
+        self._set_missing_file_cache_period(0)
+
+        for i in range(2):
+            self.assertRaises(
+                FileNotFoundError,
+                lambda: self.repository.get_file('readme', 'e965047'))
+
+        self.assertEqual(num_calls['get_file'], 2)
+
+    def test_get_file_exists_with_missing_file(self):
+        """Testing Repository.get_file_exists remembers missing files"""
+        def file_exists(self, path, revision):
+            checked.append((path, revision))
+            return False
+
+        checked = []
+        self.scmtool_cls.file_exists = file_exists
+        self.scmtool_cls.file_exists_many = \
+            six.get_unbound_function(SCMTool.file_exists_many)
+        self._set_missing_file_cache_period(60)
+
+        self.assertFalse(self.repository.get_file_exists('readme', 'abc123'))
+        self.assertFalse(self.repository.get_file_exists('readme', 'abc123'))
+        self.assertEqual(
+            self.repository.get_file_exists_many([('readme', 'abc123'),
+                                                  ('readme', 'def456')]),
+            [False, False])
+        self.assertEqual(
+            self.repository.get_file_exists_many([('readme', 'def456')]),
+            [False])
+
+        self.assertEqual(checked, [
+            ('readme', 'abc123'),
+            ('readme', 'def456'),
+        ])
+
+    def _set_missing_file_cache_period(self, period):
+        siteconfig = SiteConfiguration.objects.get_current()
+        old_period = siteconfig.get('repository_missing_file_cache_period')
+        siteconfig.set('repository_missing_file_cache_period', period)
+        siteconfig.save()
+
+        def _restore_period():
+            siteconfig.set('repository_missing_file_cache_period', old_period)
+            siteconfig.save()
+
+        self.addCleanup(_restore_period)
+
+    def _enable_file_cache(self):
+        cache_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+
+        siteconfig = SiteConfiguration.objects.get_current()
+        old_max_size = siteconfig.get('repository_file_cache_size')
+        siteconfig.set('repository_file_cache_path', cache_dir)
+        siteconfig.set('repository_file_cache_size', 1024 * 1024)
+        siteconfig.save()
+
+        def _disable_file_cache():
+            siteconfig.set('repository_file_cache_path', '')
+            siteconfig.set('repository_file_cache_size', old_max_size)
+            siteconfig.save()
+
+        self.addCleanup(_disable_file_cache)
+
+        return get_repository_file_cache()
+
+    def test_get_scmtool_caching(self):
+        """Testing Repository.get_scmtool caches tools"""
+        self.repository.save()
+
+        tool = self.repository.get_scmtool()
+        self.assertTrue(self.repository.get_scmtool() is tool)
+
+        repository = Repository.objects.get(pk=self.repository.pk)
+        self.assertTrue(repository.get_scmtool() is tool)
+
+    def test_get_scmtool_caching_unsaved(self):
+        """Testing Repository.get_scmtool doesn't cache tools for unsaved
+        repositories
+        """
+        self.assertFalse(self.repository.get_scmtool() is
+                         self.repository.get_scmtool())
+
+    def test_get_scmtool_caching_config_changed(self):
+        """Testing Repository.get_scmtool with changed configuration"""
+        self.repository.save()
+        tool = self.repository.get_scmtool()
+
+        repository = Repository.objects.get(pk=self.repository.pk)
+        repository.extra_data = {'foo': 'bar'}
+        self.assertFalse(repository.get_scmtool() is tool)
+
+    def test_get_scmtool_caching_on_save(self):
+        """Testing Repository.get_scmtool cache invalidation on save"""
+        self.repository.save()
+        tool = self.repository.get_scmtool()
+
+        self.repository.save()
+        self.assertFalse(self.repository.get_scmtool() is tool)
+
+    def test_get_scmtool_caching_threads(self):
+        """Testing Repository.get_scmtool caches tools for each thread"""
+        def _get_tool():
+            tools.append(self.repository.get_scmtool())
+
+        self.repository.save()
+        tools = []
+
+        thread = threading.Thread(target=_get_tool)
+        thread.start()
+        thread.join()
+
+        self.assertEqual(len(tools), 1)
+        self.assertFalse(self.repository.get_scmtool() is tools[0])
+
+    def test_get_scmtool_caching_max_size(self):
+        """Testing Repository.get_scmtool limits the number of cached tools"""
+        cache = SCMToolCache()
+        cache.MAX_SIZE = 2
+        self.repository.save()
+        repository1 = self.repository
+        repository2 = copy.copy(repository1)
+        repository2.pk = repository1.pk + 1
+        repository3 = copy.copy(repository1)
+        repository3.pk = repository1.pk + 2
+
+        tool1 = cache.get_tool(repository1, object)
+        tool2 = cache.get_tool(repository2, object)
+
+        # Use the first tool again, so that the second is evicted.
+        self.assertTrue(cache.get_tool(repository1, object) is tool1)
+        cache.get_tool(repository3, object)
+
+        self.assertTrue(cache.get_tool(repository1, object) is tool1)
+        self.assertFalse(cache.get_tool(repository2, object) is tool2)
+
+    def test_get_scmtool_caching_worker_threads(self):
+        """Testing Repository.get_scmtool doesn't evict other threads'
+        tools for tools created in worker threads
+        """
+        def _get_tool():
+            for i in range(3):
+                repository = copy.copy(self.repository)
+                repository.pk = self.repository.pk + i + 1
+                cache.get_tool(repository, object)
+
+        cache = SCMToolCache()
+        cache.MAX_SIZE = 2
+        self.repository.save()
+        tool = cache.get_tool(self.repository, object)
+
+        thread = threading.Thread(target=_get_tool)
+        thread.start()
+        thread.join()
+
+        self.assertTrue(cache.get_tool(self.repository, object) is tool)
+
+    def test_get_scmtool_caching_invalidate(self):
+        """Testing Repository.get_scmtool after invalidating tools in
+        another thread
+        """
+        def _invalidate():
+            cache.invalidate(self.repository.pk)
+
+        cache = SCMToolCache()
+        self.repository.save()
+        tool = cache.get_tool(self.repository, object)
+
+        thread = threading.Thread(target=_invalidate)
+        thread.start()
+        thread.join()
+
+        self.assertFalse(cache.get_tool(self.repository, object) is tool)
+
+
+class RepositoryFileCacheTests(DjangoTestCase):
+    """Unit tests for RepositoryFileCache."""
+
+    def setUp(self):
+        super(RepositoryFileCacheTests, self).setUp()
+
+        self.cache_dir = mkdtemp()
+        self.file_cache = RepositoryFileCache(self.cache_dir, 100)
+
+    def tearDown(self):
+        super(RepositoryFileCacheTests, self).tearDown()
+
+        shutil.rmtree(self.cache_dir)
+        cache.clear()
+
+    def test_get_file(self):
+        """Testing RepositoryFileCache.get_file"""
+        self.assertEqual(self.file_cache.get_file('key1'), None)
+
+        self.file_cache.set_file('key1', b'data')
+        self.file_cache.set_file('key2', b'')
+
+        self.assertEqual(self.file_cache.get_file('key1'), b'data')
+        self.assertEqual(self.file_cache.get_file('key2'), b'')
+
+        # Another cache using the same directory sees the same files.
+        other_cache = RepositoryFileCache(self.cache_dir, 100)
+        self.assertEqual(other_cache.get_file('key1'), b'data')
+
+        stats = self.file_cache.get_stats()
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hit_rate'], 75)
+        self.assertEqual(stats['num_files'], 2)
+        self.assertEqual(stats['size'], 4)
+
+    def test_set_file_with_same_contents(self):
+        """Testing RepositoryFileCache.set_file stores identical contents
+        once
+        """
+        self.file_cache.set_file('key1', b'data')
+        self.file_cache.set_file('key2', b'data')
+
+        self.assertEqual(self.file_cache.get_file('key2'), b'data')
+        self.assertEqual(self.file_cache.get_stats()['num_files'], 1)
+
+    def test_has_file(self):
+        """Testing RepositoryFileCache.has_file"""
+        self.assertFalse(self.file_cache.has_file('key1'))
+
+        self.file_cache.set_file_exists('key1')
+        self.file_cache.set_file('key2', b'data')
+
+        self.assertTrue(self.file_cache.has_file('key1'))
+        self.assertTrue(self.file_cache.has_file('key2'))
+
+        # Only the existence of the first file is known.
+        self.assertEqual(self.file_cache.get_file('key1'), None)
+
+        # Recording that a file exists doesn't replace its contents.
+        self.file_cache.set_file_exists('key2')
+        self.assertEqual(self.file_cache.get_file('key2'), b'data')
+
+        stats = self.file_cache.get_stats()
+        self.assertEqual(stats['exists_hits'], 2)
+        self.assertEqual(stats['exists_misses'], 1)
+
+    def test_prune(self):
+        """Testing RepositoryFileCache.prune removes least recently used
+        files
+        """
+        # Don't prune while the files are being stored.
+        self.file_cache.max_size = 1000
+        now = time.time()
+
+        for i in range(4):
+            key = 'key%d' % i
+            self.file_cache.set_file(key, (b'%d' % i) * 30)
+
+            # Give each file a distinct, increasing access time.
+            blob_path = self.file_cache._get_blob_path_for_key(key)
+            os.utime(blob_path, (now + i * 10, now + i * 10))
+            os.utime(self.file_cache._get_entry_path(key),
+                     (now + i * 10, now + i * 10))
+
+        # Use the first file, so that the second is least recently used.
+        blob_path = self.file_cache._get_blob_path_for_key('key0')
+        os.utime(blob_path, (now + 100, now + 100))
+        os.utime(self.file_cache._get_entry_path('key0'),
+                 (now + 100, now + 100))
+
+        self.file_cache.max_size = 100
+        self.file_cache.prune()
+
+        self.assertEqual(self.file_cache.get_file('key0'), b'0' * 30)
+        self.assertEqual(self.file_cache.get_file('key1'), None)
+        self.assertEqual(self.file_cache.get_file('key2'), b'2' * 30)
+        self.assertEqual(self.file_cache.get_file('key3'), b'3' * 30)
+
+        stats = self.file_cache.get_stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['size'], 90)
+
+    def test_set_file_prunes(self):
+        """Testing RepositoryFileCache.set_file keeps the cache within its
+        maximum size
+        """
+        for i in range(10):
+            self.file_cache.set_file('key%d' % i, (b'%d' % i) * 30)
+            self._wait_for_prune()
+
+        self.assertTrue(self.file_cache.get_stats()['size'] <= 100)
+
+    def test_prune_entries(self):
+        """Testing RepositoryFileCache.prune limits the number of entries"""
+        self.file_cache.MAX_ENTRIES = 10
+        now = time.time()
+
+        for i in range(20):
+            key = 'key%d' % i
+            self.file_cache.set_file_exists(key)
+            os.utime(self.file_cache._get_entry_path(key),
+                     (now + i * 10, now + i * 10))
+
+        self._wait_for_prune()
+        self.file_cache.prune()
+
+        self.assertFalse(self.file_cache.has_file('key10'))
+        self.assertTrue(self.file_cache.has_file('key11'))
+        self.assertTrue(self.file_cache.has_file('key19'))
+
+    def test_set_file_exists_prunes(self):
+        """Testing RepositoryFileCache.set_file_exists keeps the number of
+        entries within the maximum
+        """
+        self.file_cache.MAX_ENTRIES = 10
+
+        for i in range(30):
+            self.file_cache.set_file_exists('key%d' % i)
+            self._wait_for_prune()
+
+        num_entries = len(list(self.file_cache._iter_files(
+            self.file_cache._entries_dir)))
+        self.assertTrue(num_entries <= 10)
+
+    def test_set_file_with_errors(self):
+        """Testing RepositoryFileCache.set_file with an unwritable
+        directory
+        """
+        file_cache = RepositoryFileCache(
+            os.path.join(self.cache_dir, 'file', 'subdir'), 100)
+
+        with open(os.path.join(self.cache_dir, 'file'), 'w') as fp:
+            fp.write('')
+
+        file_cache.set_file('key1', b'data')
+        self.assertEqual(file_cache.get_file('key1'), None)
+
+    def test_get_repository_file_cache(self):
+        """Testing get_repository_file_cache"""
+        siteconfig = SiteConfiguration.objects.get_current()
+        old_max_size = siteconfig.get('repository_file_cache_size')
+        self.assertEqual(get_repository_file_cache(), None)
+
+        siteconfig.set('repository_file_cache_path', self.cache_dir)
+        siteconfig.set('repository_file_cache_size', 1000)
+
+        try:
+            file_cache = get_repository_file_cache()
+            self.assertEqual(file_cache.path, self.cache_dir)
+            self.assertEqual(file_cache.max_size, 1000)
+
+            siteconfig.set('repository_file_cache_size', 2000)
+            self.assertTrue(get_repository_file_cache() is file_cache)
+            self.assertEqual(file_cache.max_size, 2000)
+        finally:
+            siteconfig.set('repository_file_cache_path', '')
+            siteconfig.set('repository_file_cache_size', old_max_size)
+
+        self.assertEqual(get_repository_file_cache(), None)
+
+    def _wait_for_prune(self):
+        if self.file_cache._prune_thread is not None:
+            self.file_cache._prune_thread.join()
+
 
 class BZRTests(SCMTestCase):
     """Unit tests for bzr."""
@@ -960,6 +1634,20 @@ class PerforceTests(SCMTestCase):
         self.assertEqual(md5(file).hexdigest(),
                          '227bdd87b052fcad9369e65c7bf23fd0')
 
+    @online_only
+    def test_get_files(self):
+        """Testing PerforceTool.get_files"""
+        files = self.tool.get_files([
+            ('//depot/foo', PRE_CREATION),
+            ('//public/perforce/api/python/P4Client/p4.py', 1),
+            ('//public/perforce/api/python/P4Client/doesnotexist.py', 1),
+        ])
+        self.assertEqual(len(files), 3)
+        self.assertEqual(files[0], b'')
+        self.assertEqual(md5(files[1]).hexdigest(),
+                         '227bdd87b052fcad9369e65c7bf23fd0')
+        self.assertEqual(files[2], None)
+
     def test_empty_diff(self):
         """Testing Perforce empty diff parsing"""
         diff = b"==== //depot/foo/proj/README#2 ==M== /src/proj/README ====\n"
@@ -1090,6 +1778,130 @@ class PerforceTests(SCMTestCase):
         self.assertEqual(files[1].delete_count, 1)
 
 
+class FakeP4(object):
+    """A stand-in for a P4 connection object, for the pool tests."""
+    def __init__(self):
+        self.port = 'localhost:1666'
+        self.is_connected = True
+
+    def connected(self):
+        return self.is_connected
+
+    def disconnect(self):
+        self.is_connected = False
+
+
+class PerforceConnectionPoolTests(SCMTestCase):
+    """Unit tests for PerforceConnectionPool."""
+    def setUp(self):
+        super(PerforceConnectionPoolTests, self).setUp()
+
+        self.pool = PerforceConnectionPool()
+        self.num_connects = 0
+
+    def _connect(self):
+        self.num_connects += 1
+
+        return PerforceConnection(FakeP4())
+
+    def test_reuse(self):
+        """Testing PerforceConnectionPool reuses released connections"""
+        connection = self.pool.acquire('key', self._connect)
+        self.pool.release('key', connection)
+
+        self.assertTrue(self.pool.acquire('key', self._connect) is connection)
+        self.assertEqual(self.num_connects, 1)
+
+    def test_keys(self):
+        """Testing PerforceConnectionPool keeps connections for each key"""
+        connection = self.pool.acquire('key1', self._connect)
+        self.pool.release('key1', connection)
+
+        self.assertFalse(self.pool.acquire('key2', self._connect) is
+                         connection)
+        self.assertEqual(self.num_connects, 2)
+
+    def test_concurrent(self):
+        """Testing PerforceConnectionPool gives each user its own connection"""
+        connection1 = self.pool.acquire('key', self._connect)
+        connection2 = self.pool.acquire('key', self._connect)
+
+        self.assertFalse(connection1 is connection2)
+        self.assertEqual(self.num_connects, 2)
+
+    def test_disconnected(self):
+        """Testing PerforceConnectionPool with disconnected connections"""
+        connection = self.pool.acquire('key', self._connect)
+        self.pool.release('key', connection)
+        connection.p4.is_connected = False
+
+        self.assertFalse(self.pool.acquire('key', self._connect) is
+                         connection)
+        self.assertEqual(self.num_connects, 2)
+
+    def test_max_age(self):
+        """Testing PerforceConnectionPool closes connections past MAX_AGE"""
+        connection = self.pool.acquire('key', self._connect)
+        self.pool.release('key', connection)
+        connection.created -= self.pool.MAX_AGE
+
+        self.assertFalse(self.pool.acquire('key', self._connect) is
+                         connection)
+        self.assertFalse(connection.p4.connected())
+
+    def test_max_idle_time(self):
+        """Testing PerforceConnectionPool closes connections idle past
+        MAX_IDLE_TIME
+        """
+        connection = self.pool.acquire('key', self._connect)
+        self.pool.release('key', connection)
+        connection.last_used -= self.pool.MAX_IDLE_TIME
+
+        self.assertFalse(self.pool.acquire('key', self._connect) is
+                         connection)
+        self.assertFalse(connection.p4.connected())
+
+    def test_max_idle_connections(self):
+        """Testing PerforceConnectionPool limits the idle connections kept"""
+        connections = [
+            self.pool.acquire('key', self._connect)
+            for i in range(self.pool.MAX_IDLE_CONNECTIONS + 1)
+        ]
+
+        for connection in connections:
+            self.pool.release('key', connection)
+
+        self.assertFalse(connections[-1].p4.connected())
+        self.assertTrue(connections[0].p4.connected())
+
+    def test_close_all(self):
+        """Testing PerforceConnectionPool.close_all"""
+        connection = self.pool.acquire('key', self._connect)
+        self.pool.release('key', connection)
+        self.pool.close_all()
+
+        self.assertFalse(connection.p4.connected())
+        self.assertFalse(self.pool.acquire('key', self._connect) is
+                         connection)
+
+    def test_split_print_results(self):
+        """Testing PerforceClient._split_print_results"""
+        results = PerforceClient._split_print_results([
+            {'depotFile': '//depot/a', 'rev': '1'},
+            b'line 1\n',
+            b'line 2\n',
+            {'depotFile': '//depot/b', 'rev': '3'},
+            {'depotFile': '//depot/c', 'rev': '2'},
+            b'contents\n',
+        ])
+
+        self.assertEqual(results, [
+            ('//depot/a', b'line 1\nline 2\n'),
+            ('//depot/b', ''),
+            ('//depot/c', b'contents\n'),
+        ])
+
+
 class PerforceStunnelTests(SCMTestCase):
     """
     Unit tests for perforce running through stunnel.
@@ -1254,7 +2066,7 @@ class VMWareTests(SCMTestCase):
 #        self.assertEqual(changeset.branch, 'bfg-main')
 
 
-class MercurialTests(SCMTestCase):
+class MercurialTests(SpyAgency, SCMTestCase):
     """Unit tests for mercurial."""
     fixtures = ['test_scmtools']
 
@@ -1386,6 +2198,76 @@ class MercurialTests(SCMTestCase):
         self.assertRaises(FileNotFoundError,
                           lambda: self.tool.get_file('hello', PRE_CREATION))
 
+    def test_get_file_with_command_server(self):
+        """Testing HgTool.get_file with the hg command server"""
+        if not is_exe_in_path('hg'):
+            raise nose.SkipTest('hg is not installed')
+
+        self.tool.client.use_command_server = True
+        self.spy_on(HgCommandServer.run_command)
+
+        value = self.tool.get_file('doc/readme', Revision('661e5dd3c493'))
+        self.assertEqual(value, b'Hello\n\ngoodbye\n')
+        self.assertTrue(HgCommandServer.run_command.spy.called)
+
+        self.assertRaises(
+            FileNotFoundError,
+            lambda: self.tool.get_file('doc/readme2',
+                                       Revision('661e5dd3c493')))
+
+    def test_get_file_with_command_server_fallback(self):
+        """Testing HgTool.get_file falling back when the hg command server
+        can't be started
+        """
+        if not is_exe_in_path('hg'):
+            raise nose.SkipTest('hg is not installed')
+
+        def _start_process(*args, **kwargs):
+            raise OSError('Oh no')
+
+        self.tool.client.use_command_server = True
+        self.spy_on(HgCommandServer.start_process, call_fake=_start_process)
+
+        server = get_persistent_process(HgCommandServer,
+                                        self.tool.client.path, None)
+
+        try:
+            value = self.tool.get_file('doc/readme',
+                                       Revision('661e5dd3c493'))
+            self.assertEqual(value, b'Hello\n\ngoodbye\n')
+            self.assertFalse(server.is_available())
+        finally:
+            server.failed_at = None
+
+    def test_get_file_with_command_server_retry(self):
+        """Testing HgTool.get_file tries the hg command server again after
+        a failure
+        """
+        if not is_exe_in_path('hg'):
+            raise nose.SkipTest('hg is not installed')
+
+        self.tool.client.use_command_server = True
+        self.spy_on(HgCommandServer.run_command)
+
+        server = get_persistent_process(HgCommandServer,
+                                        self.tool.client.path, None)
+
+        try:
+            server.mark_unavailable()
+            self.tool.get_file('doc/readme', Revision('661e5dd3c493'))
+            self.assertFalse(HgCommandServer.run_command.spy.called)
+
+            server.failed_at -= server.RETRY_INTERVAL
+            self.assertTrue(server.is_available())
+
+            value = self.tool.get_file('doc/readme',
+                                       Revision('661e5dd3c493'))
+            self.assertEqual(value, b'Hello\n\ngoodbye\n')
+            self.assertTrue(HgCommandServer.run_command.spy.called)
+            self.assertEqual(server.failed_at, None)
+        finally:
+            server.failed_at = None
+
     def test_interface(self):
         """Testing basic HgTool API"""
         self.assertTrue(self.tool.get_diffs_use_absolute_paths())
@@ -1413,7 +2295,7 @@ class MercurialTests(SCMTestCase):
         self.assertTrue(not tool.file_exists('TODO.rstNotFound', rev))
 
 
-class GitTests(SCMTestCase):
+class GitTests(SpyAgency, SCMTestCase):
     """Unit tests for Git."""
     fixtures = ['test_scmtools']
 
@@ -1846,6 +2728,113 @@ class GitTests(SCMTestCase):
         self.assertRaises(FileNotFoundError,
                           lambda: self.tool.get_file("readme", "0000000"))
 
+    def test_get_file_with_cat_file_process(self):
+        """Testing GitTool.get_file and file_exists using the shared
+        git cat-file processes
+        """
+        self.spy_on(GitCatFileProcess.get_object)
+
+        self.assertEqual(self.tool.get_file('readme', 'e965047'), b'Hello\n')
+        self.assertTrue(self.tool.file_exists('readme', 'e965047'))
+        self.assertEqual(len(GitCatFileProcess.get_object.spy.calls), 2)
+
+        self.assertTrue(
+            get_git_cat_file_process(self.tool.client.git_dir) is
+            get_git_cat_file_process(self.tool.client.git_dir))
+
+    def test_get_files(self):
+        """Testing GitTool.get_files"""
+        self.spy_on(GitCatFileProcess.run_request)
+
+        self.assertEqual(
+            self.tool.get_files([
+                ('readme', PRE_CREATION),
+                ('readme', 'e965047'),
+                ('readme', 'd6613f5'),
+                ('readme', HEAD),
+                ('hello', '0000000'),
+            ]),
+            [b'', b'Hello\n', b'Hello there\n', b'Hello there\n', None])
+        self.assertEqual(len(GitCatFileProcess.run_request.spy.calls), 1)
+
+    def test_get_files_with_non_blob(self):
+        """Testing GitTool.get_files with objects that aren't blobs"""
+        self.assertRaises(
+            SCMError,
+            lambda: self.tool.get_files([('readme', 'e965047'),
+                                         ('readme', 'a62df6c')]))
+
+    def test_file_exists_many(self):
+        """Testing GitTool.file_exists_many"""
+        self.spy_on(GitCatFileProcess.run_request)
+
+        self.assertEqual(
+            self.tool.file_exists_many([
+                ('readme', 'e965047'),
+                ('readme', PRE_CREATION),
+                ('readme', 'fffffff'),
+                ('readme', 'a62df6c'),
+                ('readme', 'd6613f5'),
+            ]),
+            [True, False, False, False, True])
+        self.assertEqual(len(GitCatFileProcess.run_request.spy.calls), 1)
+
+    def test_cat_file_process(self):
+        """Testing GitCatFileProcess.get_object"""
+        git_dir = self.tool.client.git_dir
+        process = GitCatFileProcess(git_dir)
+        check_process = GitCatFileProcess(git_dir, check_only=True)
+
+        try:
+            self.assertEqual(process.get_object('e965047'),
+                             ('blob', b'Hello\n'))
+            self.assertEqual(process.get_object('d6613f5'),
+                             ('blob', b'Hello there\n'))
+            self.assertEqual(process.get_object('0000000'), None)
+            self.assertEqual(process.get_object('HEAD:missing file'), None)
+
+            self.assertEqual(check_process.get_object('e965047'),
+                             ('blob', None))
+            self.assertEqual(check_process.get_object('a62df6c')[0],
+                             'commit')
+            self.assertEqual(check_process.get_object('0000000'), None)
+        finally:
+            process.close()
+            check_process.close()
+
+    def test_cat_file_process_restart(self):
+        """Testing GitCatFileProcess restarts after the process exits"""
+        process = GitCatFileProcess(self.tool.client.git_dir)
+
+        try:
+            self.assertEqual(process.get_object('e965047'),
+                             ('blob', b'Hello\n'))
+
+            process.process.kill()
+            process.process.wait()
+
+            self.assertEqual(process.get_object('e965047'),
+                             ('blob', b'Hello\n'))
+        finally:
+            process.close()
+
+    def test_cat_file_process_idle_timeout(self):
+        """Testing GitCatFileProcess shuts down when idle"""
+        process = GitCatFileProcess(self.tool.client.git_dir)
+        process.IDLE_TIMEOUT = 0.1
+
+        try:
+            process.get_object('e965047')
+            self.assertNotEqual(process.process, None)
+
+            time.sleep(0.5)
+            self.assertEqual(process.process, None)
+
+            self.assertEqual(process.get_object('e965047'),
+                             ('blob', b'Hello\n'))
+        finally:
+            process.close()
+
     def test_parse_diff_revision_with_remote_and_short_SHA1_error(self):
         """Testing GitTool.parse_diff_revision with remote files and short SHA1 error"""
         self.assertRaises(
@@ -1859,6 +2848,168 @@ class GitTests(SCMTestCase):
             lambda: self.remote_tool.get_file('README', 'd7e96b3'))
 
 
+class KeepAliveHTTPTests(DjangoTestCase):
+    """Unit tests for pooled HTTP connections in http_pool."""
+
+    def setUp(self):
+        super(KeepAliveHTTPTests, self).setUp()
+
+        connections = []
+        posts = []
+
+        class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+                connections.append(self.connection)
+
+            def do_GET(self):
+                if self.path == '/missing':
+                    self._send(404, b'Not found')
+                elif self.path == '/gzip':
+                    if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                        buf = six.BytesIO()
+
+                        with gzip.GzipFile(fileobj=buf, mode='wb') as fp:
+                            fp.write(b'compressed data')
+
+                        self._send(200, buf.getvalue(),
+                                   {'Content-Encoding': 'gzip'})
+                    else:
+                        self._send(200, b'uncompressed data')
+                else:
+                    self._send(200, b'data for %s' % self.path.encode('utf-8'))
+
+            def do_POST(self):
+                data = self.rfile.read(int(self.headers['Content-Length']))
+                posts.append(data)
+                self._send(201, b'created')
+
+            def log_message(self, *args, **kwargs):
+                pass
+
+            def _send(self, code, data, headers={}):
+                self.send_response(code)
+                self.send_header('Content-Length', '%d' % len(data))
+
+                for name, value in six.iteritems(headers):
+                    self.send_header(name, value)
+
+                self.end_headers()
+                self.wfile.write(data)
+
+        class HTTPServer(socketserver.ThreadingMixIn,
+                         BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+
+        self.connections = connections
+        self.posts = posts
+        self.server = HTTPServer(('127.0.0.1', 0), RequestHandler)
+        self.url = 'http://127.0.0.1:%d' % self.server.server_port
+
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        super(KeepAliveHTTPTests, self).tearDown()
+
+        _connection_pool.close_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_urlopen_reuses_connections(self):
+        """Testing http_pool.urlopen reuses connections"""
+        for i in range(3):
+            u = urlopen(URLRequest('%s/file%d' % (self.url, i)))
+            self.assertEqual(u.read(), b'data for /file%d' % i)
+            self.assertEqual(u.code, 200)
+
+        self.assertEqual(len(self.connections), 1)
+
+    def test_urlopen_with_http_error(self):
+        """Testing http_pool.urlopen with HTTP errors"""
+        with self.assertRaises(HTTPError) as cm:
+            urlopen(URLRequest('%s/missing' % self.url))
+
+        self.assertEqual(cm.exception.code, 404)
+        self.assertEqual(cm.exception.read(), b'Not found')
+
+        # The connection is still reused after the error.
+        u = urlopen(URLRequest('%s/file' % self.url))
+        self.assertEqual(u.read(), b'data for /file')
+        self.assertEqual(len(self.connections), 1)
+
+    def test_urlopen_with_gzip(self):
+        """Testing http_pool.urlopen with gzip-encoded responses"""
+        u = urlopen(URLRequest('%s/gzip' % self.url))
+
+        self.assertEqual(u.read(), b'compressed data')
+        self.assertEqual(u.info().get('Content-Encoding'), None)
+        self.assertEqual(u.info().get('Content-Length'), '15')
+
+    def test_urlopen_with_closed_connection(self):
+        """Testing http_pool.urlopen with a pooled connection closed by the
+        server
+        """
+        urlopen(URLRequest('%s/file1' % self.url)).read()
+        self.assertEqual(len(self.connections), 1)
+
+        self.connections[0].shutdown(2)
+
+        u = urlopen(URLRequest('%s/file2' % self.url))
+        self.assertEqual(u.read(), b'data for /file2')
+        self.assertEqual(len(self.connections), 2)
+
+    def test_urlopen_post_uses_new_connection(self):
+        """Testing http_pool.urlopen doesn't send POST requests over pooled
+        connections
+        """
+        urlopen(URLRequest('%s/file1' % self.url)).read()
+        self.assertEqual(len(self.connections), 1)
+
+        u = urlopen(URLRequest('%s/create' % self.url, b'payload'))
+        self.assertEqual(u.read(), b'created')
+        self.assertEqual(self.posts, [b'payload'])
+        self.assertEqual(len(self.connections), 2)
+
+    def test_connection_pool_idle_timeout(self):
+        """Testing HTTPConnectionPool doesn't reuse idle connections"""
+        class FakeConnection(object):
+            closed = False
+
+            def close(self):
+                self.closed = True
+
+        pool = HTTPConnectionPool()
+        conn = FakeConnection()
+        pool.release('key', conn)
+        self.assertTrue(pool.acquire('key') is conn)
+
+        pool.release('key', conn)
+        pool._idle['key'] = [(conn, time.time() - pool.IDLE_TIMEOUT - 1)]
+        self.assertEqual(pool.acquire('key'), None)
+        self.assertTrue(conn.closed)
+
+    def test_connection_pool_max_idle(self):
+        """Testing HTTPConnectionPool limits the number of idle connections"""
+        class FakeConnection(object):
+            closed = False
+
+            def close(self):
+                self.closed = True
+
+        pool = HTTPConnectionPool()
+        conns = [FakeConnection() for i in range(pool.MAX_IDLE_PER_HOST + 1)]
+
+        for conn in conns:
+            pool.release('key', conn)
+
+        self.assertEqual(len(pool._idle['key']), pool.MAX_IDLE_PER_HOST)
+        self.assertTrue(conns[-1].closed)
+
+
 class PolicyTests(DjangoTestCase):
     fixtures = ['test_scmtools']
 
@@ -2414,3 +3565,113 @@ class RepositoryFormTests(DjangoTestCase):
 
         form = RepositoryForm(instance=repository)
         self.assertTrue(form._get_field_data('bug_tracker_use_hosting'))
+
+    def test_with_diff_compat_version(self):
+        """Testing RepositoryForm with a diff algorithm"""
+        form = RepositoryForm({
+            'name': 'test',
+            'hosting_type': 'test',
+            'hosting_account_username': 'testuser',
+            'hosting_account_password': 'testpass',
+            'tool': self.git_tool_id,
+            'test_repo_name': 'testrepo',
+            'bug_tracker_type': 'none',
+            'diff_compat_version': DiffCompatVersion.PATIENCE,
+        })
+
+        self.assertTrue(form.is_valid())
+
+        repository = form.save()
+        self.assertEqual(repository.extra_data['diff_compat_version'],
+                         DiffCompatVersion.PATIENCE)
+
+        form = RepositoryForm(instance=repository)
+        self.assertEqual(form.fields['diff_compat_version'].initial,
+                         DiffCompatVersion.PATIENCE)
+
+    def test_with_default_diff_compat_version(self):
+        """Testing RepositoryForm with the site's default diff algorithm"""
+        form = RepositoryForm({
+            'name': 'test',
+            'hosting_type': 'test',
+            'hosting_account_username': 'testuser',
+            'hosting_account_password': 'testpass',
+            'tool': self.git_tool_id,
+            'test_repo_name': 'testrepo',
+            'bug_tracker_type': 'none',
+            'diff_compat_version': '',
+        })
+
+        self.assertTrue(form.is_valid())
+
+        repository = form.save()
+        self.assertFalse('diff_compat_version' in repository.extra_data)
+
+    def test_with_default_diff_compat_version_removes_override(self):
+        """Testing RepositoryForm with the site's default diff algorithm
+        removes a previously chosen algorithm
+        """
+        data = {
+            'name': 'test',
+            'hosting_type': 'test',
+            'hosting_account_username': 'testuser',
+            'hosting_account_password': 'testpass',
+            'tool': self.git_tool_id,
+            'test_repo_name': 'testrepo',
+            'bug_tracker_type': 'none',
+            'diff_compat_version': DiffCompatVersion.PATIENCE,
+        }
+        form = RepositoryForm(data)
+        self.assertTrue(form.is_valid())
+        repository = form.save()
+        self.assertEqual(repository.extra_data['diff_compat_version'],
+                         DiffCompatVersion.PATIENCE)
+
+        data['diff_compat_version'] = ''
+        data['hosting_account'] = repository.hosting_account.pk
+        form = RepositoryForm(data, instance=repository)
+        self.assertTrue(form.is_valid())
+        repository = form.save()
+        self.assertFalse('diff_compat_version' in repository.extra_data)
+
+    def test_with_max_concurrent_file_requests(self):
+        """Testing RepositoryForm with a number of concurrent file requests"""
+        form = RepositoryForm({
+            'name': 'test',
+            'hosting_type': 'test',
+            'hosting_account_username': 'testuser',
+            'hosting_account_password': 'testpass',
+            'tool': self.git_tool_id,
+            'test_repo_name': 'testrepo',
+            'bug_tracker_type': 'none',
+            'max_concurrent_file_requests': '4',
+        })
+
+        self.assertTrue(form.is_valid())
+
+        repository = form.save()
+        self.assertEqual(repository.extra_data['max_concurrent_file_requests'],
+                         4)
+        self.assertEqual(repository.get_max_concurrent_file_requests(), 4)
+
+        form = RepositoryForm(instance=repository)
+        self.assertEqual(form.fields['max_concurrent_file_requests'].initial,
+                         4)
+
+    def test_with_invalid_max_concurrent_file_requests(self):
+        """Testing RepositoryForm with an invalid number of concurrent file
+        requests
+        """
+        form = RepositoryForm({
+            'name': 'test',
+            'hosting_type': 'test',
+            'hosting_account_username': 'testuser',
+            'hosting_account_password': 'testpass',
+            'tool': self.git_tool_id,
+            'test_repo_name': 'testrepo',
+            'bug_tracker_type': 'none',
+            'max_concurrent_file_requests': '0',
+        })
+
+        self.assertFalse(form.is_valid())
+        self.assertTrue('max_concurrent_file_requests' in form.errors)
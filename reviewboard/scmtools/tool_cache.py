@@ -0,0 +1,116 @@
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+
+class SCMToolCache(object):
+    """A cache of SCMTool instances for repositories.
+
+    Creating an SCMTool can be expensive. Some tools set up clients,
+    authentication and sessions with the repository when they're created,
+    which would otherwise be done again for every file in a diff.
+
+    Tools are cached by repository ID and a fingerprint of the repository's
+    configuration, so a tool is never reused once the repository has been
+    changed.
+
+    SCMTools and their clients aren't generally safe to use from several
+    threads at once, so each thread keeps its own tools, and at most
+    MAX_SIZE of them, discarding the least recently used. A thread's tools
+    are released when the thread exits, so short-lived worker threads
+    (such as those used to generate diff chunks concurrently) don't push
+    out the tools of long-lived request threads, or keep their own tools
+    alive after they're gone.
+
+    Invalidating a repository (or clearing the cache) affects every
+    thread. Each thread discards its outdated tools for a repository the
+    next time it asks for one.
+    """
+    MAX_SIZE = 20
+
+    def __init__(self):
+        self._local = threading.local()
+        self._generations = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get_tool(self, repository, create_func):
+        """Returns the cached SCMTool for a repository.
+
+        If there's no tool cached in this thread for the repository's
+        current configuration, create_func is called to create a new one.
+        Repositories that haven't been saved aren't cached.
+        """
+        if repository.pk is None:
+            return create_func()
+
+        tools = self._get_thread_tools()
+        key = (repository.pk, self.get_fingerprint(repository),
+               self._generations.get(repository.pk, 0), self._generation)
+        tool = tools.pop(key, None)
+
+        if tool is None:
+            # Any other tools for this repository are out of date.
+            for old_key in list(tools.keys()):
+                if old_key[0] == repository.pk:
+                    del tools[old_key]
+
+            tool = create_func()
+
+        # Add the tool at the end, marking it as recently used.
+        tools[key] = tool
+
+        while len(tools) > self.MAX_SIZE:
+            tools.popitem(last=False)
+
+        return tool
+
+    def invalidate(self, repository_id):
+        """Discards all cached tools for the given repository ID."""
+        with self._lock:
+            self._generations[repository_id] = \
+                self._generations.get(repository_id, 0) + 1
+
+    def clear(self):
+        """Discards all cached tools."""
+        with self._lock:
+            self._generation += 1
+
+        self._get_thread_tools().clear()
+
+    def _get_thread_tools(self):
+        """Returns the cached tools for the current thread."""
+        try:
+            return self._local.tools
+        except AttributeError:
+            self._local.tools = OrderedDict()
+
+            return self._local.tools
+
+    @staticmethod
+    def get_fingerprint(repository):
+        """Returns a fingerprint of a repository's configuration.
+
+        This covers all the repository fields that SCMTools are created
+        from.
+        """
+        data = json.dumps([
+            repository.tool_id,
+            repository.path,
+            repository.mirror_path,
+            repository.raw_file_url,
+            repository.username,
+            repository.password,
+            repository.encoding,
+            repository.extra_data,
+            repository.hosting_account_id,
+            repository.local_site_id,
+        ], sort_keys=True)
+
+        return hashlib.md5(data.encode('utf-8')).hexdigest()
+
+
+scmtool_cache = SCMToolCache()
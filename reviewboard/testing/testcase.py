@@ -23,6 +23,7 @@ from reviewboard.reviews.models import (Comment, FileAttachmentComment,
                                         ReviewRequestDraft, Screenshot,
                                         ScreenshotComment)
 from reviewboard.scmtools.models import Repository, Tool
+from reviewboard.scmtools.tool_cache import scmtool_cache
 from reviewboard.site.models import LocalSite
 
 
@@ -47,8 +48,9 @@ class TestCase(DjbletsTestCase):
     def setUp(self):
         super(TestCase, self).setUp()
 
-        # Clear the cache so that previous tests don't impact this one.
+        # Clear the caches so that previous tests don't impact this one.
         cache.clear()
+        scmtool_cache.clear()
 
     def shortDescription(self):
         """Returns the description of the current test.